@@ -11,6 +11,7 @@ from redis.exceptions import (
 )
 from app.services.logger import get_logger
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 from config import Settings
 
 # 从环境变量获取Redis连接信息
@@ -19,19 +20,32 @@ REDIS_PORT = int(Settings.REDIS_PORT)
 REDIS_PASSWORD = Settings.REDIS_PASSWORD
 # 使用 0 库
 REDIS_DB = 0
+# 任务队列相关数据使用 1 库
+REDIS_TASK_DB = 1
 
 
-def get_redis_client() -> Redis:
+def get_redis_client(db: int = REDIS_DB) -> Redis:
     """获取Redis客户端连接"""
     return Redis(
         host=REDIS_HOST,
         port=REDIS_PORT,
         password=REDIS_PASSWORD,
-        db=REDIS_DB,
+        db=db,
         decode_responses=True,  # 自动将字节解码为字符串
     )
 
 
+def get_async_redis_client(db: int = REDIS_DB) -> AsyncRedis:
+    """获取异步Redis客户端连接，用于 BLMOVE 等阻塞命令，避免阻塞事件循环"""
+    return AsyncRedis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        db=db,
+        decode_responses=True,
+    )
+
+
 import time
 import random
 
@@ -12,6 +12,7 @@ class Task(Base):
     platform = Column(String(20), nullable=False, default='', comment='平台-rpa,miaobi')
     status = Column(String(20), nullable=False, default='pending', comment='任务状态 pending:待处理, processing:处理中, completed:已完成, failed:失败')
     dimensions = Column(String(30), nullable=False, default='all', comment='提取维度all-全部， vision-视觉，audio-音频，content-内容语义，business-商业价值')
+    priority = Column(String(10), nullable=False, default='normal', comment='优先级 high:交互, normal:普通, low:批量')
     message = Column(JSON, nullable=True, comment='附加信息')
     tags = Column(JSON, nullable=True, comment='视频标签')
     created_at = Column(DateTime, nullable=False, default=func.current_timestamp(), comment='创建时间')
@@ -1,6 +1,8 @@
 import os
+import json
+import hashlib
 from jinja2 import Environment, FileSystemLoader, Template
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 from app.services.logger import get_logger
 from config import Settings
 
@@ -12,6 +14,9 @@ logger = get_logger()
 通过 jinja2 实现
 """
 class PromptManager:
+    # 多维度合并生成的模板，按维度引入各维度模板
+    COMBINED_TEMPLATE = "prompt-v3-combined.jinja"
+
     def __init__(self, prompt_dir=None):
         if prompt_dir is None:
             # 获取当前文件所在目录的上一级目录-prompts
@@ -31,6 +36,12 @@ class PromptManager:
             lstrip_blocks=True
         )
         self.templates: Dict[str, Template] = {}
+        # 渲染结果缓存：(模板名, 参数) -> (模板修改时间, 渲染结果)，模板文件修改后自动失效
+        self._rendered: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        # 模板版本缓存：模板名 -> (模板修改时间, 版本号)
+        self._versions: Dict[str, Tuple[float, str]] = {}
+        # 输出结构缓存：模板名 -> (结构文件修改时间, {"version", "schema"})
+        self._schemas: Dict[str, Tuple[float, Optional[dict]]] = {}
         self._preload_templates()
 
     def _preload_templates(self):
@@ -43,13 +54,8 @@ class PromptManager:
                     # 只存储路径，实际使用时再加载模板
                     self.templates[template_path] = None
 
-    def get_prompt(self, template_name: str, **kwargs) -> str:
-        """
-        获取渲染后的提示词
-        :param template_name: 模板文件名（不带后缀或带.jinja后缀均可）
-        :param kwargs: 模板参数
-        :return: 渲染后的提示词文本
-        """
+    def _resolve_template_name(self, template_name: str) -> str:
+        """校验维度名称并转换为模板文件名"""
         # 确保 template_name 有效
         if template_name not in Settings.VIDEO_DIMENSIONS:
             logger.info(f"【prompt-manager】- 提示词非法{template_name}")
@@ -58,12 +64,110 @@ class PromptManager:
         if not template_name.endswith('.jinja'):
             # prompt-v3-前缀
             template_name = f"prompt-v3-{template_name}.jinja"
+        return template_name
+
+    def get_prompt_version(self, template_name: str) -> str:
+        """
+        获取提示词模板版本
+        版本为模板源文件内容与输出结构版本的哈希，模板或输出结构修改后版本随之变化，用于区分不同模板产生的结果缓存
+        :param template_name: 模板名称（同 get_prompt）
+        :return: 版本号（12位十六进制）
+        """
+        template_name = self._resolve_template_name(template_name)
+        mtime = max(self._get_mtime(template_name), self._get_mtime(self._schema_name(template_name)))
+        cached = self._versions.get(template_name)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        source, _, _ = self.env.loader.get_source(self.env, template_name)
+        schema = self._load_schema(template_name)
+        if schema:
+            source += f"\nschema_version:{schema.get('version')}"
+        version = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+        self._versions[template_name] = (mtime, version)
+        return version
+
+    @staticmethod
+    def _schema_name(template_name: str) -> str:
+        """模板对应的输出结构文件名，如 prompt-v3-vision.schema.json"""
+        return template_name[:-len(".jinja")] + ".schema.json"
+
+    def get_response_schema(self, template_name: str) -> Optional[dict]:
+        """
+        获取维度模板对应的输出结构（与模板同目录的 *.schema.json）
+        :param template_name: 模板名称（同 get_prompt）
+        :return: {"version": 结构版本, "schema": JSON Schema}，没有结构文件时返回 None
+        """
+        return self._load_schema(self._resolve_template_name(template_name))
+
+    def _load_schema(self, template_name: str) -> Optional[dict]:
+        """按已解析的模板文件名（如 prompt-v3-vision.jinja）加载输出结构，按文件修改时间缓存"""
+        schema_name = self._schema_name(template_name)
+        mtime = self._get_mtime(schema_name)
+        cached = self._schemas.get(template_name)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        schema = None
+        if mtime:
+            try:
+                with open(os.path.join(self.env.loader.searchpath[0], schema_name), "r", encoding="utf-8") as f:
+                    schema = json.load(f)
+            except Exception as e:
+                logger.error(f"【prompt-manager】- 输出结构加载错误: {schema_name}, 错误: {str(e)}")
+                raise Exception(f"输出结构加载错误: {schema_name}, 错误: {str(e)}")
+        self._schemas[template_name] = (mtime, schema)
+        return schema
+
+    def _get_mtime(self, template_name: str) -> float:
+        """模板文件的修改时间，文件不存在时返回 0（由模板加载时报错）"""
+        try:
+            return os.path.getmtime(os.path.join(self.env.loader.searchpath[0], template_name))
+        except OSError:
+            return 0
+
+    def get_prompt(self, template_name: str, **kwargs) -> str:
+        """
+        获取渲染后的提示词
+        :param template_name: 模板文件名（不带后缀或带.jinja后缀均可）
+        :param kwargs: 模板参数
+        :return: 渲染后的提示词文本
+        """
+        template_name = self._resolve_template_name(template_name)
+        cache_key = (template_name, json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str))
+        mtime = self._get_mtime(template_name)
+        cached = self._rendered.get(cache_key)
+        if cached and cached[0] == mtime:
+            return cached[1]
         try:
             template = self.env.get_template(template_name)
-            return template.render(**kwargs)
+            rendered = template.render(**kwargs)
+            self._rendered[cache_key] = (mtime, rendered)
+            return rendered
         except Exception as e:
             logger.error(f"【prompt-manager】- 提示词加载错误: {template_name}, 错误: {str(e)}")
             raise Exception(f"提示词加载错误: {template_name}, 错误: {str(e)}")
 
+    def get_combined_prompt(self, dimensions: List[str]) -> str:
+        """
+        获取多维度合并生成的提示词，一次请求生成全部维度的标签
+        :param dimensions: 维度列表，输出 JSON 的键与之一一对应
+        :return: 渲染后的提示词文本
+        """
+        dimensions = list(dimensions)
+        template_names = [self.COMBINED_TEMPLATE] + [self._resolve_template_name(dim) for dim in dimensions]
+        cache_key = (self.COMBINED_TEMPLATE, json.dumps(dimensions, ensure_ascii=False))
+        # 合并模板或任一维度模板修改后重新渲染
+        mtime = max(self._get_mtime(name) for name in template_names)
+        cached = self._rendered.get(cache_key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            template = self.env.get_template(self.COMBINED_TEMPLATE)
+            rendered = template.render(dimensions=dimensions)
+            self._rendered[cache_key] = (mtime, rendered)
+            return rendered
+        except Exception as e:
+            logger.error(f"【prompt-manager】- 合并提示词加载错误: {dimensions}, 错误: {str(e)}")
+            raise Exception(f"合并提示词加载错误: {dimensions}, 错误: {str(e)}")
+
 # 单例实例
 prompt_manager = PromptManager()
\ No newline at end of file
@@ -0,0 +1,91 @@
+from fastapi import APIRouter
+from app.config.data_dict import BaseResponse
+from app.services.task_queue import QUEUE_PLATFORMS, get_task_queue
+from app.services.tag_cache import TagResultCache
+from app.services.file_cache import GeminiFileCache
+from app.services.context_cache import GeminiContextCache
+from app.services.google_vision import GoogleVisionService
+from app.services.json_guard import JsonGuard
+from app.services.file_activation import FileActivationEstimator
+from app.services.account_pool import AccountPool
+from app.services.rate_limiter import RateLimiter
+from app.services.logger import get_logger
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+logger = get_logger()
+
+
+@router.get("/queue", response_model=BaseResponse[dict])
+async def queue_stats():
+    """任务队列统计：队列积压、待确认任务数以及每个消费者的待确认任务数"""
+    try:
+        data = {
+            platform: get_task_queue(platform, consumer_id="metrics").stats()
+            for platform in QUEUE_PLATFORMS
+        }
+        return BaseResponse[dict](status="success", message="success", data=data)
+    except Exception as e:
+        logger.error(f"获取任务队列统计失败: {str(e)}")
+        return BaseResponse[dict](status="error", message="获取任务队列统计失败")
+
+
+@router.get("/cache", response_model=BaseResponse[dict])
+async def cache_stats():
+    """缓存统计：标签结果缓存各维度的命中率，谷歌文件复用的命中率"""
+    try:
+        data = {
+            "tags": TagResultCache.report(),
+            "files": GeminiFileCache.report(),
+        }
+        return BaseResponse[dict](status="success", message="success", data=data)
+    except Exception as e:
+        logger.error(f"获取缓存统计失败: {str(e)}")
+        return BaseResponse[dict](status="error", message="获取缓存统计失败")
+
+
+@router.get("/activation", response_model=BaseResponse[dict])
+async def activation_stats():
+    """上传文件激活耗时统计：按文件大小分桶的耗时直方图"""
+    try:
+        data = FileActivationEstimator.report()
+        return BaseResponse[dict](status="success", message="success", data=data)
+    except Exception as e:
+        logger.error(f"获取文件激活统计失败: {str(e)}")
+        return BaseResponse[dict](status="error", message="获取文件激活统计失败")
+
+
+@router.get("/accounts", response_model=BaseResponse[dict])
+async def account_stats():
+    """账号池统计：各账号的当日用量、当前分钟用量、状态与冷却剩余时间"""
+    try:
+        data = {"accounts": AccountPool().stats()}
+        return BaseResponse[dict](status="success", message="success", data=data)
+    except Exception as e:
+        logger.error(f"获取账号池统计失败: {str(e)}")
+        return BaseResponse[dict](status="error", message="获取账号池统计失败")
+
+
+@router.get("/generation", response_model=BaseResponse[dict])
+async def generation_stats():
+    """生成请求统计：使用与不使用上下文缓存时的平均 token 用量与耗时，上下文缓存的创建次数，输出校验与丢弃比例"""
+    try:
+        data = {
+            "usage": GoogleVisionService.usage_report(),
+            "context_cache": GeminiContextCache.report(),
+            "json_guard": JsonGuard.report(),
+        }
+        return BaseResponse[dict](status="success", message="success", data=data)
+    except Exception as e:
+        logger.error(f"获取生成请求统计失败: {str(e)}")
+        return BaseResponse[dict](status="error", message="获取生成请求统计失败")
+
+
+@router.get("/rate_limit", response_model=BaseResponse[dict])
+async def rate_limit_stats():
+    """限流统计：预占与等待次数、等待超时次数、按实际用量结算的 token 数、等待时间与排队等待时间直方图、当前排队情况"""
+    try:
+        data = RateLimiter.report()
+        return BaseResponse[dict](status="success", message="success", data=data)
+    except Exception as e:
+        logger.error(f"获取限流统计失败: {str(e)}")
+        return BaseResponse[dict](status="error", message="获取限流统计失败")
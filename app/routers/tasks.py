@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, HttpUrl
 from enum import Enum
+from typing import Optional, Union
 from app.config.data_dict import BaseResponse
 from app.services.video_service import VideoService
 from app.services.logger import get_logger
@@ -30,11 +31,23 @@ class Dimension(str, Enum):
     ALL = "all"
 
 
+class Priority(str, Enum):
+    # 用户在界面上等待结果的交互任务
+    HIGH = "high"
+    NORMAL = "normal"
+    # 可延后处理的批量任务，交互任务等待过久时自动限流
+    LOW = "low"
+
+
 # 请求模型
 class TaskCreateRequest(BaseModel):
     url: HttpUrl
     platform: Platform
     dimensions: Dimension
+    # 提交任务的用户，fair 模式按用户公平调度
+    uid: Optional[Union[str, int]] = None
+    # 未指定时按平台确定：user-high，files-normal，rpa-low
+    priority: Optional[Priority] = None
 
 
 router = APIRouter(prefix="/task", tags=["Video"])
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from app.config.data_dict import VideoRequest, BaseResponse
-from app.services.google_vision import GoogleVisionService, GoogleTagGenerationError
+from app.services.google_vision import AsyncGoogleVisionService, GoogleTagGenerationError
 from app.services.video_service import VideoService
+from app.services.account_pool import AccountPool
 from app.services.logger import get_logger
 from config import Settings
 from functools import wraps
@@ -12,6 +15,8 @@ import time
 
 router = APIRouter(prefix="/vision_to_tag", tags=["Video"])
 logger = get_logger()
+# Google API 账号池
+account_pool = AccountPool()
 
 def handle_google_errors(func):
     """处理Google服务相关的异常装饰器"""
@@ -40,6 +45,75 @@ def handle_google_errors(func):
             )
     return wrapper
 
+def _ndjson(data: dict) -> str:
+    """NDJSON 的一行"""
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+class CleanupStreamingResponse(StreamingResponse):
+    """
+    流式响应结束后执行清理：正常结束、客户端断开或发送失败时都会执行
+    （StreamingResponse 的 background 在客户端断开导致发送失败时不会执行，生成器未开始迭代时其 finally 也不会执行）
+    """
+
+    def __init__(self, content, cleanup: BackgroundTask, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.cleanup()
+
+
+async def cleanup_video_files(vision_service: AsyncGoogleVisionService, google_file,
+                              video_path: str, uploaded: bool = True):
+    """清理谷歌文件（uploaded 为 True 时）与本地文件"""
+    try:
+        if uploaded:
+            await vision_service.delete_google_file(google_file=google_file)
+    except Exception as e:
+        logger.error(f"【video-router】- 清理谷歌文件失败: {str(e)}")
+    VideoService.delete_local_file(file_path=video_path)
+
+
+async def stream_video_tags(task_id: str, vision_service: AsyncGoogleVisionService,
+                            google_file, dimension_list: list):
+    """
+    逐维度流式生成标签，按 NDJSON 逐行返回：
+    - {"type": "partial", "dimension", "field", "data"}：维度输出中的一个顶层字段已完成
+    - {"type": "dimension", "dimension", "status", "data"|"message"}：维度的最终结果，以此为准
+    - {"type": "done", "task_id"}：全部维度处理结束
+    流式输出结构不合法而中止的维度按普通方式重新生成；文件清理由 CleanupStreamingResponse 负责
+    """
+    for dim in dimension_list:
+        dim_start = time.time()
+        try:
+            async for event, payload in vision_service.stream_tag(google_file, dim):
+                if event == "section":
+                    field, value = payload
+                    yield _ndjson({"type": "partial", "dimension": dim, "field": field, "data": value})
+                else:
+                    yield _ndjson({"type": "dimension", "dimension": dim, "status": "success", "data": payload})
+        except Exception as e:
+            logger.warning(f"【video-router】- {dim} 维度流式生成中止，重新生成: {str(e)}")
+            try:
+                response = await vision_service.generate_tag(google_file, dim, stream=False)
+                yield _ndjson({
+                    "type": "dimension", "dimension": dim, "status": "success",
+                    "data": json.loads(response.strip()),
+                })
+            except Exception as retry_error:
+                yield _ndjson({
+                    "type": "dimension", "dimension": dim, "status": "failed",
+                    "message": str(retry_error),
+                })
+        dim_time = round(time.time() - dim_start, 3)
+        logger.info(f"【video-router】- {dim} 维度流式处理完成，耗时={dim_time}秒")
+    yield _ndjson({"type": "done", "task_id": task_id})
+
+
 # 单接口无状态同步版
 @router.post("/google", response_model=BaseResponse[dict])
 @handle_google_errors
@@ -111,22 +185,57 @@ async def generate_video_tags(request: Request):
 
         # 调用 Google 服务生成标签
         google_file = None
+        vision_service = None
+        streaming = False
+        inline_video = False
         try:
-            # 实例化 GoogleVisionService 服务
-            vision_service = GoogleVisionService()
-            # 上传文件
-            google_file = vision_service.upload_file(video_path)
-            logger.info(f"【video-router】上传文件成功:{video_path}")
+            # 实例化 AsyncGoogleVisionService 服务，避免阻塞当前 worker 的事件循环
+            # 选择负载最低的账号，上传的文件只能由该账号访问，后续生成固定使用该账号
+            api_key = await account_pool.acquire(record=False)
+            vision_service = AsyncGoogleVisionService(api_key, account_pool)
+            if vision_service.is_inline_eligible(video_path):
+                # 小视频随请求直接发送，各维度复用同一份数据，跳过上传、激活等待与删除
+                google_file = vision_service.load_inline_video(video_path)
+                inline_video = True
+                logger.info(f"【video-router】视频随请求发送:{video_path}")
+            else:
+                # 上传文件
+                google_file = await vision_service.upload_file(video_path)
+                logger.info(f"【video-router】上传文件成功:{video_path}")
             dimensions = body["dimensions"]
+            # stream=true 时按 NDJSON 流式返回各维度的部分结果，资源在流结束时清理
+            if body.get("stream") is True:
+                dimension_list = Settings.VIDEO_DIMENSIONS if dimensions == "all" else [dimensions]
+                response = CleanupStreamingResponse(
+                    stream_video_tags(task_id, vision_service, google_file, dimension_list),
+                    cleanup=BackgroundTask(
+                        cleanup_video_files, vision_service, google_file, video_path,
+                        uploaded=not inline_video,
+                    ),
+                    media_type="application/x-ndjson",
+                )
+                streaming = True
+                return response
             # 全部维度的标签生成
             if dimensions == "all":
                 # 按顺序处理四个维度的标签生成
                 dimension_list = Settings.VIDEO_DIMENSIONS
                 merged_tags = {}
+
+                # 合并生成：一次请求生成全部维度，失败或输出被截断时回退为逐维度生成
+                if Settings.DIMENSION_MODE == "combined":
+                    try:
+                        merged_tags = await vision_service.generate_combined_tags(
+                            google_file, dimension_list
+                        )
+                    except Exception as e:
+                        logger.warning(f"【video-router】- 合并生成失败，回退为逐维度生成: {str(e)}")
                 
                 for dim in dimension_list:
+                    if dim in merged_tags:
+                        continue
                     dim_start = time.time()
-                    response = vision_service.generate_tag(google_file, dim)
+                    response = await vision_service.generate_tag(google_file, dim)
                     dim_time = round(time.time() - dim_start, 3)
                     logger.info(f"【video-router】- {dim} 维度处理完成，耗时={dim_time}秒")
                     
@@ -137,7 +246,7 @@ async def generate_video_tags(request: Request):
                 vision_response = json.dumps(merged_tags)
             else:
                 # 单一维度的标签生成
-                vision_response = vision_service.generate_tag(google_file, dimensions)
+                vision_response = await vision_service.generate_tag(google_file, dimensions)
                 if not isinstance(vision_response, str):
                     vision_response = str(vision_response)
 
@@ -167,11 +276,11 @@ async def generate_video_tags(request: Request):
             raise
         # 清理文件
         finally:
-            if google_file:  # 确保 google_file 已成功赋值
-                vision_service.delete_google_file(google_file=google_file)
-            # 测试时关闭
-            # 删除本地临时文件
-            vision_service.delete_local_file(file_path=video_path)
+            # 删除本地临时文件（不依赖 vision_service，获取账号或初始化服务失败时同样清理）
+            if not streaming:
+                VideoService.delete_local_file(file_path=video_path)
+            if google_file and not inline_video and not streaming:  # 确保 google_file 已成功赋值
+                await vision_service.delete_google_file(google_file=google_file)
 
     except HTTPException as e:
         logger.error(f"HTTP错误: {str(e)}")
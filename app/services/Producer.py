@@ -4,10 +4,14 @@ from typing import Dict, Any
 from app.models.task import Task
 from app.db.db_decorators import SessionLocal, retry_on_db_error
 from app.db.redis_decorators import get_redis_client
+from app.services.task_queue import TASK_SOURCE_PLATFORMS, get_task_queue
 
 # 配置日志记录器
 logger = get_logger()
 
+# 未指定优先级时按平台确定：用户在界面上等待的任务优先，RPA 批量任务最低
+DEFAULT_PRIORITY = {"user": "high", "files": "normal", "rpa": "low"}
+
 
 class Producer:
     def __init__(self):
@@ -20,11 +24,13 @@ class Producer:
         """创建视频处理任务"""
         start_time = time.time()
         try:
-            uid = task_data.get("uid", "0")
+            uid = str(task_data.get("uid") or "0")
             # 转换 URL 和枚举值为字符串
             url = str(task_data["url"])
             platform = str(task_data["platform"].value if hasattr(task_data["platform"], "value") else task_data["platform"])
             dimensions = str(task_data["dimensions"].value if hasattr(task_data["dimensions"], "value") else task_data["dimensions"])
+            priority = task_data.get("priority")
+            priority = str(priority.value if hasattr(priority, "value") else priority) if priority else DEFAULT_PRIORITY.get(platform, "normal")
             logger.info(
                 f"【Producer-{task_data['platform']}】- 开始创建任务: {task_id}, 参数: {task_data}"
             )
@@ -37,6 +43,7 @@ class Producer:
                 platform=platform,
                 status="pending",
                 dimensions=dimensions,
+                priority=priority,
                 message={},
                 tags={},
             )
@@ -51,10 +58,7 @@ class Producer:
             pipeline = self.redis.pipeline()
             try:
                 # 获取平台前缀
-                if task_data["platform"] in ["rpa", "files"]:
-                    platform = "rpa"
-                else:
-                    platform = "miaobi"
+                platform = TASK_SOURCE_PLATFORMS.get(task_data["platform"], "miaobi")
                 # 写入任务详情
                 pipeline.hset(
                     f"{platform}:task_info:{task_id}",
@@ -64,12 +68,13 @@ class Producer:
                         "platform": platform,
                         "status": "pending",
                         "dimensions":dimensions,
+                        "priority": priority,
                         "retry_count": "0",
                         "created_at": str(int(time.time())),
                     },
                 )
-                # 写入任务队列
-                pipeline.lpush(f"{platform}:task_queue", task_id)
+                # 写入任务队列（由 TASK_QUEUE_BACKEND 决定写入 List 或 Stream）
+                get_task_queue(platform).enqueue(task_id, pipeline, uid=uid, priority=priority)
                 # 执行Redis事务
                 pipeline.execute()
 
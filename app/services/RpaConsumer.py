@@ -1,13 +1,25 @@
 import time
 import asyncio
-from typing import Optional
+import signal
+from typing import Optional, Tuple
 from redis import Redis
 from sqlalchemy.orm import Session
 from app.db.db_decorators import SessionLocal, retry_on_db_error
 from app.db.redis_decorators import get_redis_client, retry_on_redis_error
 from app.models.task import Task
 from app.services.video_service import VideoService
-from app.services.google_vision import GoogleVisionService
+from app.services.google_vision import AsyncGoogleVisionService, task_token_usage
+from app.services.task_scheduler import TaskScheduler
+from app.services.task_queue import create_task_queue
+from app.services.task_lock import TaskLockManager, TaskLockLost
+from app.services.retry_policy import RetryPolicy
+from app.services.dimension_state import DimensionStateStore
+from app.services.tag_cache import TagResultCache
+from app.services.single_flight import SingleFlight
+from app.services.file_cache import GeminiFileCache
+from app.services.context_cache import GeminiContextCache
+from app.services.account_pool import AccountPool
+from app.services.metrics import metrics
 from app.services.logger import get_logger
 from config import Settings
 import json
@@ -21,25 +33,78 @@ class RpaConsumer:
         self.redis.select(1)  # 切换到Redis 1号数据库
         self.video_service = VideoService()  # 初始化视频服务
         self.max_retries = 30  # 最大重试次数
-        self.lock_timeout = 300  # 任务锁超时时间（秒）
+        self.lock_timeout = 300  # 任务锁租约时长（秒），处理期间每 1/3 租约续期一次
         self.platform = "rpa"  # 平台标识
+        # 单进程内并发处理的任务数上限，可通过 scheduler.set_limit() 动态调整
+        self.scheduler = TaskScheduler(
+            Settings.CONSUMER_CONCURRENCY, name="RpaConsumer"
+        )
+        self.stop_event = asyncio.Event()  # 停止拉取新任务的信号
+        self.task_queue = create_task_queue(self.platform)  # 任务队列，由 TASK_QUEUE_BACKEND 决定实现
+        # 任务锁，处理期间自动续期，续期时同步延长任务队列中的确认期限与在途合并键
+        self.task_locks = TaskLockManager(
+            self.platform, self.lock_timeout, on_renew=self._on_lock_renew
+        )
+        self.retry_policy = RetryPolicy()  # 失败任务的重试策略
+        # 各维度处理状态，只有任务锁的持有者可以写入
+        self.dimension_state = DimensionStateStore(self.platform, self.task_locks)
+        self.tag_cache = TagResultCache()  # 按视频内容哈希缓存的标签结果
+        self.file_cache = GeminiFileCache()  # 已上传谷歌文件的复用缓存
+        # 任务级上下文缓存，有效期与任务锁租约一致
+        self.context_cache = GeminiContextCache(self.lock_timeout)
+        self.account_pool = AccountPool()  # Google API 账号池
+        # 同一视频的在途任务合并，只由领导者任务处理
+        self.single_flight = SingleFlight(self.platform, self.lock_timeout)
 
     @retry_on_redis_error(max_retries=3, base_delay=1, db_number=1)
     async def get_task(self) -> Optional[str]:
         """从Redis队列中获取任务"""
-        return self.redis.rpop(f"{self.platform}:task_queue")
+        return await self.task_queue.get_task()
 
     @retry_on_redis_error(max_retries=3, base_delay=1, db_number=1)
     async def acquire_lock(self, task_id: str) -> bool:
         """获取任务锁"""
-        lock_key = f"{self.platform}:task_queue_lock:{task_id}"
-        return bool(self.redis.set(lock_key, "1", ex=self.lock_timeout, nx=True))
+        return await self.task_locks.acquire(task_id)
 
     @retry_on_redis_error(max_retries=3, base_delay=1, db_number=1)
     async def release_lock(self, task_id: str):
-        """释放任务锁"""
-        lock_key = f"{self.platform}:task_queue_lock:{task_id}"
-        self.redis.delete(lock_key)
+        """释放任务锁（仅释放当前进程持有的锁）"""
+        await self.task_locks.release(task_id)
+
+    async def _on_lock_renew(self, task_id: str):
+        """任务锁续期回调"""
+        await self.task_queue.touch(task_id)
+        self.single_flight.touch(task_id)
+        await self.context_cache.touch(task_id)
+
+    async def _follow(self, task_id: str, leader_id: str):
+        """
+        作为跟随者挂到正在处理同一视频的任务上，由其完成后填充结果
+        跟随任务放入延迟重试队列，期限内领导者未完成（如领导者崩溃）时重新投递并接替处理
+        """
+        self.redis.hset(f"{self.platform}:task_info:{task_id}", "leader_task_id", leader_id)
+        await self.task_queue.retry_later(task_id, self.single_flight.follow_timeout)
+        logger.info(
+            f"【RpaConsumer】- 同一视频正在由任务 {leader_id} 处理，任务 {task_id} 等待其结果"
+        )
+
+    async def _retry_followers(self, task_id: str, followers: list):
+        """跟随任务按退避时间错开重新投递，其中之一成为新的领导者"""
+        for follower in followers:
+            await self.task_queue.retry_later(
+                follower, self.retry_policy.next_delay(RetryPolicy.TRANSIENT, 1)
+            )
+        if followers:
+            logger.warning(
+                f"【RpaConsumer】- 任务 {task_id} 未完成，跟随任务延迟重新投递: {followers}"
+            )
+
+    async def _requeue_followers(self, task_id: str):
+        """释放在途合并键，将未获得结果的跟随任务延迟重新投递"""
+        try:
+            await self._retry_followers(task_id, self.single_flight.release(task_id))
+        except Exception as e:
+            logger.error(f"【RpaConsumer】- 重新投递跟随任务失败: task_id={task_id}, error={str(e)}")
 
     @retry_on_db_error(max_retries=3, base_delay=1)
     async def update_task_status(self, task_id: str, status: str, message: str = None):
@@ -58,9 +123,10 @@ class RpaConsumer:
                 if task:
                     task.status = status
                     
-                    # 使用固定格式更新 message 字段
+                    # 使用固定格式更新 message 字段，保留已记录的各维度状态
                     if message:
                         task.message = {
+                            **(task.message or {}),
                             "all": {
                                 "status": "failed",
                                 "message": message
@@ -88,10 +154,12 @@ class RpaConsumer:
         self.redis.lpush(f"{self.platform}:task_queue_failed", task_id)
 
     # 下载视频
-    async def download_video(self, task_id: str, url: str) -> str:
-        """下载视频文件"""
+    async def download_video(self, task_id: str, url: str) -> Tuple[str, str]:
+        """下载视频文件，返回 (视频路径, 内容哈希)"""
         download_start = time.time()
-        video_path = await self.video_service.download_video(url, task_id)
+        video_path, content_hash = await self.video_service.download_video_with_hash(
+            url, task_id
+        )
         if not video_path:
             error_msg = f"【RpaConsumer】- 视频下载失败: task_id={task_id}, url={url}"
             logger.error(error_msg)
@@ -102,7 +170,9 @@ class RpaConsumer:
         logger.info(
             f"【RpaConsumer】- 视频下载成功: {video_path}, 耗时={download_time}秒"
         )
-        return video_path
+        # 记录视频内容哈希，便于排查缓存命中情况
+        self.redis.hset(f"{self.platform}:task_info:{task_id}", "content_hash", content_hash)
+        return video_path, content_hash
     
     @retry_on_db_error(max_retries=3, base_delay=1)
     async def update_dimension_result(self, task_id: str, total_result: dict):
@@ -125,8 +195,8 @@ class RpaConsumer:
             task = db.query(Task).filter(Task.task_id == task_id).first()
             if task:
                 try:
-                    # 更新tags字段
-                    task.tags = total_result["tags"]
+                    # 更新tags字段，合并到已有的维度结果中
+                    task.tags = {**(task.tags or {}), **total_result["tags"]}
                     
                     # 更新message字段
                     task.message = total_result["message"]
@@ -150,8 +220,16 @@ class RpaConsumer:
                     logger.error(error_msg)
                     raise Exception(error_msg)
 
-    async def generate_video_tags(self, task_id: str, video_path: str, dimensions: str) -> dict:
+    async def generate_video_tags(
+        self, task_id: str, video_path: str, dimensions: list, content_hash: str = None
+    ) -> dict:
         """生成视频标签，返回所有维度的处理结果
+        每个维度处理完成后立即保存其状态，任务重试时可跳过已成功的维度
+        已缓存的维度直接复用结果，全部命中时不上传视频
+
+        Args:
+            dimensions (list): 本次需要处理的维度列表
+            content_hash (str): 视频内容哈希，用于查询标签缓存
         
         Returns:
             dict: {
@@ -174,37 +252,102 @@ class RpaConsumer:
                 "tags": [],
                 "message": {"status": "success", "message": "waiting"}
             }
-            for dim in (Settings.VIDEO_DIMENSIONS if dimensions == "all" else [dimensions])
+            for dim in dimensions
         }
         
+        # 同一视频内容已生成过的维度直接复用缓存结果
+        cached_tags = self.tag_cache.get_many(content_hash, dimensions)
+        for dim, tags in cached_tags.items():
+            dimension_results[dim] = {
+                "tags": tags,
+                "message": {"status": "success", "message": "success"},
+            }
+            await self._save_dimension_result(task_id, dim, dimension_results[dim])
+        uncached_dimensions = [dim for dim in dimensions if dim not in cached_tags]
+        if cached_tags:
+            logger.info(
+                f"【RpaConsumer】- 命中标签缓存: task_id={task_id}, dimensions={list(cached_tags)}"
+            )
+
         vision_service = None
         google_file = None
+        file_cached = False
+        inline_video = False
         
         try:
-            # 初始化服务
-            vision_service = GoogleVisionService()
-            
-            # 上传文件
-            try:
-                google_file = vision_service.upload_file(video_path)
-                logger.info(f"【RpaConsumer】上传文件成功:{video_path}")
-            except Exception as upload_error:
-                error_msg = f"上传文件失败: {str(upload_error)}"
-                logger.error(f"【RpaConsumer】- {error_msg}")
-                raise Exception(error_msg)
-
-            # 处理每个维度
-            for dimension in dimension_results.keys():
-                result = await self._process_single_dimension(google_file, dimension, vision_service)
-                dimension_results[dimension] = result
+            if uncached_dimensions:
+                if AsyncGoogleVisionService.is_inline_eligible(video_path):
+                    # 小视频随请求直接发送，各维度复用同一份数据，跳过上传、激活等待与删除
+                    api_key = await self.account_pool.acquire(record=False)
+                    vision_service = AsyncGoogleVisionService(api_key, self.account_pool)
+                    google_file = vision_service.load_inline_video(video_path)
+                    inline_video = True
+                    logger.info(f"【RpaConsumer】视频随请求发送:{video_path}")
+                else:
+                    # 上传文件（同一视频内容已上传且仍有效时直接复用）
+                    # 选择负载最低的账号上传，或复用文件时固定使用上传它的账号
+                    try:
+                        google_file, file_cached, vision_service = await self.file_cache.acquire(
+                            content_hash, video_path, self.account_pool
+                        )
+                        logger.info(f"【RpaConsumer】上传文件成功:{video_path}")
+                    except Exception as upload_error:
+                        error_msg = f"上传文件失败: {str(upload_error)}"
+                        logger.error(f"【RpaConsumer】- {error_msg}")
+                        raise Exception(error_msg)
+
+                # 上传期间任务锁可能已失效，开始生成前确认
+                self.task_locks.ensure_held(task_id)
+
+                # 合并生成：一次请求生成全部维度，未得到合法结果的维度回退为逐维度生成
+                if Settings.DIMENSION_MODE == "combined" and len(uncached_dimensions) > 1:
+                    combined_results = await self._process_combined_dimensions(
+                        google_file, uncached_dimensions, vision_service
+                    )
+                    for dimension, result in combined_results.items():
+                        dimension_results[dimension] = result
+                        await self._save_dimension_result(task_id, dimension, result, content_hash)
+                    uncached_dimensions = [
+                        dim for dim in uncached_dimensions if dim not in combined_results
+                    ]
+
+                # 多个维度共享包含视频的上下文缓存，创建失败时直接发送视频
+                cached_content = await self.context_cache.create(
+                    task_id, google_file, vision_service, uncached_dimensions
+                )
+
+                # 处理每个维度，同一任务内最多 DIMENSION_CONCURRENCY 个维度并发执行
+                semaphore = asyncio.Semaphore(max(1, Settings.DIMENSION_CONCURRENCY))
+
+                async def run_dimension(dimension: str):
+                    async with semaphore:
+                        # 任务锁已失效（任务被其他消费者接管）时不再开始新的维度
+                        self.task_locks.ensure_held(task_id)
+                        dimension_results[dimension] = await self._process_single_dimension(
+                            google_file, dimension, vision_service, cached_content
+                        )
+                    await self._save_dimension_result(
+                        task_id, dimension, dimension_results[dimension], content_hash
+                    )
+
+                await asyncio.gather(
+                    *(run_dimension(dimension) for dimension in uncached_dimensions)
+                )
                 
+        except TaskLockLost:
+            raise
         except Exception as e:
             err_msg = f"【RpaConsumer】- 生成视频标签失败: task_id={task_id}, error={str(e)}"
             logger.error(err_msg)
             raise Exception(err_msg)
         finally:
             # 资源清理
-            await self._cleanup_resources(vision_service, google_file, video_path)
+            await self.context_cache.release(task_id)
+            # 随请求发送的视频没有远端文件需要释放
+            await self._cleanup_resources(
+                vision_service, None if inline_video else google_file,
+                video_path, content_hash, file_cached
+            )
 
         # 重组结果格式
         all_dimension_results = {
@@ -216,9 +359,55 @@ class RpaConsumer:
         logger.info(f"【RpaConsumer】- 获取视频标签完成: task_id={task_id}, 耗时={vision_time}秒")
         return all_dimension_results
 
+    async def _save_dimension_result(
+        self, task_id: str, dimension: str, result: dict, content_hash: str = None
+    ):
+        """保存单个维度的处理状态，成功的结果同时写入标签缓存"""
+        try:
+            await self.dimension_state.save(task_id, dimension, result)
+        except TaskLockLost:
+            raise
+        except Exception as e:
+            logger.error(
+                f"【RpaConsumer】- 保存维度状态失败: task_id={task_id}, dimension={dimension}, error={str(e)}"
+            )
+        if content_hash and result["message"]["status"] == "success":
+            self.tag_cache.set(content_hash, dimension, result["tags"])
+
+    async def _process_combined_dimensions(
+        self, google_file: str, dimensions: list, vision_service: AsyncGoogleVisionService
+    ) -> dict:
+        """一次请求生成多个维度的标签
+
+        Returns:
+            dict: {维度: 处理结果}，只包含成功的维度；请求失败或输出被截断时返回空字典，由调用方逐维度生成
+        """
+        try:
+            combined_start = time.time()
+            combined_tags = await vision_service.generate_combined_tags(google_file, dimensions)
+        except Exception as e:
+            metrics.incr("dimension_mode", "combined_fallback")
+            logger.warning(f"【RpaConsumer】- 合并生成失败，回退为逐维度生成: dimensions={dimensions}, error={str(e)}")
+            return {}
+
+        missing = [dim for dim in dimensions if dim not in combined_tags]
+        metrics.incr("dimension_mode", "combined_partial" if missing else "combined_success")
+        combined_time = round(time.time() - combined_start, 3)
+        logger.info(
+            f"【RpaConsumer】- 合并生成完成: dimensions={list(combined_tags)}, 缺失={missing}, 耗时={combined_time}秒"
+        )
+        return {
+            dim: {
+                "tags": tags,
+                "message": {"status": "success", "message": "success"},
+            }
+            for dim, tags in combined_tags.items()
+        }
+
     async def _process_single_dimension(self, google_file: str, dimension: str, 
-                                     vision_service: GoogleVisionService) -> dict:
-        """处理单个维度的标签生成
+                                     vision_service: AsyncGoogleVisionService,
+                                     cached_content: str = None) -> dict:
+        """处理单个维度的标签生成，cached_content 为任务的上下文缓存名称
         
         Returns:
             dict: {
@@ -233,7 +422,9 @@ class RpaConsumer:
             dim_start = time.time()
             
             # 生成标签
-            response = vision_service.generate_tag(google_file, dimension)
+            response = await vision_service.generate_tag(
+                google_file, dimension, cached_content=cached_content
+            )
             if not isinstance(response, str):
                 response = str(response)
             
@@ -273,13 +464,17 @@ class RpaConsumer:
                 }
             }
 
-    async def _cleanup_resources(self, vision_service: Optional[GoogleVisionService], 
-                               google_file: Optional[str], video_path: str) -> None:
-        """清理资源"""
+    async def _cleanup_resources(self, vision_service: Optional[AsyncGoogleVisionService], 
+                               google_file: Optional[str], video_path: str,
+                               content_hash: str = None, file_cached: bool = False) -> None:
+        """清理资源，缓存中的谷歌文件只释放引用，由后台清理删除"""
         try:
             if vision_service and google_file:
-                vision_service.delete_google_file(google_file=google_file)
-            if video_path and os.path.exists(video_path):
+                await self.file_cache.release(
+                    content_hash, google_file, file_cached, vision_service
+                )
+            # 全部维度命中缓存时未初始化服务，本地文件由 process_task 清理
+            if vision_service and video_path and os.path.exists(video_path):
                 vision_service.delete_local_file(file_path=video_path)
         except Exception as e:
             logger.error(f"【RpaConsumer】- 清理资源失败: {str(e)}")
@@ -287,6 +482,10 @@ class RpaConsumer:
     async def process_task(self, task_id: str):
         video_path = None
         start_time = time.time()
+        # 累计本任务消耗的 token 数，确认任务时计入用户的 token 预算（fair 队列）
+        token_usage = {"tokens": 0}
+        task_token_usage.set(token_usage)
+        lock_lost = False
         try:
             # 获取任务信息
             task_info = None
@@ -310,6 +509,15 @@ class RpaConsumer:
                 logger.error(f"【RpaConsumer】- 任务 {task_id} 不存在")
                 return
 
+            # 同一视频的任务正在处理时作为跟随者，不再重复下载与生成
+            leader_id = self.single_flight.join(
+                task_id,
+                self.single_flight.url_key(task_info["url"], task_info["dimensions"]),
+            )
+            if leader_id != task_id:
+                await self._follow(task_id, leader_id)
+                return
+
             # 更新任务状态为处理中
             await self.update_task_status(task_id, "processing")
             logger.info(
@@ -317,45 +525,121 @@ class RpaConsumer:
             )
 
             try:
-                # 下载视频
-                video_path = await self.download_video(task_id, task_info["url"])
+                # 已成功的维度无需重新处理，重试时只处理缺失或失败的维度
+                requested_dimensions = (
+                    Settings.VIDEO_DIMENSIONS
+                    if task_info["dimensions"] == "all"
+                    else [task_info["dimensions"]]
+                )
+                completed = self.dimension_state.completed_dimensions(
+                    task_id, requested_dimensions
+                )
+                pending_dimensions = [
+                    dim for dim in requested_dimensions if dim not in completed
+                ]
+                if completed:
+                    logger.info(
+                        f"【RpaConsumer】- 任务 {task_id} 已完成维度: {list(completed)}, 本次处理: {pending_dimensions}"
+                    )
 
-                # 生成视频标签
-                total_result = await self.generate_video_tags(task_id, video_path, task_info["dimensions"])
-                logger.info(f"【RpaConsumer】- 生成视频标签成功")
+                total_result = None
+                if pending_dimensions:
+                    # 下载视频
+                    video_path, content_hash = await self.download_video(
+                        task_id, task_info["url"]
+                    )
 
-                # 更新数据库
+                    # 不同 URL 的同一视频正在处理时同样作为跟随者
+                    leader_id = self.single_flight.join(
+                        task_id,
+                        self.single_flight.content_key(content_hash, task_info["dimensions"]),
+                    )
+                    if leader_id != task_id:
+                        await self.update_task_status(task_id, "pending")
+                        await self._follow(task_id, leader_id)
+                        return
+
+                    # 生成视频标签
+                    total_result = await self.generate_video_tags(
+                        task_id, video_path, pending_dimensions, content_hash
+                    )
+                    logger.info(f"【RpaConsumer】- 生成视频标签成功")
+
+                # 合并已完成维度与本次结果，更新数据库
+                total_result = DimensionStateStore.merge(completed, total_result)
+                self.task_locks.ensure_held(task_id)
                 await self.update_dimension_result(
                     task_id=task_id,
                     total_result=total_result,
                 )
 
+                # 存在失败的维度时进入重试流程，重试时只处理失败的维度
+                failed_dimensions = [
+                    f"{dim}: {msg.get('message')}"
+                    for dim, msg in total_result["message"].items()
+                    if msg.get("status") == "failed"
+                ]
+                if failed_dimensions:
+                    raise Exception(f"维度处理失败: {'; '.join(failed_dimensions)}")
+
                 total_time = round(time.time() - start_time, 3)
                 logger.info(
                     f"【RpaConsumer】- 任务处理完成: task_id={task_id}, 总耗时={total_time}秒"
                 )
 
+                # 用本任务结果完成所有跟随任务
+                followers = self.single_flight.release(task_id)
+                try:
+                    self.single_flight.resolve(task_id, followers, total_result)
+                except Exception as e:
+                    logger.error(f"【RpaConsumer】- 填充跟随任务结果失败: task_id={task_id}, error={str(e)}")
+                    await self._retry_followers(task_id, followers)
+
                 # 删除Redis中的任务信息
                 self.redis.delete(f"{self.platform}:task_info:{task_id}")
 
+            except TaskLockLost:
+                raise
+
             except Exception as e:
                 logger.error(f"【RpaConsumer】- 处理任务 {task_id} 失败: {str(e)}")
                 retry_count = await self.increment_retry_count(task_id)
+                error_category = self.retry_policy.classify(e)
 
-                if retry_count >= self.max_retries:
+                if (
+                    error_category == RetryPolicy.PERMANENT
+                    or retry_count >= self.max_retries
+                ):
                     await self.move_to_failed_queue(task_id)
+                    self.single_flight.fail(
+                        task_id, self.single_flight.release(task_id), str(e)
+                    )
                     await self.update_task_status(task_id, "failed", str(e))
                     logger.error(
-                        f"【RpaConsumer】- 任务 {task_id} 达到最大重试次数({self.max_retries})，移入失败队列"
+                        f"【RpaConsumer】- 任务 {task_id} 不再重试(错误类型={error_category}, "
+                        f"重试次数={retry_count}/{self.max_retries})，移入失败队列"
                     )
                 else:
-                    # 重新加入队列
-                    self.redis.lpush(f"{self.platform}:task_queue", task_id)
+                    # 按错误类型退避，到期后由延迟队列重新投递
+                    delay = self.retry_policy.next_delay(error_category, retry_count)
+                    await self.task_queue.retry_later(task_id, delay)
                     logger.warning(
-                        f"【RpaConsumer】- 任务 {task_id} 重试次数: {retry_count}/{self.max_retries}"
+                        f"【RpaConsumer】- 任务 {task_id} 重试次数: {retry_count}/{self.max_retries}, "
+                        f"错误类型={error_category}, {round(delay, 1)}秒后重试"
                     )
                 raise
 
+        except TaskLockLost as e:
+            # 任务已由其他消费者或回收器接管，不更新状态、不确认，也不处理跟随任务
+            lock_lost = True
+            logger.warning(f"【RpaConsumer】- 放弃处理任务 {task_id}: {str(e)}")
+
+        except asyncio.CancelledError:
+            # 停机超时被取消：先将任务放回队列再确认，避免 reliable/stream 模式下任务丢失
+            logger.warning(f"【RpaConsumer】- 任务 {task_id} 被取消，重新放回队列")
+            await self.task_queue.requeue(task_id)
+            raise
+
         except Exception as e:
             logger.error(f"【RpaConsumer】- 处理任务 {task_id} 时发生错误: {str(e)}")
             await self.update_task_status(task_id, "failed", str(e))
@@ -368,21 +652,63 @@ class RpaConsumer:
                     logger.info(f"【RpaConsumer】- 清理临时文件成功: {video_path}")
                 except Exception as e:
                     logger.error(f"清理临时文件失败 {video_path}: {str(e)}")
+            if not lock_lost:
+                # 未能完成的任务（暂时失败或异常退出）将跟随任务重新投递
+                await self._requeue_followers(task_id)
+                # 确认任务处理结束（需在释放任务锁之前，避免被回收器重复投递）
+                await self.task_queue.ack(task_id, token_usage["tokens"])
             # 释放任务锁
             await self.release_lock(task_id)
 
+    async def _housekeeping_loop(self):
+        """后台维护：定期回收超时未确认的任务，清理空闲的谷歌文件"""
+        while True:
+            try:
+                await self.task_queue.reap()
+                if self.file_cache.enabled:
+                    await self.file_cache.sweep(self.account_pool)
+            except Exception as e:
+                logger.error(f"【RpaConsumer】- 后台维护任务执行失败: {str(e)}")
+            await asyncio.sleep(Settings.TASK_REAP_INTERVAL)
+
+    async def _promote_loop(self):
+        """后台维护：定期将到期的延迟重试任务移回任务队列"""
+        while True:
+            try:
+                await self.task_queue.promote_due(Settings.TASK_PROMOTE_BATCH_SIZE)
+            except Exception as e:
+                logger.error(f"【RpaConsumer】- 延迟任务投递失败: {str(e)}")
+            await asyncio.sleep(Settings.TASK_PROMOTE_INTERVAL)
+
+    def stop(self):
+        """停止拉取新任务，在途任务会继续执行直至完成"""
+        logger.info("【RpaConsumer】- 收到停止信号，停止拉取新任务")
+        self.stop_event.set()
+
     async def run(self):
         """启动消费者服务"""
-        logger.info("【RpaConsumer】- 启动视频标签处理消费者服务")
+        logger.info(
+            f"【RpaConsumer】- 启动视频标签处理消费者服务, 并发数={self.scheduler.limit}"
+        )
+        # 找回上次运行时未确认的任务，并启动后台维护任务
+        await self.task_queue.recover()
+        background_tasks = [
+            asyncio.create_task(self._housekeeping_loop()),
+            asyncio.create_task(self._promote_loop()),
+        ]
         with SessionLocal() as db:
             self.db = db
-            while True:
+            while not self.stop_event.is_set():
                 try:
+                    # 先等待空闲槽位再取任务，避免任务取出后在本地排队
+                    await self.scheduler.wait_for_slot()
+                    if self.stop_event.is_set():
+                        break
+
                     # 获取任务
                     task_id = await self.get_task()
                     if not task_id:
-                        # 队列为空，等待一段时间
-                        await asyncio.sleep(1)
+                        # 队列为空（等待已在任务队列内完成）
                         continue
 
                     # 获取任务锁
@@ -390,15 +716,22 @@ class RpaConsumer:
                         logger.warning(
                             f"【RpaConsumer】- 任务 {task_id} 正在被其他进程处理"
                         )
+                        await self.task_queue.ack(task_id)
                         continue
 
                     # 处理任务
-                    await self.process_task(task_id)
+                    self.scheduler.spawn(self.process_task(task_id))
 
                 except Exception as e:
                     logger.error(f"【RpaConsumer】- 消费者服务发生错误: {str(e)}")
                     await asyncio.sleep(1)
 
+            # 排空在途任务
+            await self.scheduler.drain(Settings.CONSUMER_DRAIN_TIMEOUT)
+        for background_task in background_tasks:
+            background_task.cancel()
+        logger.info("【RpaConsumer】- 消费者服务已停止")
+
     @classmethod
     async def main(cls):
         """主入口函数"""
@@ -410,6 +743,11 @@ class RpaConsumer:
             # 创建消费者实例
             consumer = cls(redis_client)
 
+            # 收到 SIGTERM/SIGINT 时停止拉取新任务，并排空在途任务后退出
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, consumer.stop)
+
             # 运行异步任务
             await consumer.run()
         except Exception as e:
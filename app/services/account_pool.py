@@ -0,0 +1,264 @@
+import json
+import time
+import uuid
+import asyncio
+from typing import List, Optional, Tuple
+from config import Settings
+from app.db.redis_decorators import get_redis_client
+from app.services.logger import get_logger
+
+logger = get_logger()
+
+
+class AccountPoolExhausted(Exception):
+    """账号池中没有可用账号（每日配额用尽或账号停用）"""
+
+
+class AccountPool:
+    """
+    Google API 账号池，数据结构见 README「Google账号-Redis数据结构」
+    - 选择：一次 Lua 调用内检查每个账号的状态、冷却、每日配额与分钟窗口，选出负载最低的账号并记录本次请求
+    - 冷却：请求返回 429 的账号在 ACCOUNT_COOLDOWN_SECONDS 内不再被选择
+    - 固定账号：上传的文件只能由上传它的账号访问，生成标签时指定该账号
+    账号池为空时回退到 Settings.API_KEY
+    选择脚本按账号集合中的密钥拼接各账号的键，未在 KEYS 中声明，需部署在单机 Redis 上（不支持 Redis Cluster）
+    """
+
+    KEYS_SET = "google_accounts:keys"
+    IMPORT_LOCK = "google_accounts:import_lock"
+    # 账号分钟配额在进程内的缓存时间（秒）
+    QUOTA_CACHE_SECONDS = 60
+
+    # 选择账号
+    # KEYS[1]: 账号集合
+    # ARGV: 当前时间, 日期, 本次请求标识, 指定账号（可为空）, 是否记录本次请求(1/0)
+    # 返回：false-账号池为空；{api_key, "0"}-选中；{"", retry_after}-暂无可用账号，retry_after 为最早可用的等待秒数，-1 表示配额均已用尽
+    # google_account:{api_key}:* 由 SMEMBERS 的结果拼接，依赖单机 Redis
+    ACQUIRE_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local candidates
+    if ARGV[4] ~= '' then
+        if redis.call('EXISTS', 'google_account:' .. ARGV[4] .. ':info') == 0 then
+            -- 不在账号池中的账号（如 Settings.API_KEY）不做计数
+            return {ARGV[4], '0'}
+        end
+        candidates = {ARGV[4]}
+    else
+        candidates = redis.call('SMEMBERS', KEYS[1])
+        if #candidates == 0 then
+            return false
+        end
+    end
+
+    local best, best_load
+    local retry_after = -1
+    for _, key in ipairs(candidates) do
+        local prefix = 'google_account:' .. key
+        local info = redis.call('HMGET', prefix .. ':info', 'status', 'quota_daily', 'quota_minute')
+        if info[1] == 'active' then
+            local cooldown = redis.call('PTTL', prefix .. ':cooldown')
+            if cooldown > 0 then
+                if retry_after < 0 or cooldown / 1000 < retry_after then
+                    retry_after = cooldown / 1000
+                end
+            else
+                local daily_limit = tonumber(info[2]) or 0
+                local minute_limit = tonumber(info[3]) or 0
+                local daily_used = tonumber(redis.call('HGET', prefix .. ':daily', ARGV[2]) or '0')
+                if daily_limit <= 0 or daily_used < daily_limit then
+                    local window = prefix .. ':minute_window'
+                    redis.call('ZREMRANGEBYSCORE', window, '-inf', now - 60)
+                    local minute_used = redis.call('ZCARD', window)
+                    if minute_limit <= 0 or minute_used < minute_limit then
+                        local load = 0
+                        if daily_limit > 0 then
+                            load = daily_used / daily_limit
+                        end
+                        if minute_limit > 0 and minute_used / minute_limit > load then
+                            load = minute_used / minute_limit
+                        end
+                        if not best_load or load < best_load then
+                            best, best_load = key, load
+                        end
+                    else
+                        local oldest = redis.call('ZRANGE', window, 0, 0, 'WITHSCORES')
+                        local wait = tonumber(oldest[2]) + 60 - now
+                        if retry_after < 0 or wait < retry_after then
+                            retry_after = wait
+                        end
+                    end
+                end
+            end
+        end
+    end
+
+    if not best then
+        return {'', tostring(retry_after)}
+    end
+    if ARGV[5] == '1' then
+        local prefix = 'google_account:' .. best
+        redis.call('HINCRBY', prefix .. ':daily', ARGV[2], 1)
+        redis.call('EXPIRE', prefix .. ':daily', 172800)
+        redis.call('ZADD', prefix .. ':minute_window', now, ARGV[3])
+        redis.call('EXPIRE', prefix .. ':minute_window', 120)
+    end
+    return {best, '0'}
+    """
+
+    def __init__(self):
+        self.redis = get_redis_client()
+        self.cooldown_seconds = Settings.ACCOUNT_COOLDOWN_SECONDS
+        self.acquire_timeout = Settings.ACCOUNT_ACQUIRE_TIMEOUT
+        self._acquire = self.redis.register_script(self.ACQUIRE_SCRIPT)
+        self._quota_cache = {}  # api_key -> (quota_minute, 过期时间)
+
+    @staticmethod
+    def _prefix(api_key: str) -> str:
+        return f"google_account:{api_key}"
+
+    @staticmethod
+    def mask(api_key: str) -> str:
+        """日志与统计中只展示密钥末尾"""
+        return f"***{api_key[-6:]}" if api_key else ""
+
+    def _try_acquire(self, api_key: Optional[str], record: bool) -> Tuple[Optional[str], float]:
+        """
+        尝试选择账号
+        Returns:
+            tuple: (api_key, retry_after)，账号池为空时返回 (Settings.API_KEY, 0)
+        """
+        result = self._acquire(
+            keys=[self.KEYS_SET],
+            args=[
+                time.time(),
+                time.strftime("%Y-%m-%d"),
+                uuid.uuid4().hex,
+                api_key or "",
+                1 if record else 0,
+            ],
+        )
+        if not result:
+            return Settings.API_KEY, 0
+        key, retry_after = result
+        return key or None, float(retry_after)
+
+    async def acquire(self, api_key: str = None, record: bool = True) -> str:
+        """
+        获取可用账号，暂无可用账号时等待
+        Args:
+            api_key: 指定账号（如上传文件的账号），为空时选择负载最低的账号
+            record: 是否计入该账号的每日与分钟用量（生成请求计入，上传等文件操作不计入）
+        Returns:
+            str: API 密钥
+        """
+        deadline = time.time() + self.acquire_timeout
+        while True:
+            key, retry_after = self._try_acquire(api_key, record)
+            if key:
+                return key
+            if retry_after < 0:
+                raise AccountPoolExhausted(
+                    f"Google 账号每日配额已用尽或账号不可用(quota exhausted): {self.mask(api_key) or '全部账号'}"
+                )
+            if time.time() + retry_after > deadline:
+                raise AccountPoolExhausted(
+                    f"等待 Google 账号分钟配额超时(quota): {self.mask(api_key) or '全部账号'}"
+                )
+            await asyncio.sleep(min(max(retry_after, 0.05), 5))
+
+    def minute_quota(self, api_key: str) -> int:
+        """账号的每分钟请求数配额（quota_minute），0 表示未配置或不在账号池中"""
+        now = time.time()
+        cached = self._quota_cache.get(api_key)
+        if cached and cached[1] > now:
+            return cached[0]
+        quota = int(self.redis.hget(f"{self._prefix(api_key)}:info", "quota_minute") or 0)
+        self._quota_cache[api_key] = (quota, now + self.QUOTA_CACHE_SECONDS)
+        return quota
+
+    def is_available(self, api_key: str) -> bool:
+        """账号当天是否仍可使用（分钟窗口或冷却中的账号稍后可用，也视为可用）"""
+        key, retry_after = self._try_acquire(api_key, record=False)
+        return bool(key) or retry_after >= 0
+
+    def cooldown(self, api_key: str, seconds: int = None):
+        """账号被限流（429）后暂停使用一段时间"""
+        if not api_key or not self.redis.exists(f"{self._prefix(api_key)}:info"):
+            return
+        self.redis.set(f"{self._prefix(api_key)}:cooldown", 1, ex=seconds or self.cooldown_seconds)
+        logger.warning(f"【AccountPool】- 账号被限流，暂停使用: {self.mask(api_key)}")
+
+    @staticmethod
+    def is_rate_limited(error: Exception) -> bool:
+        """是否为限流错误"""
+        return getattr(error, "code", None) == 429 or "resource_exhausted" in str(error).lower()
+
+    def import_accounts(self, file_path: str = None) -> int:
+        """
+        从 JSON 文件批量导入账号
+        Args:
+            file_path: 账号文件路径，默认 Settings.API_KEYS_FILE
+        Returns:
+            int: 导入的账号数
+        """
+        file_path = file_path or Settings.API_KEYS_FILE
+        with open(file_path, "r", encoding="utf-8") as f:
+            accounts = json.load(f)
+
+        if not self.redis.set(self.IMPORT_LOCK, 1, ex=60, nx=True):
+            raise Exception("账号导入正在进行中，请稍后重试")
+        try:
+            pipeline = self.redis.pipeline()
+            imported = 0
+            for account in accounts:
+                api_key = account.get("api_key")
+                if not api_key:
+                    logger.warning(f"【AccountPool】- 跳过缺少 api_key 的账号: {account.get('username')}")
+                    continue
+                pipeline.hset(
+                    f"{self._prefix(api_key)}:info",
+                    mapping={
+                        "api_key": api_key,
+                        "quota_daily": int(account.get("daily_limit", 0)),
+                        "quota_minute": int(account.get("minute_limit", 0)),
+                        "status": account.get("status", "active"),
+                        "username": account.get("username", ""),
+                        "password": account.get("password", ""),
+                        "phone": account.get("phone", ""),
+                        "email": account.get("email", ""),
+                    },
+                )
+                pipeline.sadd(self.KEYS_SET, api_key)
+                imported += 1
+            pipeline.execute()
+            logger.info(f"【AccountPool】- 导入账号完成: {imported}个")
+            return imported
+        finally:
+            self.redis.delete(self.IMPORT_LOCK)
+
+    def stats(self) -> List[dict]:
+        """各账号的当日用量、当前分钟用量与状态"""
+        today = time.strftime("%Y-%m-%d")
+        now = time.time()
+        keys = sorted(self.redis.smembers(self.KEYS_SET))
+        pipeline = self.redis.pipeline()
+        for key in keys:
+            prefix = self._prefix(key)
+            pipeline.hmget(f"{prefix}:info", "status", "quota_daily", "quota_minute")
+            pipeline.hget(f"{prefix}:daily", today)
+            pipeline.zcount(f"{prefix}:minute_window", now - 60, "+inf")
+            pipeline.ttl(f"{prefix}:cooldown")
+        results = pipeline.execute()
+        stats = []
+        for i, key in enumerate(keys):
+            (status, quota_daily, quota_minute), daily_used, minute_used, cooldown = results[i * 4:i * 4 + 4]
+            stats.append({
+                "api_key": self.mask(key),
+                "status": status,
+                "daily_used": int(daily_used or 0),
+                "quota_daily": int(quota_daily or 0),
+                "minute_used": int(minute_used or 0),
+                "quota_minute": int(quota_minute or 0),
+                "cooldown": max(int(cooldown), 0),
+            })
+        return stats
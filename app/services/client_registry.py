@@ -0,0 +1,32 @@
+import threading
+from typing import Dict
+from google import genai
+from app.services.logger import get_logger
+
+logger = get_logger()
+
+
+class GenaiClientRegistry:
+    """
+    进程内的 genai.Client 注册表
+    每个 API 密钥只创建一个客户端，同步与异步（client.aio）请求复用其内部的 HTTP 连接池
+    """
+
+    _clients: Dict[str, genai.Client] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, api_key: str) -> genai.Client:
+        """获取指定密钥的客户端，不存在时创建"""
+        client = cls._clients.get(api_key)
+        if client is not None:
+            return client
+        with cls._lock:
+            client = cls._clients.get(api_key)
+            if client is None:
+                client = genai.Client(api_key=api_key)
+                cls._clients[api_key] = client
+                logger.info(
+                    f"【Google】- 成功初始化Google API客户端，使用付费API密钥：***{api_key[-6:]}"
+                )
+            return client
@@ -0,0 +1,83 @@
+from typing import Dict, Optional, Tuple
+from config import Settings
+from app.services.google_vision import AsyncGoogleVisionService
+from app.services.logger import get_logger
+from app.services.metrics import metrics
+
+logger = get_logger()
+
+
+class GeminiContextCache:
+    """
+    任务级的 Gemini 上下文缓存
+    - 每个任务创建一次包含视频的缓存，该任务的各维度提示词都基于该缓存生成，视频 token 不再随每个维度重复计费
+    - 有效期与任务锁租约一致，随任务锁续期延长，任务结束时删除；进程异常退出时由服务端按有效期自动清理
+    - 创建失败（如视频 token 数低于缓存下限）时回退为直接发送视频
+    token 用量与耗时按 cached/uncached 分别统计，见 GoogleVisionService.usage_report()
+    """
+
+    METRIC_NAME = "context_cache"
+
+    def __init__(self, lease_timeout: int):
+        """
+        Args:
+            lease_timeout: 缓存有效期（秒），与任务锁租约一致
+        """
+        self.enabled = Settings.CONTEXT_CACHE_ENABLED
+        self.min_dimensions = Settings.CONTEXT_CACHE_MIN_DIMENSIONS
+        self.ttl = lease_timeout
+        self._caches: Dict[str, Tuple[AsyncGoogleVisionService, str]] = {}  # task_id -> (服务, 缓存名称)
+
+    async def create(
+        self, task_id: str, google_file, vision_service: AsyncGoogleVisionService, dimensions: list
+    ) -> Optional[str]:
+        """
+        为任务创建上下文缓存，维度数不足 min_dimensions 时不创建
+        Returns:
+            str: 缓存名称，未启用或创建失败时返回 None
+        """
+        if not self.enabled or len(dimensions) < self.min_dimensions:
+            return None
+        try:
+            name = await vision_service.create_context_cache(
+                google_file, self.ttl, display_name=f"task-{task_id}"
+            )
+        except Exception as e:
+            metrics.incr(self.METRIC_NAME, "create_failed")
+            logger.warning(f"【ContextCache】- 创建上下文缓存失败，直接发送视频: task_id={task_id}, error={str(e)}")
+            return None
+        metrics.incr(self.METRIC_NAME, "created")
+        self._caches[task_id] = (vision_service, name)
+        return name
+
+    async def touch(self, task_id: str):
+        """延长任务的上下文缓存有效期，随任务锁续期调用"""
+        entry = self._caches.get(task_id)
+        if not entry:
+            return
+        vision_service, name = entry
+        try:
+            await vision_service.extend_context_cache(name, self.ttl)
+        except Exception as e:
+            logger.warning(f"【ContextCache】- 延长上下文缓存失败: {name}, error={str(e)}")
+
+    async def release(self, task_id: str):
+        """任务结束时删除上下文缓存"""
+        entry = self._caches.pop(task_id, None)
+        if not entry:
+            return
+        vision_service, name = entry
+        try:
+            await vision_service.delete_context_cache(name)
+        except Exception as e:
+            # 删除失败时由服务端按有效期清理
+            logger.warning(f"【ContextCache】- 删除上下文缓存失败: {name}, error={str(e)}")
+
+    @classmethod
+    def report(cls) -> dict:
+        """上下文缓存的创建次数与失败次数"""
+        counters = metrics.get_counters(cls.METRIC_NAME)
+        return {
+            "created": int(counters.get("created", 0)),
+            "create_failed": int(counters.get("create_failed", 0)),
+        }
@@ -0,0 +1,120 @@
+import json
+import asyncio
+from typing import Dict, List, Optional
+from app.db.db_decorators import SessionLocal
+from app.db.redis_decorators import REDIS_TASK_DB, get_redis_client
+from app.models.task import Task
+from app.services.logger import get_logger
+from app.services.task_lock import TaskLockLost, TaskLockManager
+
+logger = get_logger()
+
+
+class DimensionStateStore:
+    """
+    任务各维度的处理状态
+    每个维度处理完成后立即写入：
+    - Redis 任务详情 {platform}:task_info:{task_id} 的 dimension:{dim} 字段（JSON: {"tags": ..., "message": ...}）
+    - MySQL video_tasks 的 tags[dim] 与 message[dim]
+    任务重试时只需重新处理缺失或失败的维度
+    传入任务锁时只有锁的当前持有者可以写入，锁已失效（任务被其他消费者接管）时放弃写入
+    """
+
+    # 任务锁仍属于当前持有者时写入维度状态
+    # KEYS: 任务详情, 任务锁
+    # ARGV: 锁 token, 字段, 值
+    SAVE_SCRIPT = """
+    if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+    return 1
+    """
+
+    def __init__(self, platform: str, task_locks: Optional[TaskLockManager] = None):
+        self.platform = platform
+        self.task_locks = task_locks
+        self.redis = get_redis_client(db=REDIS_TASK_DB)
+        self._save = self.redis.register_script(self.SAVE_SCRIPT)
+
+    def _task_key(self, task_id: str) -> str:
+        return f"{self.platform}:task_info:{task_id}"
+
+    def load(self, task_id: str) -> Dict[str, dict]:
+        """
+        读取已保存的维度结果
+        Returns:
+            dict: {dimension: {"tags": ..., "message": {"status": ..., "message": ...}}}
+        """
+        results = {}
+        for field, value in self.redis.hgetall(self._task_key(task_id)).items():
+            if not field.startswith("dimension:"):
+                continue
+            try:
+                results[field.split(":", 1)[1]] = json.loads(value)
+            except json.JSONDecodeError:
+                logger.warning(f"【DimensionState】- 维度状态解析失败: task_id={task_id}, field={field}")
+        if results:
+            return results
+
+        # Redis 中没有维度状态时（如任务详情已过期），从 MySQL 恢复已成功的维度
+        with SessionLocal() as db:
+            task = db.query(Task).filter(Task.task_id == task_id).first()
+            if task and task.message:
+                for dim, msg in task.message.items():
+                    if isinstance(msg, dict) and msg.get("status") == "success":
+                        results[dim] = {
+                            "tags": (task.tags or {}).get(dim, []),
+                            "message": msg,
+                        }
+        return results
+
+    def completed_dimensions(self, task_id: str, dimensions: List[str]) -> Dict[str, dict]:
+        """返回 dimensions 中已成功处理的维度结果"""
+        saved = self.load(task_id)
+        return {
+            dim: saved[dim]
+            for dim in dimensions
+            if saved.get(dim, {}).get("message", {}).get("status") == "success"
+        }
+
+    async def save(self, task_id: str, dimension: str, result: dict):
+        """保存单个维度的处理结果，任务锁已失效时抛出 TaskLockLost；MySQL 写入在工作线程中执行，不阻塞事件循环"""
+        field, value = f"dimension:{dimension}", json.dumps(result, ensure_ascii=False)
+        if self.task_locks is None:
+            self.redis.hset(self._task_key(task_id), field, value)
+        else:
+            lock_key, token = self.task_locks.lock_token(task_id)
+            if not token or not self._save(keys=[self._task_key(task_id), lock_key], args=[token, field, value]):
+                raise TaskLockLost(f"任务锁已失效，放弃保存维度状态: task_id={task_id}, dimension={dimension}")
+        await asyncio.to_thread(self._save_to_db, task_id, dimension, result)
+
+    @staticmethod
+    def _save_to_db(task_id: str, dimension: str, result: dict):
+        """写入 MySQL，读取时加行锁（SELECT ... FOR UPDATE），同一任务的多个维度并发写入 JSON 字段时不会互相覆盖"""
+        with SessionLocal() as db:
+            task = db.query(Task).filter(Task.task_id == task_id).with_for_update().first()
+            if task:
+                # 赋值新的 dict，确保 SQLAlchemy 能检测到 JSON 字段变化
+                task.tags = {**(task.tags or {}), dimension: result["tags"]}
+                task.message = {**(task.message or {}), dimension: result["message"]}
+                db.commit()
+
+    @staticmethod
+    def merge(completed: Dict[str, dict], total_result: dict = None) -> dict:
+        """
+        合并已完成的维度结果与本次处理结果
+        Args:
+            completed: {dimension: {"tags": ..., "message": ...}}
+            total_result: 本次处理结果 {"tags": {dim: ...}, "message": {dim: ...}}
+        Returns:
+            dict: {"tags": {dim: ...}, "message": {dim: ...}}
+        """
+        merged = {
+            "tags": {dim: result["tags"] for dim, result in completed.items()},
+            "message": {dim: result["message"] for dim, result in completed.items()},
+        }
+        if total_result:
+            merged["tags"].update(total_result["tags"])
+            merged["message"].update(total_result["message"])
+        return merged
@@ -0,0 +1,99 @@
+import random
+from typing import Iterator, Optional
+from app.services.logger import get_logger
+from app.services.metrics import metrics
+
+logger = get_logger()
+
+
+class FileActivationEstimator:
+    """
+    上传文件激活等待时间的估算
+    - 按文件大小分桶记录激活耗时直方图（metrics:histogram:file_activation:{bucket}）
+    - 首次检查前的等待时间：样本足够时取该大小区间的历史耗时，否则按文件大小与视频时长估算
+    - 之后按指数退避并加入随机抖动轮询，避免大文件频繁请求 files API
+    """
+
+    METRIC_PREFIX = "file_activation"
+    # 文件大小分桶上界（MB）
+    SIZE_BUCKETS_MB = (5, 20, 50, 100, 200)
+    # 激活耗时直方图的桶上界（秒）
+    DURATION_BUCKETS = (1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120, 300, 600)
+    # 使用历史耗时所需的最少样本数
+    MIN_SAMPLES = 5
+    # 首次等待时间上限（秒）
+    MAX_INITIAL_DELAY = 60
+    # 轮询间隔：初始值、增长倍数与上限（秒）
+    POLL_INTERVAL = 1
+    POLL_BACKOFF = 1.5
+    MAX_POLL_INTERVAL = 15
+
+    @classmethod
+    def size_bucket(cls, size_bytes: int) -> str:
+        """文件大小所在的分桶，如 le_20mb、gt_200mb"""
+        size_mb = size_bytes / (1024 * 1024)
+        for bound in cls.SIZE_BUCKETS_MB:
+            if size_mb <= bound:
+                return f"le_{bound}mb"
+        return f"gt_{cls.SIZE_BUCKETS_MB[-1]}mb"
+
+    @classmethod
+    def _metric_name(cls, bucket: str) -> str:
+        return f"{cls.METRIC_PREFIX}:{bucket}"
+
+    @staticmethod
+    def _estimate(size_bytes: int, duration: Optional[float]) -> float:
+        """
+        无历史样本时的经验估算：服务端按时长抽帧处理，时长是主要因素；
+        无法获取时长时按文件大小折算
+        """
+        size_mb = size_bytes / (1024 * 1024)
+        if duration:
+            return 1 + duration * 0.05 + size_mb * 0.02
+        return 1 + size_mb * 0.1
+
+    def initial_delay(self, size_bytes: int, duration: Optional[float] = None) -> float:
+        """首次检查文件状态前的等待时间（秒）"""
+        try:
+            histogram = metrics.get_histogram(
+                self._metric_name(self.size_bucket(size_bytes)), self.DURATION_BUCKETS
+            )
+        except Exception as e:
+            logger.warning(f"【FileActivation】- 读取激活耗时统计失败: {str(e)}")
+            histogram = {"count": 0}
+
+        if histogram["count"] >= self.MIN_SAMPLES:
+            # 直方图分位数为桶上界，取其与均值中较小者并略微提前，尽量在激活前后首次检查
+            delay = min(histogram["p50"], histogram["avg"]) * 0.8
+        else:
+            delay = self._estimate(size_bytes, duration)
+        return round(min(delay, self.MAX_INITIAL_DELAY), 2)
+
+    def poll_intervals(self) -> Iterator[float]:
+        """首次检查之后的轮询间隔：指数增长并加入 ±20% 抖动"""
+        interval = self.POLL_INTERVAL
+        while True:
+            yield interval * (0.8 + random.random() * 0.4)
+            interval = min(interval * self.POLL_BACKOFF, self.MAX_POLL_INTERVAL)
+
+    def record(self, size_bytes: int, elapsed: float):
+        """记录一次激活耗时"""
+        try:
+            metrics.observe(
+                self._metric_name(self.size_bucket(size_bytes)), elapsed, self.DURATION_BUCKETS
+            )
+        except Exception as e:
+            logger.warning(f"【FileActivation】- 记录激活耗时失败: {str(e)}")
+
+    @classmethod
+    def report(cls) -> dict:
+        """各文件大小分桶的激活耗时直方图"""
+        buckets = [f"le_{b}mb" for b in cls.SIZE_BUCKETS_MB] + [f"gt_{cls.SIZE_BUCKETS_MB[-1]}mb"]
+        return {
+            bucket: metrics.get_histogram(cls._metric_name(bucket), cls.DURATION_BUCKETS)
+            for bucket in buckets
+        }
+
+
+# 全局估算器实例
+activation_estimator = FileActivationEstimator()
@@ -0,0 +1,202 @@
+import time
+from typing import Optional, Tuple
+from config import Settings
+from app.db.redis_decorators import REDIS_TASK_DB, get_redis_client
+from app.services.google_vision import AsyncGoogleVisionService
+from app.services.logger import get_logger
+from app.services.metrics import metrics
+
+logger = get_logger()
+
+
+class GeminiFileCache:
+    """
+    已上传 Gemini 文件的复用缓存
+    - 文件句柄：gemini_file:{content_hash}（Hash），字段 name、api_key（上传账号）、expire_at、refcount，随远端文件过期
+    - 待清理：gemini_file_sweep（Sorted Set），成员为引用计数归零的 content_hash，分数为归零时间
+    同一视频内容的重试、重复提交与并发任务共享同一个远端文件，任务结束只释放引用；
+    远端文件只能由上传它的账号访问，复用时固定使用该账号；
+    引用计数归零且空闲超过 FILE_CACHE_IDLE_TTL 后由后台清理删除远端文件
+    """
+
+    METRIC_NAME = "gemini_file_cache"
+    SWEEP_KEY = "gemini_file_sweep"
+
+    # 获取引用：文件未过期（预留安全余量）时引用计数 +1 并移出待清理集合
+    ACQUIRE_SCRIPT = """
+    local entry = redis.call('HMGET', KEYS[1], 'name', 'api_key', 'expire_at')
+    if not entry[1] then
+        return false
+    end
+    if tonumber(entry[3] or '0') <= tonumber(ARGV[1]) then
+        return false
+    end
+    redis.call('HINCRBY', KEYS[1], 'refcount', 1)
+    redis.call('ZREM', KEYS[2], ARGV[2])
+    return {entry[1], entry[2] or ''}
+    """
+
+    # 登记新上传的文件，已有其他任务登记时不覆盖
+    REGISTER_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'name', ARGV[1], 'expire_at', ARGV[2], 'api_key', ARGV[3], 'refcount', 1)
+    redis.call('EXPIREAT', KEYS[1], tonumber(ARGV[2]))
+    return 1
+    """
+
+    # 释放引用：计数归零时加入待清理集合
+    RELEASE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return -1
+    end
+    local refcount = redis.call('HINCRBY', KEYS[1], 'refcount', -1)
+    if refcount <= 0 then
+        redis.call('HSET', KEYS[1], 'refcount', 0)
+        redis.call('ZADD', KEYS[2], ARGV[1], ARGV[2])
+    end
+    return refcount
+    """
+
+    # 作废：远端文件已失效时删除句柄（仅当句柄仍指向该文件）
+    INVALIDATE_SCRIPT = """
+    if redis.call('HGET', KEYS[1], 'name') == ARGV[1] then
+        redis.call('DEL', KEYS[1])
+    end
+    redis.call('ZREM', KEYS[2], ARGV[2])
+    return 1
+    """
+
+    # 认领待清理文件：引用计数仍为 0 时删除句柄并返回远端文件名与上传账号
+    CLAIM_SCRIPT = """
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    local refcount = tonumber(redis.call('HGET', KEYS[1], 'refcount') or '-1')
+    if refcount ~= 0 then
+        return false
+    end
+    local entry = redis.call('HMGET', KEYS[1], 'name', 'api_key')
+    redis.call('DEL', KEYS[1])
+    return {entry[1], entry[2] or ''}
+    """
+
+    def __init__(self):
+        self.enabled = Settings.FILE_CACHE_ENABLED
+        self.idle_ttl = Settings.FILE_CACHE_IDLE_TTL
+        self.expiry_margin = Settings.FILE_CACHE_EXPIRY_MARGIN
+        self.redis = get_redis_client(db=REDIS_TASK_DB)
+        self._acquire = self.redis.register_script(self.ACQUIRE_SCRIPT)
+        self._register = self.redis.register_script(self.REGISTER_SCRIPT)
+        self._release = self.redis.register_script(self.RELEASE_SCRIPT)
+        self._invalidate = self.redis.register_script(self.INVALIDATE_SCRIPT)
+        self._claim = self.redis.register_script(self.CLAIM_SCRIPT)
+
+    @staticmethod
+    def _file_key(content_hash: str) -> str:
+        return f"gemini_file:{content_hash}"
+
+    @staticmethod
+    def _expire_at(google_file) -> int:
+        """远端文件的过期时间戳，SDK 未返回时按 Files API 的 48 小时保留期估算"""
+        expiration_time = getattr(google_file, "expiration_time", None)
+        if expiration_time:
+            return int(expiration_time.timestamp())
+        return int(time.time()) + 48 * 3600
+
+    async def acquire(
+        self, content_hash: Optional[str], video_path: str, account_pool
+    ) -> Tuple[object, bool, AsyncGoogleVisionService]:
+        """
+        获取视频对应的远端文件，优先复用仍有效的缓存文件，否则选择负载最低的账号上传并登记
+        Args:
+            content_hash: 视频内容哈希
+            video_path: 本地视频路径
+            account_pool: 账号池（AccountPool）
+        Returns:
+            tuple: (google_file, 是否由缓存管理, 绑定文件所属账号的 AsyncGoogleVisionService)
+                   由缓存管理的文件结束时只释放引用
+        """
+        if self.enabled and content_hash:
+            key = self._file_key(content_hash)
+            entry = self._acquire(
+                keys=[key, self.SWEEP_KEY],
+                args=[int(time.time()) + self.expiry_margin, content_hash],
+            )
+            if entry:
+                name, api_key = entry
+                if account_pool.is_available(api_key):
+                    vision_service = AsyncGoogleVisionService(api_key, account_pool)
+                    try:
+                        google_file = await vision_service.client.aio.files.get(name=name)
+                        if google_file.state.name == "ACTIVE":
+                            metrics.incr(self.METRIC_NAME, "hit")
+                            logger.info(f"【FileCache】- 复用已上传的谷歌文件: {name}")
+                            return google_file, True, vision_service
+                        logger.warning(f"【FileCache】- 缓存文件状态异常: {name}, state={google_file.state.name}")
+                    except Exception as e:
+                        logger.warning(f"【FileCache】- 缓存文件已失效: {name}, error={str(e)}")
+                    metrics.incr(self.METRIC_NAME, "invalid")
+                    self._invalidate(keys=[key, self.SWEEP_KEY], args=[name, content_hash])
+                else:
+                    # 上传该文件的账号当天不可用，释放引用后改用其他账号重新上传
+                    logger.warning(f"【FileCache】- 缓存文件所属账号不可用，重新上传: {name}")
+                    metrics.incr(self.METRIC_NAME, "account_unavailable")
+                    self._release(keys=[key, self.SWEEP_KEY], args=[time.time(), content_hash])
+            metrics.incr(self.METRIC_NAME, "miss")
+
+        api_key = await account_pool.acquire(record=False)
+        vision_service = AsyncGoogleVisionService(api_key, account_pool)
+        google_file = await vision_service.upload_file(video_path)
+        if self.enabled and content_hash:
+            registered = self._register(
+                keys=[self._file_key(content_hash)],
+                args=[google_file.name, self._expire_at(google_file), api_key],
+            )
+            return google_file, bool(registered), vision_service
+        return google_file, False, vision_service
+
+    async def release(self, content_hash: Optional[str], google_file, cached: bool, vision_service):
+        """任务结束：缓存管理的文件释放引用，其余文件直接删除"""
+        if not cached:
+            await vision_service.delete_google_file(google_file=google_file)
+            return
+        refcount = self._release(
+            keys=[self._file_key(content_hash), self.SWEEP_KEY],
+            args=[time.time(), content_hash],
+        )
+        logger.info(f"【FileCache】- 释放谷歌文件引用: {google_file.name}, refcount={refcount}")
+
+    async def sweep(self, account_pool, batch_size: int = 100) -> int:
+        """删除引用计数归零且空闲超过 idle_ttl 的远端文件，返回删除数量"""
+        due = self.redis.zrangebyscore(
+            self.SWEEP_KEY, "-inf", time.time() - self.idle_ttl, start=0, num=batch_size
+        )
+        deleted = 0
+        for content_hash in due:
+            entry = self._claim(keys=[self._file_key(content_hash), self.SWEEP_KEY], args=[content_hash])
+            if not entry:
+                continue
+            name, api_key = entry
+            try:
+                vision_service = AsyncGoogleVisionService(api_key, account_pool)
+                await vision_service.client.aio.files.delete(name=name)
+                deleted += 1
+                logger.info(f"【FileCache】- 已清理空闲的谷歌文件: {name}")
+            except Exception as e:
+                # 文件可能已过期或被删除，句柄已移除，无需重试
+                logger.warning(f"【FileCache】- 清理谷歌文件失败: {name}, error={str(e)}")
+        return deleted
+
+    @classmethod
+    def report(cls) -> dict:
+        """文件复用统计：命中、未命中与失效次数"""
+        counters = metrics.get_counters(cls.METRIC_NAME)
+        hits = int(counters.get("hit", 0))
+        misses = int(counters.get("miss", 0))
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "invalid": int(counters.get("invalid", 0)),
+            "hit_rate": round(hits / total, 4) if total else 0,
+        }
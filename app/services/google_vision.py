@@ -1,15 +1,30 @@
 from google import genai
-from google.api_core import retry
+from google.api_core import retry, retry_async
 from google.genai import types
+import asyncio
+import json
 import time
 import os
+import mimetypes
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Optional, Tuple
 from app.services.logger import get_logger
 from config import Settings
-from app.prompts.prompt_manager import PromptManager
+from app.prompts.prompt_manager import prompt_manager
+from app.services.client_registry import GenaiClientRegistry
+from app.services.metrics import metrics
+from app.services.file_activation import activation_estimator
+from app.services.json_guard import JsonGuard, IncrementalJsonParser
+from app.services.video_service import VideoService
+from app.services.rate_limiter import RateLimiter
+from app.services.token_estimator import token_estimator
 
 # 初始化logger
 logger = get_logger()
 
+# 当前任务累计消耗的 token 数（prompt + 输出），由消费者在处理任务时设置，用于按用户统计 token 预算
+task_token_usage: ContextVar[Optional[dict]] = ContextVar("task_token_usage", default=None)
+
 class GoogleTagGenerationError(Exception):
     """Google标签生成异常"""
     def __init__(self, message):
@@ -17,10 +32,16 @@ class GoogleTagGenerationError(Exception):
         super().__init__(self.message)
 
 class GoogleVisionService:
-    def __init__(self):
+    def __init__(self, api_key: str = None, account_pool=None):
+        """
+        Args:
+            api_key: 使用的 API 密钥，默认 Settings.API_KEY
+            account_pool: 账号池（AccountPool），传入时生成请求前按账号配额排队，限流时冷却该账号
+        """
         # 初始化Google Vision API客户端
         self.client = None
-        self.api_key = Settings.API_KEY
+        self.api_key = api_key or Settings.API_KEY
+        self.account_pool = account_pool
         self._init_client()
         self.max_retries = 10  # 最大重试次数
         self.retry_interval = 1  # 重试间隔（秒）
@@ -56,13 +77,8 @@ class GoogleVisionService:
     def _init_client(self):
         """初始化客户端"""
         try:
-            # 创建客户端
-            self.client = genai.Client(
-                api_key=Settings.API_KEY,
-            )
-            logger.info(
-                f"【Google】- 成功初始化Google API客户端，使用付费API密钥：{self.api_key}"
-            )
+            # 复用进程内同一密钥的客户端
+            self.client = GenaiClientRegistry.get(self.api_key)
         except Exception as e:
             err_msg = f"【Google】- 初始化Google API客户端失败: {str(e)}"
             logger.error(err_msg)
@@ -70,79 +86,91 @@ class GoogleVisionService:
         
     def delete_local_file(self, file_path: str):
         """删除本地文件"""
-        if os.path.exists(file_path):
-            # 删除文件
-            os.remove(file_path)
-            logger.info(f"【本地】- 已清理本地文件：{file_path}")
-
-            # 获取文件所在目录
-            dir_path = os.path.dirname(file_path)
-
-            # 删除上层目录
-            try:
-                os.rmdir(dir_path)  # 尝试删除目录
-                logger.info(f"【本地】- 已清理上层目录：{dir_path}")
-            except OSError as e:
-                if e.errno == 39:  # 39 表示目录不为空
-                    logger.info(f"【本地】- 上层目录不为空，无法删除：{dir_path}")
-                else:
-                    logger.error(f"【本地】- 删除上层目录时出错：{e}")
-        else:
-            logger.warning(f"【本地】- 文件不存在，无法删除：{file_path}")
+        VideoService.delete_local_file(file_path)
 
     def get_system_prompt_by_dim(self, dim: str) -> str:
         """根据场景获取系统提示词"""
         try:
-            # 提示词管理器
-            pm = PromptManager()
-            return pm.get_prompt(dim)
+            # 提示词管理器（进程内单例，渲染结果按模板修改时间缓存）
+            return prompt_manager.get_prompt(dim)
         except Exception as e:
             err_msg = f"【prompt-manager】- 根据场景获取系统提示词错误: {str(e)}"
             logger.info(err_msg)
             raise Exception(err_msg)
     
-    def _wait_for_file_active(self, file_name: str, timeout: int = 600) -> bool:
+    def _wait_for_file_active(self, file_name: str, timeout: int = 600, initial_delay: float = 0) -> bool:
         """
         等待文件状态变为 ACTIVE
+        首次检查前等待 initial_delay 秒，之后按指数退避加抖动轮询，状态为 FAILED 时立即返回
         Args:
             file_name: 文件名
             timeout: 超时时间（秒）
+            initial_delay: 首次检查前的等待时间（秒）
         Returns:
             bool: 文件是否激活
         """
         start_time = time.time()
+        time.sleep(initial_delay)
+        intervals = activation_estimator.poll_intervals()
         while True:
             try:
                 file_info = self.client.files.get(name=file_name)
                 if file_info.state.name == "ACTIVE":
                     return True
+                if file_info.state.name == "FAILED":
+                    logger.error(f"【Google】- 文件处理失败：{file_name}, error={getattr(file_info, 'error', None)}")
+                    return False
                 
                 # 检查是否超时
-                if time.time() - start_time > timeout:
+                elapsed = time.time() - start_time
+                if elapsed > timeout:
                     logger.error(f"【Google】- 等待文件激活超时：{file_name}")
                     return False
                 
                 # 等待一段时间后重试
-                time.sleep(self.retry_interval)
+                time.sleep(min(next(intervals), timeout - elapsed))
                 
             except Exception as e:
                 logger.error(f"【Google】- 检查文件状态失败：{str(e)}")
                 return False
 
+    # 随请求发送的数据上限（Gemini 单次请求约 20MB，预留提示词与编码的余量）
+    INLINE_REQUEST_LIMIT_MB = 18
+
+    @classmethod
+    def is_inline_eligible(cls, file_path: str) -> bool:
+        """视频是否小于 INLINE_VIDEO_MAX_MB，可随请求直接发送而不经过 Files API"""
+        max_mb = min(Settings.INLINE_VIDEO_MAX_MB, cls.INLINE_REQUEST_LIMIT_MB)
+        return max_mb > 0 and os.path.getsize(file_path) <= max_mb * 1024 * 1024
+
+    def load_inline_video(self, file_path: str) -> types.Part:
+        """读取视频为随请求发送的数据，各维度的请求复用同一个对象"""
+        mime_type = mimetypes.guess_type(file_path)[0] or "video/mp4"
+        with open(file_path, "rb") as f:
+            return types.Part.from_bytes(data=f.read(), mime_type=mime_type)
+
     @retry.Retry(predicate=is_retryable)
     def upload_file(self, file_path: str):
         """上传文件"""
         try:
+            # 按文件大小与视频时长估算首次检查前的等待时间
+            size_bytes = os.path.getsize(file_path)
+            duration = VideoService.get_video_duration(file_path)
+            initial_delay = activation_estimator.initial_delay(size_bytes, duration)
             # 上传文件
             video_file = self.client.files.upload(file=file_path)
-            # 等待一段时间后重试
-            time.sleep(self.retry_interval * 6)
+            upload_end = time.time()
             # 等待文件状态变为 ACTIVE
-            if not self._wait_for_file_active(video_file.name):
+            if not self._wait_for_file_active(video_file.name, initial_delay=initial_delay):
                 err_msg = f"【Google】- 文件未能激活：{video_file.name}"
                 logger.error(err_msg)
                 raise Exception(err_msg)
 
+            activation_time = time.time() - upload_end
+            activation_estimator.record(size_bytes, activation_time)
+            # 登记视频 token 数估算，生成请求前据此预占限流配额
+            token_estimator.record_upload(video_file.name, duration, size_bytes)
+            logger.info(f"【Google】- 文件已激活：{video_file.name}, 耗时={round(activation_time, 3)}秒")
             return video_file
         except Exception as e:
             err_msg = f"【Google】- 文件上传失败：{str(e)}"
@@ -173,42 +201,514 @@ class GoogleVisionService:
             raise Exception(e)
 
         try:
-            # 生成内容
+            # 生成内容（系统提示词只通过 system_instruction 发送一次）
+            start_time = time.time()
             response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[google_file, system_prompt + user_prompt],
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,
-                    top_p=0.95,
-                    temperature=1,
-                    max_output_tokens=8192,
-                    response_mime_type="application/json",
-                )
+                model=Settings.GEMINI_MODEL,
+                contents=[google_file, user_prompt],
+                config=self._build_generate_config(
+                    system_prompt, response_json_schema=self._response_schema(dim)
+                ),
             )
+            self._record_usage(response, "uncached", time.time() - start_time)
         except Exception as e:
             err_msg = f"【Google】- 生成标签失败：{str(e)}"
             logger.error(err_msg)
             raise Exception(err_msg)
 
+        return self._check_response(response, self._response_schema(dim))
+
+    def _build_generate_config(
+        self,
+        system_prompt: str = None,
+        cached_content: str = None,
+        response_json_schema: dict = None,
+        max_output_tokens: int = 8192,
+    ) -> types.GenerateContentConfig:
+        """
+        构建生成标签的请求配置
+        使用上下文缓存时请求中不能再设置 system_instruction，系统提示词随 contents 发送
+        """
+        return types.GenerateContentConfig(
+            system_instruction=None if cached_content else system_prompt,
+            cached_content=cached_content,
+            top_p=0.95,
+            temperature=1,
+            max_output_tokens=max_output_tokens,
+            response_mime_type="application/json",
+            response_json_schema=response_json_schema,
+        )
+
+    @staticmethod
+    def _build_contents(google_file, system_prompt: str, user_prompt: str, cached_content: str = None) -> list:
+        """构建请求内容：使用上下文缓存时视频已在缓存中，系统提示词随内容发送"""
+        if cached_content:
+            return [system_prompt + "\n\n" + user_prompt]
+        return [google_file, user_prompt]
+
+    @staticmethod
+    def _response_schema(dim: str):
+        """维度模板对应的输出结构（JSON Schema），没有结构文件时返回 None"""
+        schema = prompt_manager.get_response_schema(dim)
+        return schema["schema"] if schema else None
+
+    def _combined_schema(self, dimensions: list) -> dict:
+        """合并生成的输出结构：每个维度一个键，值为该维度模板的输出结构"""
+        return {
+            "type": "object",
+            "properties": {dim: self._response_schema(dim) or {"type": "object"} for dim in dimensions},
+            "required": list(dimensions),
+        }
+
+    @staticmethod
+    def _is_truncated(response) -> bool:
+        """输出是否因达到 max_output_tokens 被截断"""
+        candidates = getattr(response, "candidates", None) or []
+        return bool(candidates) and candidates[0].finish_reason == types.FinishReason.MAX_TOKENS
+
+    def _split_combined_response(self, response, dimensions: list) -> dict:
+        """
+        拆分合并生成的输出，逐维度按各自的输出结构校验
+        输出被截断时先本地修复，最后一个维度可能不完整，不予采用
+        Returns:
+            dict: {维度: 标签结果}，只包含输出中合法的维度
+        Raises:
+            GoogleTagGenerationError: 输出为空或修复后仍不是 JSON 对象
+        """
+        if not response or not response.text:
+            raise GoogleTagGenerationError("生成的响应为空")
+        result, _ = JsonGuard.parse(response.text)
+        if not isinstance(result, dict):
+            raise GoogleTagGenerationError("合并生成的输出不是 JSON 对象")
+        if self._is_truncated(response) and result:
+            logger.warning("【Google】- 合并生成的输出被截断，丢弃最后一个维度")
+            result.pop(list(result)[-1])
+        valid = {}
+        for dim in dimensions:
+            if dim not in result:
+                continue
+            errors = JsonGuard.validate(result[dim], self._response_schema(dim) or {"type": "object"})
+            if errors:
+                logger.warning(f"【Google】- 合并生成的 {dim} 维度不符合输出结构: {errors[:3]}")
+                continue
+            valid[dim] = result[dim]
+        return valid
+
+    # 生成耗时直方图的桶上界（秒）
+    GENERATION_LATENCY_BUCKETS = (1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120)
+
+    @staticmethod
+    def _record_usage(response, mode: str, elapsed: float):
+        """
+        记录生成请求的 token 用量与耗时
+        Args:
+            mode: cached-使用上下文缓存，uncached-直接发送视频
+        """
+        try:
+            usage = getattr(response, "usage_metadata", None)
+            prompt_tokens = int(getattr(usage, "prompt_token_count", 0) or 0)
+            output_tokens = int(getattr(usage, "candidates_token_count", 0) or 0)
+            metrics.incr_many(f"generation:{mode}", {
+                "calls": 1,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": int(getattr(usage, "cached_content_token_count", 0) or 0),
+                "output_tokens": output_tokens,
+                "latency": float(elapsed),
+            })
+            task_usage = task_token_usage.get()
+            if task_usage is not None:
+                task_usage["tokens"] += prompt_tokens + output_tokens
+            metrics.observe(
+                f"generation_latency:{mode}", elapsed, GoogleVisionService.GENERATION_LATENCY_BUCKETS
+            )
+        except Exception as e:
+            logger.warning(f"【Google】- 记录生成用量失败: {str(e)}")
+
+    @staticmethod
+    def usage_report() -> dict:
+        """使用与不使用上下文缓存时，每次生成请求的平均 token 用量与耗时"""
+        combined = metrics.get_counters("dimension_mode")
+        report = {
+            "combined": {
+                field: int(combined.get(field, 0))
+                for field in ("combined_success", "combined_partial", "combined_fallback")
+            }
+        }
+        for mode in ("cached", "uncached"):
+            counters = metrics.get_counters(f"generation:{mode}")
+            calls = int(counters.get("calls", 0))
+            report[mode] = {
+                "calls": calls,
+                **{
+                    f"avg_{field}": round(counters.get(field, 0) / calls, 3) if calls else 0
+                    for field in ("prompt_tokens", "cached_tokens", "output_tokens", "latency")
+                },
+                "latency_histogram": metrics.get_histogram(
+                    f"generation_latency:{mode}", GoogleVisionService.GENERATION_LATENCY_BUCKETS
+                ),
+            }
+        return report
+
+    def _check_response(self, response, schema: dict = None) -> str:
+        """
+        检查模型响应，返回合法的 JSON 文本
+        无法解析时先本地修复（补全括号、去掉尾随逗号等），修复后仍不合法或不符合输出结构时才丢弃并重新生成
+        """
         # 检查响应是否为空
         try:
             if not response or not response.text:
                 err_msg = "生成的响应为空"
                 logger.error(f"【Google】- {err_msg}")
+                JsonGuard.record_discard()
                 raise GoogleTagGenerationError(err_msg)
         except GoogleTagGenerationError as e:
             raise GoogleTagGenerationError(e)
         
-        # 检查响应是否为有效的 JSON 格式
+        # 检查响应是否为有效的 JSON 格式并符合输出结构
+        data, errors = JsonGuard.parse(response.text, schema)
+        if data is None or errors:
+            err_msg = f"生成的响应不是有效的 JSON 格式或不符合输出结构: {errors[:3]}"
+            logger.error(f"【Google】- {err_msg}")
+            JsonGuard.record_discard()
+            raise GoogleTagGenerationError(err_msg)
+
+        return json.dumps(data, ensure_ascii=False)
+
+
+class AsyncGoogleVisionService(GoogleVisionService):
+    """
+    GoogleVisionService 的异步版本
+    基于 SDK 的 client.aio 异步客户端，文件激活轮询使用 asyncio.sleep，
+    可在消费者和 FastAPI 路由的事件循环中直接 await，不会阻塞其他协程
+    """
+
+    async def _wait_for_file_active(self, file_name: str, timeout: int = 600, initial_delay: float = 0) -> bool:
+        """
+        等待文件状态变为 ACTIVE
+        首次检查前等待 initial_delay 秒，之后按指数退避加抖动轮询，状态为 FAILED 时立即返回
+        Args:
+            file_name: 文件名
+            timeout: 超时时间（秒）
+            initial_delay: 首次检查前的等待时间（秒）
+        Returns:
+            bool: 文件是否激活
+        """
+        start_time = time.time()
+        await asyncio.sleep(initial_delay)
+        intervals = activation_estimator.poll_intervals()
+        while True:
+            try:
+                file_info = await self.client.aio.files.get(name=file_name)
+                if file_info.state.name == "ACTIVE":
+                    return True
+                if file_info.state.name == "FAILED":
+                    logger.error(f"【Google】- 文件处理失败：{file_name}, error={getattr(file_info, 'error', None)}")
+                    return False
+
+                # 检查是否超时
+                elapsed = time.time() - start_time
+                if elapsed > timeout:
+                    logger.error(f"【Google】- 等待文件激活超时：{file_name}")
+                    return False
+
+                # 等待一段时间后重试
+                await asyncio.sleep(min(next(intervals), timeout - elapsed))
+
+            except Exception as e:
+                logger.error(f"【Google】- 检查文件状态失败：{str(e)}")
+                return False
+
+    @retry_async.AsyncRetry(predicate=GoogleVisionService.is_retryable)
+    async def upload_file(self, file_path: str):
+        """上传文件"""
         try:
-            import json
-            json.loads(response.text)
-        except (GoogleTagGenerationError, json.JSONDecodeError) as e:
-            err_msg = f"生成的响应不是有效的 JSON 格式: {str(e)}"
+            # 按文件大小与视频时长估算首次检查前的等待时间
+            size_bytes = os.path.getsize(file_path)
+            duration = VideoService.get_video_duration(file_path)
+            initial_delay = activation_estimator.initial_delay(size_bytes, duration)
+            # 上传文件
+            video_file = await self.client.aio.files.upload(file=file_path)
+            upload_end = time.time()
+            # 等待文件状态变为 ACTIVE
+            if not await self._wait_for_file_active(video_file.name, initial_delay=initial_delay):
+                err_msg = f"【Google】- 文件未能激活：{video_file.name}"
+                logger.error(err_msg)
+                raise Exception(err_msg)
+
+            activation_time = time.time() - upload_end
+            activation_estimator.record(size_bytes, activation_time)
+            # 登记视频 token 数估算，生成请求前据此预占限流配额
+            token_estimator.record_upload(video_file.name, duration, size_bytes)
+            logger.info(f"【Google】- 文件已激活：{video_file.name}, 耗时={round(activation_time, 3)}秒")
+            return video_file
+        except Exception as e:
+            err_msg = f"【Google】- 文件上传失败：{str(e)}"
+            logger.error(err_msg)
+            raise Exception(err_msg)
+
+    @retry_async.AsyncRetry(predicate=GoogleVisionService.is_retryable)
+    async def delete_google_file(self, google_file):
+        """删除 google 文件"""
+        try:
+            await self.client.aio.files.delete(name=google_file.name)
+            logger.info(f"【Google】- 已删除谷歌文件: {google_file.name}")
+        except Exception as e:
+            err_msg = f"【Google】- 删除文件失败: {str(e)}"
+            logger.error(err_msg)
+            raise Exception(err_msg)
+
+    async def _admit(self, google_file, *prompts: str) -> Tuple[Optional[RateLimiter], str, int]:
+        """
+        按估算的输入 token 数预占当前密钥的每分钟限流配额，配额不足时等待
+        每分钟请求数上限取账号池中该密钥的分钟配额，与账号池的分钟窗口一致，未配置时使用 RATE_LIMIT_RPM
+        Returns:
+            tuple: (限流器, 预占时的窗口, 预占的 token 数)，用于 _settle()
+        """
+        if not Settings.RATE_LIMIT_ENABLED:
+            return None, "", 0
+        quota = self.account_pool.minute_quota(self.api_key) if self.account_pool else 0
+        limiter = RateLimiter.for_key(self.api_key, quota)
+        estimated = token_estimator.estimate(google_file, *prompts)
+        window, waited = await limiter.acquire_async(estimated)
+        if waited >= 1:
+            logger.info(f"【Google】- 等待限流配额 {round(waited, 2)}秒, 预占 token={estimated}")
+        return limiter, window, estimated
+
+    @staticmethod
+    async def _settle(admission: Tuple[Optional[RateLimiter], str, int], response, google_file, *prompts: str):
+        """用 usage_metadata 中的实际输入 token 数结算预占的配额，并校正该视频的 token 估算"""
+        usage = getattr(response, "usage_metadata", None)
+        actual = int(getattr(usage, "prompt_token_count", 0) or 0)
+        if not actual:
+            return
+        try:
+            token_estimator.observe(google_file, actual, *prompts)
+            limiter, window, estimated = admission
+            if limiter:
+                await limiter.settle_async(window, estimated, actual)
+        except Exception as e:
+            logger.warning(f"【Google】- 结算限流配额失败: {str(e)}")
+
+    async def create_context_cache(self, google_file, ttl: int, display_name: str = None) -> str:
+        """
+        创建包含视频的上下文缓存，同一任务的多个维度共享，视频 token 只按缓存计费一次
+        Args:
+            google_file: 已激活的谷歌文件
+            ttl: 缓存有效期（秒）
+        Returns:
+            str: 缓存名称
+        """
+        cache = await self.client.aio.caches.create(
+            model=Settings.GEMINI_MODEL,
+            config=types.CreateCachedContentConfig(
+                contents=[google_file],
+                ttl=f"{int(ttl)}s",
+                display_name=display_name,
+            ),
+        )
+        logger.info(f"【Google】- 已创建上下文缓存: {cache.name}, ttl={ttl}秒")
+        return cache.name
+
+    async def extend_context_cache(self, cache_name: str, ttl: int):
+        """延长上下文缓存的有效期"""
+        await self.client.aio.caches.update(
+            name=cache_name,
+            config=types.UpdateCachedContentConfig(ttl=f"{int(ttl)}s"),
+        )
+
+    async def delete_context_cache(self, cache_name: str):
+        """删除上下文缓存"""
+        await self.client.aio.caches.delete(name=cache_name)
+        logger.info(f"【Google】- 已删除上下文缓存: {cache_name}")
+
+    @retry_async.AsyncRetry(predicate=GoogleVisionService.is_retryable)
+    async def generate_tag(
+        self,
+        google_file,
+        dim: str,
+        user_prompt: str = "对视频内容进行理解，并按照规则生成标签",
+        cached_content: str = None,
+        stream: bool = None,
+    ) -> str:
+        """
+        生成标签
+        Args:
+            cached_content: 上下文缓存名称，传入时视频已在缓存中，请求只发送该维度的提示词
+            stream: 是否流式生成，默认 Settings.GENERATION_STREAM；流式时根对象闭合即返回，结构不合法时提前中止并重新生成
+        """
+        if Settings.GENERATION_STREAM if stream is None else stream:
+            async for event, payload in self.stream_tag(google_file, dim, user_prompt, cached_content):
+                if event == "result":
+                    return json.dumps(payload, ensure_ascii=False)
+
+        try:
+            system_prompt = self.get_system_prompt_by_dim(dim)
+        except Exception as e:
+            logger.error(e)
+            raise Exception(e)
+
+        # 按账号配额排队，文件只能由上传它的账号访问，因此固定使用当前账号
+        if self.account_pool:
+            await self.account_pool.acquire(self.api_key)
+        admission = await self._admit(google_file, system_prompt, user_prompt)
+
+        contents = self._build_contents(google_file, system_prompt, user_prompt, cached_content)
+
+        try:
+            # 生成内容（系统提示词只发送一次）
+            start_time = time.time()
+            response = await self.client.aio.models.generate_content(
+                model=Settings.GEMINI_MODEL,
+                contents=contents,
+                config=self._build_generate_config(
+                    system_prompt, cached_content, response_json_schema=self._response_schema(dim)
+                ),
+            )
+            self._record_usage(
+                response, "cached" if cached_content else "uncached", time.time() - start_time
+            )
+            await self._settle(admission, response, google_file, system_prompt, user_prompt)
+        except Exception as e:
+            if self.account_pool and self.account_pool.is_rate_limited(e):
+                self.account_pool.cooldown(self.api_key)
+            err_msg = f"【Google】- 生成标签失败：{str(e)}"
+            logger.error(err_msg)
+            raise Exception(err_msg)
+
+        return self._check_response(response, self._response_schema(dim))
+
+    async def stream_tag(
+        self,
+        google_file,
+        dim: str,
+        user_prompt: str = "对视频内容进行理解，并按照规则生成标签",
+        cached_content: str = None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        流式生成标签，边接收边增量解析（不做重试）
+        Yields:
+            tuple: ("section", (字段名, 字段值))-顶层字段完成时产出；("result", 完整结果)-根对象闭合时产出，之后不再读取剩余输出
+        Raises:
+            GoogleTagGenerationError: 输出结构已不合法（提前中止），或流结束时仍不完整且无法修复
+        """
+        try:
+            system_prompt = self.get_system_prompt_by_dim(dim)
+        except Exception as e:
+            logger.error(e)
+            raise Exception(e)
+
+        # 按账号配额排队，文件只能由上传它的账号访问，因此固定使用当前账号
+        if self.account_pool:
+            await self.account_pool.acquire(self.api_key)
+        admission = await self._admit(google_file, system_prompt, user_prompt)
+
+        schema = self._response_schema(dim)
+        parser = IncrementalJsonParser(schema)
+        mode = "cached" if cached_content else "uncached"
+        start_time = time.time()
+        stream = None
+        last_chunk = None
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=Settings.GEMINI_MODEL,
+                contents=self._build_contents(google_file, system_prompt, user_prompt, cached_content),
+                config=self._build_generate_config(
+                    system_prompt, cached_content, response_json_schema=schema
+                ),
+            )
+            async for chunk in stream:
+                last_chunk = chunk
+                for field in parser.feed(chunk.text or ""):
+                    yield "section", field
+                if parser.done:
+                    break
+        except ValueError as e:
+            metrics.incr(JsonGuard.METRIC_NAME, "stream_aborted")
+            JsonGuard.record_discard()
+            err_msg = f"流式输出结构不合法，提前中止: {str(e)}"
             logger.error(f"【Google】- {err_msg}")
             raise GoogleTagGenerationError(err_msg)
+        except Exception as e:
+            if self.account_pool and self.account_pool.is_rate_limited(e):
+                self.account_pool.cooldown(self.api_key)
+            err_msg = f"【Google】- 流式生成标签失败：{str(e)}"
+            logger.error(err_msg)
+            raise Exception(err_msg)
+        finally:
+            # 提前结束时关闭连接，不再接收剩余输出
+            if stream is not None and hasattr(stream, "aclose"):
+                try:
+                    await stream.aclose()
+                except Exception:
+                    pass
+            # 每个分块都带有截至当前的用量
+            if last_chunk is not None:
+                self._record_usage(last_chunk, mode, time.time() - start_time)
+                await self._settle(admission, last_chunk, google_file, system_prompt, user_prompt)
+
+        if parser.done:
+            metrics.incr(JsonGuard.METRIC_NAME, "valid")
+            yield "result", parser.result
+            return
+
+        # 流结束但根对象未闭合（如达到 max_output_tokens），尝试本地修复
+        data, errors = JsonGuard.parse(parser.text, schema)
+        if data is None or errors:
+            JsonGuard.record_discard()
+            err_msg = f"流式输出不完整且无法修复: {errors[:3]}"
+            logger.error(f"【Google】- {err_msg}")
+            raise GoogleTagGenerationError(err_msg)
+        yield "result", data
+
+    async def generate_combined_tags(
+        self,
+        google_file,
+        dimensions: list,
+        user_prompt: str = "对视频内容进行理解，并按照各维度的规则生成标签",
+        cached_content: str = None,
+    ) -> dict:
+        """
+        一次请求生成多个维度的标签（DIMENSION_MODE=combined），不做重试，失败时由调用方回退为逐维度生成
+        Returns:
+            dict: {维度: 标签结果}，只包含输出中合法的维度；输出被截断时本地修复并丢弃最后一个维度，
+            缺失的维度由调用方逐维度补生成
+        Raises:
+            GoogleTagGenerationError: 输出为空或修复后仍不是 JSON 对象
+        """
+        system_prompt = prompt_manager.get_combined_prompt(dimensions)
+
+        # 按账号配额排队，一次请求只占用一次分钟配额
+        if self.account_pool:
+            await self.account_pool.acquire(self.api_key)
+        admission = await self._admit(google_file, system_prompt, user_prompt)
+
+        contents = self._build_contents(google_file, system_prompt, user_prompt, cached_content)
+
+        try:
+            start_time = time.time()
+            response = await self.client.aio.models.generate_content(
+                model=Settings.GEMINI_MODEL,
+                contents=contents,
+                config=self._build_generate_config(
+                    system_prompt,
+                    cached_content,
+                    response_json_schema=self._combined_schema(dimensions),
+                    max_output_tokens=Settings.COMBINED_MAX_OUTPUT_TOKENS,
+                ),
+            )
+            self._record_usage(
+                response, "cached" if cached_content else "uncached", time.time() - start_time
+            )
+            await self._settle(admission, response, google_file, system_prompt, user_prompt)
+        except Exception as e:
+            if self.account_pool and self.account_pool.is_rate_limited(e):
+                self.account_pool.cooldown(self.api_key)
+            err_msg = f"【Google】- 合并生成标签失败：{str(e)}"
+            logger.error(err_msg)
+            raise Exception(err_msg)
+
+        return self._split_combined_response(response, dimensions)
 
-        return response.text
         
 # 测试开启      
 if __name__ == "__main__":
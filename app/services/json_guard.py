@@ -0,0 +1,286 @@
+import json
+import re
+from typing import Any, List, Optional, Tuple
+from app.services.logger import get_logger
+from app.services.metrics import metrics
+
+logger = get_logger()
+
+
+class JsonGuard:
+    """
+    模型输出的 JSON 校验与本地修复
+    - 修复：去掉 Markdown 代码块与尾随逗号，补全被截断的字符串与括号，仍无法解析时回退到最后一个完整的元素
+    - 校验：按维度模板旁的 *.schema.json 校验结构，只支持其中用到的子集（type/properties/required/items/additionalProperties）
+    修复后仍不合法的输出才被丢弃并交由上层重新生成，丢弃的比例见 report()
+    """
+
+    METRIC_NAME = "json_guard"
+    # 回退到上一个完整元素的最大次数
+    MAX_CUTS = 20
+
+    _TYPES = {
+        "object": dict,
+        "array": list,
+        "string": str,
+        "number": (int, float),
+        "integer": int,
+        "boolean": bool,
+    }
+
+    @staticmethod
+    def _strip_fence(text: str) -> str:
+        """去掉 ```json ... ``` 代码块"""
+        text = text.strip()
+        match = re.match(r"^```(?:json)?\s*(.*?)\s*(?:```)?$", text, re.S)
+        return match.group(1) if match else text
+
+    @staticmethod
+    def _close(text: str) -> Tuple[str, List[int]]:
+        """
+        去掉尾随逗号并补全未闭合的字符串与括号
+        Returns:
+            tuple: (补全后的文本, 字符串外各逗号的位置)
+        """
+        stack = []
+        commas = []
+        in_string = False
+        escaped = False
+        out = []
+        for i, ch in enumerate(text):
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                out.append(ch)
+                continue
+            if ch == '"':
+                in_string = True
+            elif ch in "{[":
+                stack.append("}" if ch == "{" else "]")
+            elif ch in "}]":
+                # 去掉闭合括号前的尾随逗号
+                while out and out[-1].isspace():
+                    out.pop()
+                if out and out[-1] == ",":
+                    out.pop()
+                if stack:
+                    stack.pop()
+            elif ch == ",":
+                commas.append(i)
+            out.append(ch)
+
+        if in_string:
+            if escaped:
+                out.pop()
+            out.append('"')
+        closed = "".join(out).rstrip()
+        if stack and stack[-1] == "}":
+            # 截断在对象的键名或冒号之后时去掉未写完的键
+            closed = re.sub(r":\s*$", "", closed)
+            closed = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*$', r"\1", closed)
+        closed = re.sub(r",\s*$", "", closed)
+        return closed + "".join(reversed(stack)), commas
+
+    @classmethod
+    def repair(cls, text: str) -> Optional[Any]:
+        """
+        尝试修复无法解析的 JSON 文本
+        Returns:
+            解析结果，无法修复时返回 None
+        """
+        text = cls._strip_fence(text or "")
+        if not text:
+            return None
+        candidate = text
+        for _ in range(cls.MAX_CUTS):
+            closed, commas = cls._close(candidate)
+            try:
+                return json.loads(closed)
+            except json.JSONDecodeError:
+                pass
+            if not commas:
+                return None
+            # 回退到最后一个逗号之前，丢弃被截断的元素
+            candidate = candidate[:commas[-1]]
+        return None
+
+    @classmethod
+    def validate(cls, data: Any, schema: dict, path: str = "$") -> List[str]:
+        """按 schema 校验数据，返回错误列表（为空表示合法）"""
+        errors = []
+        expected = schema.get("type")
+        if expected:
+            py_type = cls._TYPES.get(expected)
+            # bool 是 int 的子类，数值类型不接受布尔值
+            if py_type and (not isinstance(data, py_type) or (expected in ("number", "integer") and isinstance(data, bool))):
+                return [f"{path}: 应为 {expected}"]
+
+        if isinstance(data, dict):
+            for key in schema.get("required", []):
+                if key not in data:
+                    errors.append(f"{path}: 缺少字段 {key}")
+            properties = schema.get("properties", {})
+            additional = schema.get("additionalProperties")
+            for key, value in data.items():
+                if key in properties:
+                    errors.extend(cls.validate(value, properties[key], f"{path}.{key}"))
+                elif isinstance(additional, dict):
+                    errors.extend(cls.validate(value, additional, f"{path}.{key}"))
+                elif additional is False:
+                    errors.append(f"{path}: 不允许的字段 {key}")
+        elif isinstance(data, list) and isinstance(schema.get("items"), dict):
+            for i, item in enumerate(data):
+                errors.extend(cls.validate(item, schema["items"], f"{path}[{i}]"))
+        return errors
+
+    @classmethod
+    def parse(cls, text: str, schema: Optional[dict] = None) -> Tuple[Any, List[str]]:
+        """
+        解析并校验模型输出，解析失败时先本地修复
+        Returns:
+            tuple: (解析结果, 错误列表)，无法解析时结果为 None
+        """
+        status = "valid"
+        try:
+            data = json.loads(text)
+        except (TypeError, json.JSONDecodeError):
+            data = cls.repair(text)
+            if data is None:
+                metrics.incr(cls.METRIC_NAME, "unparsable")
+                return None, ["无法解析为 JSON"]
+            status = "repaired"
+            logger.warning("【JsonGuard】- 模型输出不是合法的 JSON，已本地修复")
+
+        errors = cls.validate(data, schema) if schema else []
+        metrics.incr(cls.METRIC_NAME, "invalid" if errors else status)
+        return data, errors
+
+    @classmethod
+    def record_discard(cls):
+        """记录一次因输出不合法而丢弃（已付费的生成结果作废并重新生成）"""
+        metrics.incr(cls.METRIC_NAME, "discarded")
+
+    @classmethod
+    def report(cls) -> dict:
+        """输出校验统计：合法、修复、不合法、流式提前中止与丢弃次数，丢弃占比"""
+        counters = metrics.get_counters(cls.METRIC_NAME)
+        fields = ("valid", "repaired", "invalid", "unparsable", "stream_aborted", "discarded")
+        report = {field: int(counters.get(field, 0)) for field in fields}
+        total = sum(report[field] for field in fields[:-1])
+        report["discard_rate"] = round(report["discarded"] / total, 4) if total else 0
+        return report
+
+
+class IncrementalJsonParser:
+    """
+    流式输出的增量 JSON 解析
+    - feed() 逐段输入模型输出，返回本段内完成的顶层字段 [(key, value)]，每个字段完成时立即按输出结构校验
+    - 根对象闭合时 done 为 True，result 为完整结果，调用方无需等待流结束
+    - 结构已不合法（根不是对象、括号不匹配、字段无法解析或不符合输出结构）时抛出 ValueError，调用方可立即中止生成
+    """
+
+    def __init__(self, schema: Optional[dict] = None):
+        self.schema = schema or {}
+        self.done = False
+        self.result: Optional[dict] = None
+        self._text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._expect_key = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._fields: dict = {}
+
+    @property
+    def text(self) -> str:
+        """已输入的全部文本"""
+        return self._text
+
+    def _complete_field(self, end: int) -> Tuple[str, Any]:
+        """顶层字段的值在 end 处结束：解析并校验"""
+        if self._key is None or self._value_start is None:
+            raise ValueError("输出结构不合法: 缺少字段名或字段值")
+        key = self._key
+        try:
+            value = json.loads(self._text[self._value_start:end])
+        except json.JSONDecodeError as e:
+            raise ValueError(f"字段 {key} 无法解析: {str(e)}")
+        field_schema = self.schema.get("properties", {}).get(key)
+        if field_schema:
+            errors = JsonGuard.validate(value, field_schema, f"$.{key}")
+            if errors:
+                raise ValueError(f"字段 {key} 不符合输出结构: {errors[:3]}")
+        self._fields[key] = value
+        self._key = None
+        self._value_start = None
+        return key, value
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        if self.done or not chunk:
+            return []
+        self._text += chunk
+        completed = []
+        for i in range(self._pos, len(self._text)):
+            ch = self._text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._key = json.loads(self._text[self._key_start:i + 1])
+                        self._key_start = None
+                continue
+            if ch.isspace():
+                continue
+            if not self._stack:
+                if ch != "{":
+                    raise ValueError(f"输出不是 JSON 对象: {self._text[:20]!r}")
+                self._stack.append("}")
+                self._expect_key = True
+                continue
+
+            depth = len(self._stack)
+            if ch == '"':
+                self._in_string = True
+                if depth == 1 and self._expect_key:
+                    self._key_start = i
+                    self._expect_key = False
+            elif ch in "{[":
+                self._stack.append("}" if ch == "{" else "]")
+            elif ch in "}]":
+                if ch != self._stack[-1]:
+                    raise ValueError(f"输出结构不合法: 第 {i} 个字符处括号不匹配")
+                self._stack.pop()
+                if not self._stack:
+                    # 根对象闭合，尾随逗号之后的空字段直接忽略
+                    if self._value_start is not None:
+                        completed.append(self._complete_field(i))
+                    errors = JsonGuard.validate(self._fields, self.schema) if self.schema else []
+                    if errors:
+                        raise ValueError(f"输出不符合输出结构: {errors[:3]}")
+                    self.done = True
+                    self.result = self._fields
+                    self._pos = i + 1
+                    return completed
+            elif depth == 1:
+                if ch == ":":
+                    if self._key is None:
+                        raise ValueError("输出结构不合法: 缺少字段名")
+                    self._value_start = i + 1
+                elif ch == ",":
+                    completed.append(self._complete_field(i))
+                    self._expect_key = True
+                elif self._value_start is None:
+                    raise ValueError(f"输出结构不合法: 第 {i} 个字符处缺少字段名")
+        self._pos = len(self._text)
+        return completed
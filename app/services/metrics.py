@@ -0,0 +1,119 @@
+from typing import Dict, List, Sequence
+from app.db.redis_decorators import REDIS_TASK_DB, get_redis_client
+
+
+class Metrics:
+    """
+    Redis 指标存储，多个进程共享
+    - 计数器（Hash）：metrics:counter:{name}，字段为计数项
+    - 直方图（Hash）：metrics:histogram:{name}，字段 le:{上界} 为各桶计数，另有 count、sum、max
+    """
+
+    # 直方图更新脚本：各桶计数、总数、总和与最大值
+    OBSERVE_SCRIPT = """
+    redis.call('HINCRBY', KEYS[1], ARGV[2], 1)
+    redis.call('HINCRBY', KEYS[1], 'count', 1)
+    redis.call('HINCRBYFLOAT', KEYS[1], 'sum', ARGV[1])
+    local current = tonumber(redis.call('HGET', KEYS[1], 'max') or '-1')
+    if tonumber(ARGV[1]) > current then
+        redis.call('HSET', KEYS[1], 'max', ARGV[1])
+    end
+    return 1
+    """
+
+    def __init__(self):
+        self.redis = get_redis_client(db=REDIS_TASK_DB)
+        self._observe = self.redis.register_script(self.OBSERVE_SCRIPT)
+
+    @staticmethod
+    def _counter_key(name: str) -> str:
+        return f"metrics:counter:{name}"
+
+    @staticmethod
+    def _histogram_key(name: str) -> str:
+        return f"metrics:histogram:{name}"
+
+    def incr(self, name: str, field: str, amount: float = 1):
+        """计数器累加"""
+        if isinstance(amount, int):
+            self.redis.hincrby(self._counter_key(name), field, amount)
+        else:
+            self.redis.hincrbyfloat(self._counter_key(name), field, amount)
+
+    def incr_many(self, name: str, amounts: Dict[str, float]):
+        """一次累加多个计数项"""
+        pipeline = self.redis.pipeline(transaction=False)
+        for field, amount in amounts.items():
+            if isinstance(amount, int):
+                pipeline.hincrby(self._counter_key(name), field, amount)
+            else:
+                pipeline.hincrbyfloat(self._counter_key(name), field, amount)
+        pipeline.execute()
+
+    def get_counters(self, name: str) -> Dict[str, float]:
+        """读取计数器的全部计数项"""
+        return {
+            field: float(value)
+            for field, value in self.redis.hgetall(self._counter_key(name)).items()
+        }
+
+    def observe(self, name: str, value: float, buckets: Sequence[float]):
+        """
+        记录一次观测值
+        Args:
+            name: 直方图名称
+            value: 观测值
+            buckets: 升序的桶上界，超过最大上界时计入 le:inf
+        """
+        bucket = next((b for b in buckets if value <= b), "inf")
+        self._observe(keys=[self._histogram_key(name)], args=[value, f"le:{bucket}"])
+
+    def get_histogram(self, name: str, buckets: Sequence[float] = None) -> dict:
+        """
+        读取直方图
+        Returns:
+            dict: {"count", "sum", "avg", "max", "buckets": {上界: 计数}, "p50", "p90", "p99"}
+        """
+        raw = self.redis.hgetall(self._histogram_key(name))
+        count = int(raw.get("count", 0))
+        total = float(raw.get("sum", 0))
+        counts = {
+            field.split(":", 1)[1]: int(value)
+            for field, value in raw.items()
+            if field.startswith("le:")
+        }
+        bounds = [str(b) for b in buckets] + ["inf"] if buckets else sorted(
+            counts, key=lambda b: float(b)
+        )
+        histogram = {
+            "count": count,
+            "sum": round(total, 3),
+            "avg": round(total / count, 3) if count else 0,
+            "max": float(raw["max"]) if "max" in raw else None,
+            "buckets": {b: counts.get(b, 0) for b in bounds},
+        }
+        for q in (0.5, 0.9, 0.99):
+            histogram[f"p{int(q * 100)}"] = self._quantile(histogram["buckets"], count, q)
+        return histogram
+
+    @staticmethod
+    def _quantile(buckets: Dict[str, int], count: int, q: float):
+        """按桶估算分位数，返回该分位所在桶的上界"""
+        if not count:
+            return None
+        target = count * q
+        seen = 0
+        for bound, bucket_count in buckets.items():
+            seen += bucket_count
+            if seen >= target:
+                return float(bound)
+        return None
+
+    def reset(self, names: List[str]):
+        """清空指定指标"""
+        keys = [self._counter_key(n) for n in names] + [self._histogram_key(n) for n in names]
+        self.redis.delete(*keys)
+
+
+# 全局指标实例
+metrics = Metrics()
@@ -1,37 +1,344 @@
 import time
+import asyncio
 import threading
-from typing import Optional
+import uuid
+import itertools
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
 from redis import Redis
+from config import Settings
+from app.db.redis_decorators import get_redis_client, get_async_redis_client
+from app.services.logger import get_logger
+from app.services.metrics import metrics
+
+logger = get_logger()
+
+
+class RateLimitTimeout(Exception):
+    """等待限流配额超时"""
+
+
+@dataclass
+class _Lease:
+    """进程内持有的配额租约：已在全局限流中预占的请求数与 token 数"""
+    lease_id: int
+    window: str  # 预占租约时的窗口开始时间（gcra 模式为 "gcra"）
+    requests: int
+    tokens: int  # 结算补扣可能使其为负，归还时一并扣回
+    expires_at: float
+
 
 class RateLimiter:
-    _instance: Optional['RateLimiter'] = None
+    """
+    基于 Redis 的每分钟请求数与 token 数限流，RATE_LIMIT_MODE 选择算法：
+    - gcra：通用信元速率算法，请求数与 token 数各保存一个理论到达时间（TAT），
+      检查、恢复与扣减在一次预注册脚本调用（EVALSHA）内完成，使用 Redis 服务器时间，返回精确的等待时间；
+      任意 60 秒内放行量不超过上限（突发容量 RATE_LIMIT_BURST_SECONDS 计入上限）
+    - window：固定 60 秒窗口，窗口交界处最多可放行两倍配额
+    - 每个限流范围（如每个 API 密钥）一个实例，同一范围在进程内共享；
+      按密钥限流时每分钟请求数上限取账号池中该密钥的分钟配额（quota_minute），与账号池的分钟窗口一致
+    - 租约（RATE_LIMIT_LEASE_ENABLED）：进程一次预占一份请求数与 token 数，此后的调用在本地扣减，
+      租约到期或不足时归还剩余部分；租约在预占时已计入全局限流，全局上限不变
+    - 排队（RATE_LIMIT_FIFO_ENABLED）：配额不足的调用领取票据进入等待队列（ZSet，分数为入队时的 Redis 时间），
+      有等待者时只有队首可以预占，大请求不会被后来的小请求饿死；队首预占成功后出队并通过 pub/sub 只唤醒下一位，
+      其余等待者不轮询；等待者每 HEARTBEAT_INTERVAL 秒重试一次兼作心跳，心跳超时的票据（如进程退出）被清理
+    - 请求前按估算的输入 token 数预占配额，响应后用 usage_metadata 的实际用量结算差额
+    - 等待时间记录在 metrics:histogram:rate_limit_wait
+    """
+    _instances: Dict[str, 'RateLimiter'] = {}
     _lock = threading.Lock()
 
-    def __new__(cls, *args, **kwargs):
+    METRIC_NAME = "rate_limit"
+    # 等待时间直方图的桶上界（秒）
+    WAIT_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+    # 排队等待者的重试兼心跳间隔（秒），超过 3 倍未心跳的票据视为失效
+    HEARTBEAT_INTERVAL = 5
+    # 同步 acquire 没有订阅通知，未轮到时的重试间隔（秒）
+    SYNC_POLL_INTERVAL = 0.5
+
+    # 排队检查，拼接在各预占脚本前后：有等待者时只有队首的票据可以预占，队首预占成功后出队并通知下一位
+    # 追加在预占脚本 KEYS 之后：等待队列, 心跳
+    # 追加在预占脚本 ARGV 之后：心跳超时（秒）, 通知频道, 票据（未排队为空）
+    # 返回：{0, "-1"}-未轮到，等待通知
+    FIFO_PREAMBLE = """
+    local waiters, heartbeats = KEYS[#KEYS - 1], KEYS[#KEYS]
+    local channel, ticket = ARGV[#ARGV - 1], ARGV[#ARGV]
+    local clock = redis.call('TIME')
+    local server_now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    if ticket ~= '' then
+        if not redis.call('ZSCORE', waiters, ticket) then
+            -- 心跳超时被清理的票据重新排到队尾
+            redis.call('ZADD', waiters, server_now, ticket)
+        end
+        redis.call('ZADD', heartbeats, server_now, ticket)
+    end
+    local stale = redis.call('ZRANGEBYSCORE', heartbeats, '-inf', server_now - tonumber(ARGV[#ARGV - 2]), 'LIMIT', 0, 100)
+    for _, member in ipairs(stale) do
+        redis.call('ZREM', waiters, member)
+        redis.call('ZREM', heartbeats, member)
+    end
+    local head = redis.call('ZRANGE', waiters, 0, 0)[1]
+    if #stale > 0 and head then
+        redis.call('PUBLISH', channel, head)
+    end
+    if head and head ~= ticket then
+        return {0, '-1'}
+    end
+    local function reserve()
+    """
+    FIFO_EPILOGUE = """
+    end
+    local result = reserve()
+    if result[1] == 1 and head then
+        redis.call('ZREM', waiters, ticket)
+        redis.call('ZREM', heartbeats, ticket)
+        local next_head = redis.call('ZRANGE', waiters, 0, 0)[1]
+        if next_head then
+            redis.call('PUBLISH', channel, next_head)
+        end
+    end
+    return result
+    """
+
+    # 入队：分数为 Redis 服务器时间，返回入队时间
+    # KEYS: 等待队列, 心跳
+    # ARGV: 票据
+    ENQUEUE_SCRIPT = """
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    redis.call('ZADD', KEYS[1], 'NX', now, ARGV[1])
+    redis.call('ZADD', KEYS[2], now, ARGV[1])
+    return tostring(now)
+    """
+
+    # 出队（超时或取消）：出队的是队首时通知下一位
+    # KEYS: 等待队列, 心跳
+    # ARGV: 票据, 通知频道
+    DEQUEUE_SCRIPT = """
+    local head = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    if head == ARGV[1] then
+        local next_head = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+        if next_head then
+            redis.call('PUBLISH', ARGV[2], next_head)
+        end
+    end
+    return 1
+    """
+
+    # 预占配额：窗口到期时先重置，配额足够时扣减
+    # KEYS: token 桶, 请求计数, 窗口开始时间
+    # ARGV: 当前时间, 窗口大小, 最大 token 数, 最大请求数, 需要的 token 数, 需要的请求数
+    # 返回：{1, 窗口开始时间}-成功；{0, 距窗口重置的秒数}-配额不足
+    ACQUIRE_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local window = tonumber(ARGV[2])
+    -- 窗口开始时间按原始字符串返回，结算时原样比较
+    local last_reset_raw = redis.call('get', KEYS[3]) or '0'
+    local last_reset = tonumber(last_reset_raw)
+    if (now - last_reset) >= window then
+        redis.call('set', KEYS[1], ARGV[3])
+        redis.call('set', KEYS[2], '0')
+        redis.call('set', KEYS[3], ARGV[1])
+        last_reset_raw = ARGV[1]
+        last_reset = now
+    end
+
+    local current_tokens = tonumber(redis.call('get', KEYS[1]))
+    local current_requests = tonumber(redis.call('get', KEYS[2]))
+    local tokens_needed = tonumber(ARGV[5])
+    local requests_needed = tonumber(ARGV[6])
+    if current_tokens >= tokens_needed and current_requests + requests_needed <= tonumber(ARGV[4]) then
+        redis.call('decrby', KEYS[1], tokens_needed)
+        redis.call('incrby', KEYS[2], requests_needed)
+        return {1, last_reset_raw}
+    end
+    return {0, tostring(last_reset + window - now)}
+    """
+
+    # 结算：预占与实际用量的差额，仍在同一窗口时退还或补扣，窗口已重置时只补扣超出部分
+    # KEYS: token 桶, 窗口开始时间, 请求计数
+    # ARGV: 预占时的窗口开始时间, 差额（预占 - 实际）, 最大 token 数, 退还的请求数
+    SETTLE_SCRIPT = """
+    local delta = tonumber(ARGV[2])
+    if redis.call('get', KEYS[2]) == ARGV[1] then
+        local tokens = redis.call('incrby', KEYS[1], delta)
+        if tokens > tonumber(ARGV[3]) then
+            redis.call('set', KEYS[1], ARGV[3])
+        end
+        local requests_refund = tonumber(ARGV[4])
+        if requests_refund > 0 and redis.call('decrby', KEYS[3], requests_refund) < 0 then
+            redis.call('set', KEYS[3], '0')
+        end
+    elseif delta < 0 then
+        redis.call('incrby', KEYS[1], delta)
+    end
+    return 1
+    """
+
+    # GCRA 预占
+    # KEYS: 请求数 TAT, token 数 TAT
+    # ARGV: 请求数 × 每个请求的间隔（秒）, 每个 token 的间隔（秒）, 突发容忍时间（秒）, token 数
+    # 返回：{1, "0"}-成功；{0, 等待秒数}-配额不足，等待后重试即可成功（无其他请求竞争时）
+    GCRA_ACQUIRE_SCRIPT = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local tau = tonumber(ARGV[3])
+    local costs = {tonumber(ARGV[1]), tonumber(ARGV[2]) * tonumber(ARGV[4])}
+    local new_tats = {}
+    local retry_after = 0
+    for i = 1, 2 do
+        local tat = tonumber(redis.call('GET', KEYS[i]) or '0')
+        if tat < now then
+            tat = now
+        end
+        local new_tat = tat + costs[i]
+        local wait = new_tat - now - tau
+        if costs[i] > tau then
+            -- 超过突发容量的单次请求在配额完全恢复（TAT 不晚于当前时间）时放行，TAT 仍按完整用量推后
+            wait = tat - now
+        end
+        if wait > retry_after then
+            retry_after = wait
+        end
+        new_tats[i] = new_tat
+    end
+    if retry_after > 0 then
+        return {0, tostring(retry_after)}
+    end
+    for i = 1, 2 do
+        redis.call('SET', KEYS[i], tostring(new_tats[i]), 'PX', math.ceil((new_tats[i] - now) * 1000) + 1000)
+    end
+    return {1, '0'}
+    """
+
+    # GCRA 结算：差额按间隔折算为时间，退还时提前 TAT，补扣时推后 TAT；已完全恢复的 TAT 不再退还
+    # KEYS: 需要调整的 TAT（token 数 TAT，归还租约时还有请求数 TAT）
+    # ARGV: 对应 TAT 退还的时间（秒，负数为补扣）
+    GCRA_SETTLE_SCRIPT = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    for i = 1, #KEYS do
+        local refund = tonumber(ARGV[i])
+        local tat = tonumber(redis.call('GET', KEYS[i]) or '0')
+        if tat >= now or refund < 0 then
+            local new_tat = math.max(tat, now) - refund
+            if new_tat <= now then
+                redis.call('DEL', KEYS[i])
+            else
+                redis.call('SET', KEYS[i], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000) + 1000)
+            end
+        end
+    end
+    return 1
+    """
+
+    LEASE_PREFIX = "lease"
+
+    def __new__(cls, scope: str = "global", *args, **kwargs):
         with cls._lock:
-            if cls._instance is None:
-                cls._instance = super().__new__(cls)
-            return cls._instance
+            if scope not in cls._instances:
+                cls._instances[scope] = super().__new__(cls)
+            return cls._instances[scope]
 
-    def __init__(self, redis_client: Optional[Redis] = None):
+    def __init__(self, scope: str = "global", redis_client: Optional[Redis] = None):
         if not hasattr(self, '_initialized'):
-            self.redis = redis_client or Redis(host='localhost', port=6379, db=0)
-            
+            self.scope = scope
+            self.redis = redis_client or get_redis_client()
+            # acquire_async / settle_async 使用异步客户端，不阻塞事件循环
+            self.async_redis = get_async_redis_client()
+
             # 令牌桶相关的 key
-            self.token_bucket_key = "rate_limiter:token_bucket"
-            self.request_count_key = "rate_limiter:request_count"
-            self.last_reset_time_key = "rate_limiter:last_reset_time"
-            
+            self.token_bucket_key = f"rate_limiter:{scope}:token_bucket"
+            self.request_count_key = f"rate_limiter:{scope}:request_count"
+            self.last_reset_time_key = f"rate_limiter:{scope}:last_reset_time"
+
             # 限制配置
-            self.max_requests = 2000  # 每分钟最大请求数
-            self.max_tokens = 4_000_000  # 每分钟最大令牌数
+            self.max_requests = Settings.RATE_LIMIT_RPM  # 每分钟最大请求数
+            self.max_tokens = Settings.RATE_LIMIT_TPM  # 每分钟最大令牌数
             self.window_size = 60  # 时间窗口大小（秒）
-            
+            self.mode = Settings.RATE_LIMIT_MODE
+
+            # 各脚本同时注册在同步与异步客户端上（EVALSHA），同步与异步调用共用参数构造
+            scripts = {
+                "acquire": self.FIFO_PREAMBLE + self.ACQUIRE_SCRIPT + self.FIFO_EPILOGUE,
+                "settle": self.SETTLE_SCRIPT,
+                "gcra_acquire": self.FIFO_PREAMBLE + self.GCRA_ACQUIRE_SCRIPT + self.FIFO_EPILOGUE,
+                "gcra_settle": self.GCRA_SETTLE_SCRIPT,
+                "enqueue": self.ENQUEUE_SCRIPT,
+                "dequeue": self.DEQUEUE_SCRIPT,
+            }
+            self._scripts = {name: self.redis.register_script(script) for name, script in scripts.items()}
+            self._async_scripts = {
+                name: self.async_redis.register_script(script) for name, script in scripts.items()
+            }
+
+            # 租约：租约内的配额最晚在预占后 lease_seconds 内用完，gcra 模式把这段时间计入间隔
+            self.lease_enabled = Settings.RATE_LIMIT_LEASE_ENABLED
+            self.lease_seconds = max(Settings.RATE_LIMIT_LEASE_SECONDS, 0.1)
+            self._lease: Optional[_Lease] = None
+            self._lease_ids = itertools.count(1)
+            self._lease_lock = threading.Lock()
+
+            # GCRA：突发容量计入每分钟上限，间隔按 (窗口 + 突发容忍时间 [+ 租约时长]) / 上限 计算
+            self.gcra_request_key = f"rate_limiter:{scope}:gcra:requests"
+            self.gcra_token_key = f"rate_limiter:{scope}:gcra:tokens"
+            self.burst_seconds = min(max(Settings.RATE_LIMIT_BURST_SECONDS, 0.001), self.window_size)
+            self.token_interval = self._span() / self.max_tokens
+
+            # 每份租约的大小不超过一次可放行的量（gcra 为突发容量，window 为每分钟上限）
+            if self.mode == "gcra":
+                capacity_tokens = int(self.burst_seconds / self.token_interval)
+            else:
+                capacity_tokens = self.max_tokens
+            self.lease_tokens = max(min(Settings.RATE_LIMIT_LEASE_TOKENS, capacity_tokens), 1)
+            self._apply_max_requests()
+
+            # 排队：票据 -> 本进程内等待通知的事件，由订阅任务按通知唤醒
+            self.fifo_enabled = Settings.RATE_LIMIT_FIFO_ENABLED
+            self.waiters_key = f"rate_limiter:{scope}:waiters"
+            self.heartbeats_key = f"rate_limiter:{scope}:heartbeats"
+            self.wakeup_channel = f"rate_limiter:{scope}:wakeup"
+            self._ticket_events: Dict[str, asyncio.Event] = {}
+            self._listener: Optional[asyncio.Task] = None
+            self._listener_ready: Optional[asyncio.Event] = None
+
             self._initialized = True
-            
+
             # 初始化限流器状态
             self._init_state()
 
+    @classmethod
+    def for_key(cls, api_key: str, max_requests: int = 0) -> 'RateLimiter':
+        """
+        API 密钥对应的限流器，每个密钥独立计算配额
+        :param max_requests: 该密钥的每分钟请求数上限（账号池中的 quota_minute），0 时使用 RATE_LIMIT_RPM
+        """
+        limiter = cls(f"key:{api_key}")
+        limiter.set_max_requests(max_requests or Settings.RATE_LIMIT_RPM)
+        return limiter
+
+    def _span(self) -> float:
+        """GCRA 间隔的分子：窗口 + 突发容忍时间 [+ 租约时长]"""
+        return self.window_size + self.burst_seconds + (self.lease_seconds if self.lease_enabled else 0)
+
+    def _apply_max_requests(self):
+        """按每分钟请求数上限计算请求间隔与每份租约的请求数"""
+        self.request_interval = self._span() / self.max_requests
+        if self.mode == "gcra":
+            capacity_requests = int(self.burst_seconds / self.request_interval)
+        else:
+            capacity_requests = self.max_requests
+        self.lease_requests = max(min(Settings.RATE_LIMIT_LEASE_REQUESTS, capacity_requests), 1)
+
+    def set_max_requests(self, max_requests: int):
+        """调整每分钟请求数上限（如账号的分钟配额变更），下一次预占起生效"""
+        max_requests = max(int(max_requests), 1)
+        if max_requests != self.max_requests:
+            self.max_requests = max_requests
+            self._apply_max_requests()
+
     def _init_state(self):
         """初始化或重置限流器状态"""
         now = time.time()
@@ -46,13 +353,13 @@ class RateLimiter:
         """检查是否需要重置时间窗口"""
         now = time.time()
         last_reset_time = float(self.redis.get(self.last_reset_time_key) or now)
-        
+
         if now - last_reset_time >= self.window_size:
             # 使用 Lua 脚本保证原子性
             reset_script = """
             local now = tonumber(ARGV[1])
             local last_reset = tonumber(redis.call('get', KEYS[1]))
-            
+
             if (now - last_reset) >= 60 then
                 redis.call('set', KEYS[2], ARGV[2])  -- reset token bucket
                 redis.call('set', KEYS[3], '0')      -- reset request count
@@ -61,7 +368,7 @@ class RateLimiter:
             end
             return 0
             """
-            
+
             self.redis.eval(
                 reset_script,
                 3,  # 3个键
@@ -72,6 +379,254 @@ class RateLimiter:
                 self.max_tokens
             )
 
+    def _reserve_call(self, requests: int, tokens: int, ticket: str) -> Tuple[str, list, list]:
+        """预占脚本的 (脚本名, KEYS, ARGV)"""
+        fifo_keys = [self.waiters_key, self.heartbeats_key]
+        fifo_args = [self.HEARTBEAT_INTERVAL * 3, self.wakeup_channel, ticket]
+        if self.mode == "gcra":
+            return (
+                "gcra_acquire",
+                [self.gcra_request_key, self.gcra_token_key] + fifo_keys,
+                [self.request_interval * requests, self.token_interval, self.burst_seconds, tokens] + fifo_args,
+            )
+        return (
+            "acquire",
+            [self.token_bucket_key, self.request_count_key, self.last_reset_time_key] + fifo_keys,
+            [time.time(), self.window_size, self.max_tokens, self.max_requests, tokens, requests] + fifo_args,
+        )
+
+    def _reserve_result(self, result) -> Tuple[bool, str, float]:
+        """解析预占脚本的返回值"""
+        ok, value = result
+        if int(ok) == 1:
+            return True, "gcra" if self.mode == "gcra" else value, 0
+        value = float(value)
+        if self.mode == "gcra" or value < 0:
+            return False, "", value
+        return False, "", max(value, 0.05)
+
+    def _reserve(self, requests: int, tokens: int, ticket: str = "") -> Tuple[bool, str, float]:
+        """
+        在全局限流中预占 requests 个请求与 tokens 个令牌，一次 Redis 调用
+        :param ticket: 排队的票据，有等待者时只有队首可以预占
+        :return: (是否成功, 预占时的窗口开始时间（gcra 模式为 "gcra"）, 可再次尝试前需等待的秒数，-1 表示未轮到)
+        """
+        name, keys, args = self._reserve_call(requests, tokens, ticket)
+        return self._reserve_result(self._scripts[name](keys=keys, args=args))
+
+    async def _reserve_async(self, requests: int, tokens: int, ticket: str = "") -> Tuple[bool, str, float]:
+        """_reserve 的异步版本"""
+        name, keys, args = self._reserve_call(requests, tokens, ticket)
+        return self._reserve_result(await self._async_scripts[name](keys=keys, args=args))
+
+    def _refund_call(self, window: str, requests: int, tokens: int) -> Tuple[str, list, list]:
+        """结算脚本的 (脚本名, KEYS, ARGV)"""
+        if self.mode == "gcra":
+            keys, args = [self.gcra_token_key], [tokens * self.token_interval]
+            if requests:
+                keys.append(self.gcra_request_key)
+                args.append(requests * self.request_interval)
+            return "gcra_settle", keys, args
+        return (
+            "settle",
+            [self.token_bucket_key, self.last_reset_time_key, self.request_count_key],
+            [window, tokens, self.max_tokens, requests],
+        )
+
+    def _refund(self, window: str, requests: int, tokens: int):
+        """退还（负数为补扣）预占的请求数与 token 数"""
+        name, keys, args = self._refund_call(window, requests, tokens)
+        self._scripts[name](keys=keys, args=args)
+
+    async def _refund_async(self, window: str, requests: int, tokens: int):
+        """_refund 的异步版本"""
+        name, keys, args = self._refund_call(window, requests, tokens)
+        await self._async_scripts[name](keys=keys, args=args)
+
+    def _take_lease(self, tokens: int) -> Tuple[str, Optional[_Lease]]:
+        """
+        从进程内的租约扣减
+        :return: (预占标识，租约不可用时为空, 已过期或不足而摘下、需要归还的租约)
+        """
+        with self._lease_lock:
+            lease = self._lease
+            if lease is None:
+                return "", None
+            if time.time() >= lease.expires_at or lease.requests < 1 or lease.tokens < tokens:
+                self._lease = None
+                return "", lease
+            lease.requests -= 1
+            lease.tokens -= tokens
+            return f"{self.LEASE_PREFIX}:{lease.lease_id}:{lease.window}", None
+
+    def _install_lease(self, window: str, tokens: int, reserved_at: float) -> Tuple[str, Optional[_Lease]]:
+        """
+        登记新预占的租约并扣减本次用量
+        :return: (预占标识, 并发预占时被替换、需要归还的租约)
+        """
+        expires_at = reserved_at + self.lease_seconds
+        if self.mode != "gcra":
+            # window 模式的租约不能跨窗口使用
+            expires_at = min(expires_at, float(window) + self.window_size)
+        with self._lease_lock:
+            lease = _Lease(
+                next(self._lease_ids), window, self.lease_requests - 1, self.lease_tokens - tokens, expires_at
+            )
+            replaced, self._lease = self._lease, lease
+        metrics.incr(self.METRIC_NAME, "lease_acquired")
+        return f"{self.LEASE_PREFIX}:{lease.lease_id}:{window}", replaced
+
+    @staticmethod
+    def _lease_unused(lease: Optional[_Lease]) -> bool:
+        return lease is not None and (lease.requests > 0 or lease.tokens != 0)
+
+    def _lease_returned(self, lease: _Lease):
+        metrics.incr_many(self.METRIC_NAME, {
+            "lease_returned_requests": max(lease.requests, 0),
+            "lease_returned_tokens": max(lease.tokens, 0),
+        })
+
+    def _return_lease(self, lease: Optional[_Lease]):
+        """归还租约中未用完的配额"""
+        if not self._lease_unused(lease):
+            return
+        try:
+            self._refund(lease.window, max(lease.requests, 0), lease.tokens)
+        except Exception as e:
+            # 归还失败只会少放行，gcra 的 TAT 与 window 的窗口都会自行恢复
+            logger.warning(f"【RateLimiter】- 归还租约失败: scope=***{self.scope[-6:]}, error={str(e)}")
+            return
+        self._lease_returned(lease)
+
+    async def _return_lease_async(self, lease: Optional[_Lease]):
+        """_return_lease 的异步版本"""
+        if not self._lease_unused(lease):
+            return
+        try:
+            await self._refund_async(lease.window, max(lease.requests, 0), lease.tokens)
+        except Exception as e:
+            logger.warning(f"【RateLimiter】- 归还租约失败: scope=***{self.scope[-6:]}, error={str(e)}")
+            return
+        self._lease_returned(lease)
+
+    def release_lease(self):
+        """立即归还进程内租约的剩余配额，如进程退出前"""
+        with self._lease_lock:
+            lease, self._lease = self._lease, None
+        self._return_lease(lease)
+
+    def try_acquire(self, tokens: int, ticket: str = "") -> Tuple[bool, str, float]:
+        """
+        尝试预占一次请求与 tokens 个令牌（超过每分钟上限的请求按上限预占）
+        未启用租约时一次 Redis 调用；启用租约时多数调用在本地完成，租约过期或不足时归还剩余部分并预占新的租约
+        :param ticket: 排队的票据，有等待者时只有队首可以预占
+        :return: (是否成功, 预占标识（窗口开始时间、"gcra" 或租约）, 可再次尝试前需等待的秒数，-1 表示未轮到)
+        """
+        tokens = min(max(int(tokens), 1), self.max_tokens)
+        if not self.lease_enabled or tokens > self.lease_tokens:
+            # 超过一份租约的请求直接预占
+            return self._reserve(1, tokens, ticket)
+        window, stale = self._take_lease(tokens)
+        self._return_lease(stale)
+        if window:
+            return True, window, 0
+        reserved_at = time.time()
+        ok, window, retry_after = self._reserve(self.lease_requests, self.lease_tokens, ticket)
+        if ok:
+            window, replaced = self._install_lease(window, tokens, reserved_at)
+            self._return_lease(replaced)
+            return True, window, 0
+        if retry_after < 0:
+            return ok, window, retry_after
+        # 剩余配额不足一份租约时只预占本次所需，不经过租约
+        metrics.incr(self.METRIC_NAME, "lease_fallback")
+        return self._reserve(1, tokens, ticket)
+
+    async def try_acquire_async(self, tokens: int, ticket: str = "") -> Tuple[bool, str, float]:
+        """try_acquire 的异步版本，Redis 调用不阻塞事件循环"""
+        tokens = min(max(int(tokens), 1), self.max_tokens)
+        if not self.lease_enabled or tokens > self.lease_tokens:
+            return await self._reserve_async(1, tokens, ticket)
+        window, stale = self._take_lease(tokens)
+        await self._return_lease_async(stale)
+        if window:
+            return True, window, 0
+        reserved_at = time.time()
+        ok, window, retry_after = await self._reserve_async(self.lease_requests, self.lease_tokens, ticket)
+        if ok:
+            window, replaced = self._install_lease(window, tokens, reserved_at)
+            await self._return_lease_async(replaced)
+            return True, window, 0
+        if retry_after < 0:
+            return ok, window, retry_after
+        metrics.incr(self.METRIC_NAME, "lease_fallback")
+        return await self._reserve_async(1, tokens, ticket)
+
+    def _enqueue(self) -> Tuple[str, float]:
+        """领取票据进入等待队列，返回 (票据, 入队时的 Redis 时间)"""
+        ticket = uuid.uuid4().hex
+        enqueued_at = self._scripts["enqueue"](keys=[self.waiters_key, self.heartbeats_key], args=[ticket])
+        metrics.incr(self.METRIC_NAME, "queued")
+        return ticket, float(enqueued_at)
+
+    async def _enqueue_async(self) -> Tuple[str, float]:
+        """_enqueue 的异步版本"""
+        ticket = uuid.uuid4().hex
+        enqueued_at = await self._async_scripts["enqueue"](
+            keys=[self.waiters_key, self.heartbeats_key], args=[ticket]
+        )
+        metrics.incr(self.METRIC_NAME, "queued")
+        return ticket, float(enqueued_at)
+
+    def _dequeue(self, ticket: str):
+        """等待超时或取消时出队，是队首时通知下一位"""
+        try:
+            self._scripts["dequeue"](keys=[self.waiters_key, self.heartbeats_key], args=[ticket, self.wakeup_channel])
+        except Exception as e:
+            # 出队失败时由心跳超时清理
+            logger.warning(f"【RateLimiter】- 票据出队失败: scope=***{self.scope[-6:]}, error={str(e)}")
+
+    async def _dequeue_async(self, ticket: str):
+        """_dequeue 的异步版本"""
+        try:
+            await self._async_scripts["dequeue"](
+                keys=[self.waiters_key, self.heartbeats_key], args=[ticket, self.wakeup_channel]
+            )
+        except Exception as e:
+            logger.warning(f"【RateLimiter】- 票据出队失败: scope=***{self.scope[-6:]}, error={str(e)}")
+
+    async def _listen(self):
+        """订阅通知频道，唤醒本进程内对应票据的等待者"""
+        client = get_async_redis_client()
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(self.wakeup_channel)
+            self._listener_ready.set()
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                event = self._ticket_events.get(message["data"])
+                if event:
+                    event.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 订阅中断时等待者按心跳间隔重试，下次等待时重新订阅
+            logger.warning(f"【RateLimiter】- 订阅限流通知中断: scope=***{self.scope[-6:]}, error={str(e)}")
+        finally:
+            await pubsub.reset()
+            await client.close()
+
+    async def _ensure_listener(self):
+        """启动本进程的通知订阅（每个限流范围一个连接）"""
+        if self._listener is None or self._listener.done():
+            self._listener_ready = asyncio.Event()
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        try:
+            await asyncio.wait_for(self._listener_ready.wait(), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+
     def acquire(self, tokens: int) -> bool:
         """
         尝试获取令牌
@@ -82,57 +637,141 @@ class RateLimiter:
             raise ValueError("令牌数必须大于0")
         if tokens > self.max_tokens:
             raise ValueError(f"请求的令牌数超过限制 ({self.max_tokens})")
-            
-        while True:
-            self._check_and_reset_window()
-            
-            # 使用 Lua 脚本保证原子性
-            acquire_script = """
-            local current_tokens = tonumber(redis.call('get', KEYS[1]))
-            local current_requests = tonumber(redis.call('get', KEYS[2]))
-            local tokens_needed = tonumber(ARGV[1])
-            local max_requests = tonumber(ARGV[2])
-            
-            if current_tokens >= tokens_needed and current_requests < max_requests then
-                redis.call('decrby', KEYS[1], tokens_needed)
-                redis.call('incr', KEYS[2])
-                return 1
-            end
-            return 0
-            """
-            
-            result = self.redis.eval(
-                acquire_script,
-                2,  # 2个键
-                self.token_bucket_key,
-                self.request_count_key,
-                tokens,
-                self.max_requests
-            )
-            
-            if result == 1:
-                return True
-                
-            # 获取当前状态用于日志
-            current_tokens = int(self.redis.get(self.token_bucket_key) or 0)
-            current_requests = int(self.redis.get(self.request_count_key) or 0)
-            
-            if current_requests >= self.max_requests:
-                print(f"达到请求数限制 ({current_requests}/{self.max_requests})")
-            if current_tokens < tokens:
-                print(f"令牌不足 (需要: {tokens}, 当前: {current_tokens})")
-                
-            # 如果获取失败，等待一小段时间再试
-            time.sleep(0.1)
+
+        ticket = ""
+        try:
+            while True:
+                ok, _, retry_after = self.try_acquire(tokens, ticket)
+                if ok:
+                    ticket = ""
+                    return True
+                if self.fifo_enabled and not ticket:
+                    ticket, _ = self._enqueue()
+                    continue
+                # 如果获取失败，按返回的等待时间休眠后再试（不超过心跳间隔），未轮到时按固定间隔重试
+                time.sleep(min(retry_after, self.HEARTBEAT_INTERVAL) if retry_after >= 0 else self.SYNC_POLL_INTERVAL)
+        finally:
+            if ticket:
+                self._dequeue(ticket)
+
+    async def acquire_async(self, tokens: int, timeout: float = None) -> Tuple[str, float]:
+        """
+        异步预占配额，不阻塞事件循环
+        配额不足时领取票据排队：队首按返回的等待时间休眠，其余等待者等待轮到自己的通知，
+        都最多每 HEARTBEAT_INTERVAL 秒重试一次（兼作心跳）
+        :param tokens: 估算的输入 token 数
+        :param timeout: 最长等待时间（秒），默认 Settings.RATE_LIMIT_WAIT_TIMEOUT
+        :return: (预占标识, 等待的秒数)，用于 settle_async()
+        """
+        timeout = Settings.RATE_LIMIT_WAIT_TIMEOUT if timeout is None else timeout
+        start = time.time()
+        attempts = 0
+        ticket = event_ticket = ""
+        event = None
+        try:
+            while True:
+                ok, window, retry_after = await self.try_acquire_async(tokens, ticket)
+                waited = time.time() - start
+                attempts += 1
+                if ok:
+                    metrics.observe(f"{self.METRIC_NAME}_wait", waited, self.WAIT_BUCKETS)
+                    if ticket:
+                        metrics.observe(f"{self.METRIC_NAME}_queue_wait", waited, self.WAIT_BUCKETS)
+                        ticket = ""
+                    metrics.incr_many(self.METRIC_NAME, {
+                        "admitted": 1,
+                        "waited": 1 if attempts > 1 else 0,
+                        "reserved_tokens": min(max(int(tokens), 1), self.max_tokens),
+                    })
+                    return window, waited
+                if self.fifo_enabled and event is None:
+                    await self._ensure_listener()
+                    ticket, _ = await self._enqueue_async()
+                    event = self._ticket_events[ticket] = asyncio.Event()
+                    event_ticket = ticket
+                    continue
+                if waited + max(retry_after, 0) > timeout:
+                    metrics.incr(self.METRIC_NAME, "timeout")
+                    raise RateLimitTimeout(
+                        f"等待限流配额超时(rate limit): scope=***{self.scope[-6:]}, 已等待={round(waited, 1)}秒"
+                    )
+                if event is None:
+                    await asyncio.sleep(retry_after)
+                    continue
+                # 队首等待配额恢复，其余等待者等待通知；超时即重试，兼作心跳
+                delay = min(retry_after, self.HEARTBEAT_INTERVAL) if retry_after >= 0 else self.HEARTBEAT_INTERVAL
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(delay, max(timeout - waited, 0.05)))
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            if event is not None:
+                self._ticket_events.pop(event_ticket, None)
+            if ticket:
+                await self._dequeue_async(ticket)
+
+    def _settle_locally(self, window: str, estimated: int, actual: int) -> Tuple[str, int, int]:
+        """
+        计算预占与实际用量的差额，租约仍在使用时在本地结算，归还租约时一并计入全局
+        :return: (全局结算的窗口, 差额（预占 - 实际）, 仍需在全局退还（负数为补扣）的 token 数)
+        """
+        estimated = min(max(int(estimated), 1), self.max_tokens)
+        delta = estimated - int(actual)
+        if not window or delta == 0:
+            return "", 0, 0
+        if not window.startswith(f"{self.LEASE_PREFIX}:"):
+            return window, delta, delta
+        _, lease_id, window = window.split(":", 2)
+        with self._lease_lock:
+            if self._lease and str(self._lease.lease_id) == lease_id:
+                self._lease.tokens += delta
+                return window, delta, 0
+        return window, delta, delta
+
+    def settle(self, window: str, estimated: int, actual: int):
+        """
+        用实际用量结算预占的配额
+        :param window: acquire_async 返回的预占标识
+        :param estimated: 预占的 token 数
+        :param actual: usage_metadata 中的实际输入 token 数
+        """
+        window, delta, refund = self._settle_locally(window, estimated, actual)
+        if refund:
+            self._refund(window, 0, refund)
+        if delta:
+            metrics.incr(self.METRIC_NAME, "refunded_tokens" if delta > 0 else "extra_tokens", abs(delta))
+
+    async def settle_async(self, window: str, estimated: int, actual: int):
+        """settle 的异步版本，在事件循环中使用"""
+        window, delta, refund = self._settle_locally(window, estimated, actual)
+        if refund:
+            await self._refund_async(window, 0, refund)
+        if delta:
+            metrics.incr(self.METRIC_NAME, "refunded_tokens" if delta > 0 else "extra_tokens", abs(delta))
 
     def get_stats(self):
         """获取当前限流统计信息"""
+        if self.mode == "gcra":
+            # 剩余可立即放行的量 = (突发容忍时间 - TAT 超出当前时间的部分) / 间隔
+            now = time.time()
+            request_tat, token_tat = self.redis.mget(self.gcra_request_key, self.gcra_token_key)
+            request_backlog = max(float(request_tat or 0) - now, 0)
+            token_backlog = max(float(token_tat or 0) - now, 0)
+            return {
+                'mode': self.mode,
+                'lease': self._lease.__dict__.copy() if self._lease else None,
+                'remaining_requests': max(0, int((self.burst_seconds - request_backlog) / self.request_interval)),
+                'remaining_tokens': max(0, int((self.burst_seconds - token_backlog) / self.token_interval)),
+                'request_backlog_seconds': round(request_backlog, 3),
+                'token_backlog_seconds': round(token_backlog, 3),
+            }
         pipeline = self.redis.pipeline()
         pipeline.get(self.token_bucket_key)
         pipeline.get(self.request_count_key)
         pipeline.get(self.last_reset_time_key)
         current_tokens, current_requests, last_reset_time = pipeline.execute()
-        
+
         return {
             'current_tokens': int(current_tokens or 0),
             'current_requests': int(current_requests or 0),
@@ -141,37 +780,72 @@ class RateLimiter:
             'last_reset_time': float(last_reset_time or 0)
         }
 
+    @classmethod
+    def report(cls) -> dict:
+        """
+        限流统计：预占次数、等待次数、超时次数、结算退还/补扣的 token 数、
+        租约预占/回退/归还次数以及等待时间直方图
+        """
+        counters = metrics.get_counters(cls.METRIC_NAME)
+        fields = (
+            "admitted", "waited", "timeout", "reserved_tokens", "refunded_tokens", "extra_tokens",
+            "lease_acquired", "lease_fallback", "lease_returned_requests", "lease_returned_tokens", "queued",
+        )
+        return {
+            **{field: int(counters.get(field, 0)) for field in fields},
+            "wait_histogram": metrics.get_histogram(f"{cls.METRIC_NAME}_wait", cls.WAIT_BUCKETS),
+            # 排队者从首次尝试到预占成功的时间分布，max 为最长的饥饿时间
+            "queue_wait_histogram": metrics.get_histogram(f"{cls.METRIC_NAME}_queue_wait", cls.WAIT_BUCKETS),
+            "queues": cls.queue_report(),
+        }
+
+    @classmethod
+    def queue_report(cls) -> list:
+        """各限流范围当前的排队人数与队首已等待的秒数"""
+        redis = get_redis_client()
+        now = time.time()
+        queues = []
+        for key in redis.scan_iter(match="rate_limiter:*:waiters", count=100):
+            head = redis.zrange(key, 0, 0, withscores=True)
+            scope = key[len("rate_limiter:"):-len(":waiters")]
+            queues.append({
+                "scope": f"***{scope[-6:]}",
+                "length": redis.zcard(key),
+                "oldest_wait_seconds": round(max(now - head[0][1], 0), 3) if head else 0,
+            })
+        return queues
+
     def increment_request(self) -> bool:
         """
         增加请求计数
         :return: 是否增加成功（是否超过限制）
         """
         self._check_and_reset_window()
-        
+
         # 使用 Lua 脚本保证原子性
         increment_script = """
         local current_requests = tonumber(redis.call('get', KEYS[1]))
         local max_requests = tonumber(ARGV[1])
-        
+
         if current_requests < max_requests then
             redis.call('incr', KEYS[1])
             return 1
         end
         return 0
         """
-        
+
         result = self.redis.eval(
             increment_script,
             1,  # 1个键
             self.request_count_key,
             self.max_requests
         )
-        
+
         success = bool(result)
         if not success:
             current_requests = int(self.redis.get(self.request_count_key) or 0)
-            print(f"达到请求数限制 ({current_requests}/{self.max_requests})")
-        
+            logger.warning(f"【RateLimiter】- 达到请求数限制 ({current_requests}/{self.max_requests})")
+
         return success
 
     def increment_tokens(self, tokens: int) -> bool:
@@ -184,22 +858,22 @@ class RateLimiter:
             raise ValueError("token数必须大于0")
         if tokens > self.max_tokens:
             raise ValueError(f"请求的token数超过限制 ({self.max_tokens})")
-            
+
         self._check_and_reset_window()
-        
+
         # 使用 Lua 脚本保证原子性
         increment_script = """
         local current_tokens = tonumber(redis.call('get', KEYS[1]))
         local tokens_to_add = tonumber(ARGV[1])
         local max_tokens = tonumber(ARGV[2])
-        
+
         if (current_tokens + tokens_to_add) <= max_tokens then
             redis.call('incrby', KEYS[1], tokens_to_add)
             return 1
         end
         return 0
         """
-        
+
         result = self.redis.eval(
             increment_script,
             1,  # 1个键
@@ -207,41 +881,40 @@ class RateLimiter:
             tokens,
             self.max_tokens
         )
-        
+
         success = bool(result)
         if not success:
             current_tokens = int(self.redis.get(self.token_bucket_key) or 0)
-            print(f"达到token限制 (当前: {current_tokens}, 尝试增加: {tokens}, 最大: {self.max_tokens})")
-        
+            logger.warning(f"【RateLimiter】- 达到token限制 (当前: {current_tokens}, 尝试增加: {tokens}, 最大: {self.max_tokens})")
+
         return success
 
 # 测试代码
 if __name__ == "__main__":
     import concurrent.futures
-    
-    redis_client = Redis(host='localhost', port=6379, db=0)
-    limiter = RateLimiter(redis_client)
-    
+
+    limiter = RateLimiter("test")
+
     def test_increment():
         try:
             # 测试请求计数
             req_success = limiter.increment_request()
             print(f"增加请求计数: {'成功' if req_success else '失败'}")
-            
+
             # 测试token计数
             token_success = limiter.increment_tokens(1000)
             print(f"增加1000个token: {'成功' if token_success else '失败'}")
-            
+
             # 打印当前状态
             print("当前状态:", limiter.get_stats())
-            
+
         except Exception as e:
             print(f"错误: {e}")
-    
+
     # 并发测试
     with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
         print("测试场景1: 并发增加请求计数和token")
         futures = [executor.submit(test_increment) for _ in range(2100)]
         concurrent.futures.wait(futures)
-        
-        print("\n最终状态:", limiter.get_stats())
\ No newline at end of file
+
+        print("\n最终状态:", limiter.get_stats())
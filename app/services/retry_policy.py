@@ -0,0 +1,78 @@
+import random
+from typing import Dict, Tuple
+
+
+class RetryPolicy:
+    """
+    任务重试策略
+    根据错误信息将失败归类，并按类别计算下次重试前的退避时间：
+    - permanent: 永久错误（视频不存在、格式不支持、参数非法等），不再重试
+    - quota: 配额或限流错误（429 RESOURCE_EXHAUSTED），较长的退避
+    - transient: 其他暂时性错误（网络、超时、5xx 等），较短的退避
+    """
+
+    PERMANENT = "permanent"
+    QUOTA = "quota"
+    TRANSIENT = "transient"
+
+    # 各类别的退避曲线：(基础延迟秒数, 最大延迟秒数)，按 2 的指数增长
+    DEFAULT_BACKOFF: Dict[str, Tuple[float, float]] = {
+        QUOTA: (60, 1800),
+        TRANSIENT: (10, 600),
+    }
+
+    def __init__(self, backoff: Dict[str, Tuple[float, float]] = None, jitter: bool = True):
+        self.backoff = {**self.DEFAULT_BACKOFF, **(backoff or {})}
+        self.jitter = jitter
+
+    @staticmethod
+    def get_error_patterns() -> Dict[str, Tuple[str, ...]]:
+        """
+        获取错误信息关键字配置
+
+        Returns:
+            dict: 错误类别 -> 错误信息关键字（小写匹配）
+        """
+        return {
+            RetryPolicy.PERMANENT: (
+                "状态码: 400",
+                "状态码: 401",
+                "状态码: 403",
+                "状态码: 404",
+                "状态码: 410",
+                "视频url无效",
+                "不支持的视频格式",
+                "视频大小超过",
+                "提示词非法",
+                "invalid_argument",
+                "permission_denied",
+                "api key not valid",
+            ),
+            RetryPolicy.QUOTA: (
+                "resource_exhausted",
+                "too many requests",
+                "quota",
+                "rate limit",
+            ),
+        }
+
+    def classify(self, error: Exception) -> str:
+        """根据异常信息判断错误类别"""
+        error_msg = str(error).lower()
+        for category, patterns in self.get_error_patterns().items():
+            if any(pattern in error_msg for pattern in patterns):
+                return category
+        return self.TRANSIENT
+
+    def next_delay(self, category: str, attempt: int) -> float:
+        """
+        计算下次重试前的等待时间
+        Args:
+            category: 错误类别
+            attempt: 当前已失败次数（从 1 开始）
+        """
+        base_delay, max_delay = self.backoff.get(category, self.backoff[self.TRANSIENT])
+        delay = min(base_delay * (2 ** (max(attempt, 1) - 1)), max_delay)
+        if self.jitter:
+            delay *= 0.5 + random.random()
+        return min(delay, max_delay)
@@ -0,0 +1,208 @@
+import time
+import hashlib
+from typing import Dict, List
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from config import Settings
+from app.db.db_decorators import SessionLocal
+from app.db.redis_decorators import REDIS_TASK_DB, get_redis_client
+from app.models.task import Task
+from app.services.logger import get_logger
+
+logger = get_logger()
+
+
+class SingleFlight:
+    """
+    同一视频的在途任务合并（single-flight）
+    - 键：{platform}:single_flight:{kind}:{digest}:{dimensions}，值为领导者 task_id，随任务锁续期
+      kind 为 url（规范化后的 URL）或 content（视频内容哈希，下载后加入，覆盖签名 URL 等不同地址的同一视频）
+    - 跟随者：{键}:followers（Set），跟随者不再下载与生成，由调用方放入延迟重试队列 {platform}:task_queue_delayed，
+      期限 follow_timeout 秒后确认出队；领导者崩溃且未被重新投递（如 List 模式）时，跟随者到期后重新投递并接替处理
+    - 领导者成功：用其结果填充所有跟随者的 video_tasks 记录，并移出延迟重试队列
+    - 领导者永久失败：跟随者同样标记失败并移入失败队列
+    - 领导者暂时失败或异常退出：跟随者由调用方延迟重新投递，其中之一成为新的领导者
+    """
+
+    # 加入：键不存在或已由自己持有时成为领导者，否则加入跟随者集合
+    # 跟随时会把自己作为领导者持有的旧键（KEYS[3]）的跟随者一并移交给新的领导者
+    JOIN_SCRIPT = """
+    local leader = redis.call('GET', KEYS[1])
+    if (not leader) or leader == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', tonumber(ARGV[2]))
+        redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+        return ARGV[1]
+    end
+    redis.call('SADD', KEYS[2], ARGV[1])
+    if #KEYS == 4 and redis.call('GET', KEYS[3]) == ARGV[1] then
+        local moved = redis.call('SMEMBERS', KEYS[4])
+        for _, follower in ipairs(moved) do
+            redis.call('SADD', KEYS[2], follower)
+        end
+        redis.call('DEL', KEYS[3], KEYS[4])
+    end
+    redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+    return leader
+    """
+
+    # 完成：删除仍由自己持有的键（KEYS 为成对的 键/跟随者集合），返回全部跟随者
+    COMPLETE_SCRIPT = """
+    local followers = {}
+    for i = 1, #KEYS, 2 do
+        if redis.call('GET', KEYS[i]) == ARGV[1] then
+            for _, follower in ipairs(redis.call('SMEMBERS', KEYS[i + 1])) do
+                table.insert(followers, follower)
+            end
+            redis.call('DEL', KEYS[i], KEYS[i + 1])
+        end
+    end
+    return followers
+    """
+
+    # 续期：延长仍由自己持有的键及其跟随者集合
+    TOUCH_SCRIPT = """
+    for i = 1, #KEYS, 2 do
+        if redis.call('GET', KEYS[i]) == ARGV[1] then
+            redis.call('EXPIRE', KEYS[i], tonumber(ARGV[2]))
+            redis.call('EXPIRE', KEYS[i + 1], tonumber(ARGV[3]))
+        end
+    end
+    return 1
+    """
+
+    def __init__(self, platform: str, lease_timeout: int):
+        """
+        Args:
+            platform: 平台标识
+            lease_timeout: 领导者键的有效期（秒），与任务锁租约一致，领导者异常退出后自动失效
+        """
+        self.platform = platform
+        self.lease_timeout = lease_timeout
+        # 跟随者集合的有效期需长于任务回收时间，领导者异常退出后被重新投递时仍能接管跟随者
+        self.follower_ttl = max(Settings.SINGLE_FLIGHT_FOLLOWER_TTL, lease_timeout)
+        # 跟随者在延迟重试队列中等待的期限，到期时领导者仍在处理则再次跟随
+        self.follow_timeout = lease_timeout
+        self.delayed_key = f"{platform}:task_queue_delayed"
+        self.enabled = Settings.SINGLE_FLIGHT_ENABLED
+        self.redis = get_redis_client(db=REDIS_TASK_DB)
+        self._join = self.redis.register_script(self.JOIN_SCRIPT)
+        self._complete = self.redis.register_script(self.COMPLETE_SCRIPT)
+        self._touch = self.redis.register_script(self.TOUCH_SCRIPT)
+        self._held: Dict[str, List[str]] = {}  # task_id -> 作为领导者持有的键
+
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        """规范化 URL：协议与域名小写、去掉默认端口与锚点、查询参数排序"""
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        netloc = (parts.hostname or "").lower()
+        if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+            netloc = f"{netloc}:{parts.port}"
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+    def url_key(self, url: str, dimensions: str) -> str:
+        digest = hashlib.sha256(self.normalize_url(url).encode("utf-8")).hexdigest()
+        return f"{self.platform}:single_flight:url:{digest}:{dimensions}"
+
+    def content_key(self, content_hash: str, dimensions: str) -> str:
+        return f"{self.platform}:single_flight:content:{content_hash}:{dimensions}"
+
+    @staticmethod
+    def _followers_key(flight_key: str) -> str:
+        return f"{flight_key}:followers"
+
+    def _held_keys(self, task_id: str) -> List[str]:
+        """展开为成对的 键/跟随者集合"""
+        keys = []
+        for flight_key in self._held.get(task_id, []):
+            keys.extend([flight_key, self._followers_key(flight_key)])
+        return keys
+
+    def join(self, task_id: str, flight_key: str) -> str:
+        """
+        加入在途任务
+        Returns:
+            str: 领导者 task_id，等于自身 task_id 时由当前任务负责处理
+        """
+        if not self.enabled:
+            return task_id
+        keys = [flight_key, self._followers_key(flight_key)]
+        held = self._held.get(task_id, [])
+        if held:
+            # 只移交最近持有的键；更早的键在 complete/release 时一并处理
+            keys.extend([held[-1], self._followers_key(held[-1])])
+        leader = self._join(
+            keys=keys, args=[task_id, self.lease_timeout, self.follower_ttl]
+        )
+        if leader == task_id:
+            if flight_key not in held:
+                self._held.setdefault(task_id, []).append(flight_key)
+        elif held:
+            # 最近持有的键已移交给新的领导者
+            held.pop()
+            if not held:
+                self._held.pop(task_id, None)
+        return leader
+
+    def touch(self, task_id: str):
+        """延长当前任务持有的键，随任务锁续期调用"""
+        keys = self._held_keys(task_id)
+        if keys:
+            self._touch(keys=keys, args=[task_id, self.lease_timeout, self.follower_ttl])
+
+    def release(self, task_id: str) -> List[str]:
+        """释放当前任务持有的全部键，返回其跟随者"""
+        keys = self._held_keys(task_id)
+        self._held.pop(task_id, None)
+        if not keys:
+            return []
+        followers = self._complete(keys=keys, args=[task_id])
+        return [f for f in dict.fromkeys(followers) if f != task_id]
+
+    def resolve(self, task_id: str, followers: List[str], total_result: dict):
+        """领导者处理成功：用其结果填充所有跟随者任务"""
+        if not followers:
+            return
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        with SessionLocal() as db:
+            for task in db.query(Task).filter(Task.task_id.in_(followers)).all():
+                task.tags = {**(task.tags or {}), **total_result["tags"]}
+                task.message = total_result["message"]
+                task.status = "completed"
+                task.processed_end = now
+            db.commit()
+        pipeline = self.redis.pipeline()
+        pipeline.delete(*(f"{self.platform}:task_info:{f}" for f in followers))
+        pipeline.zrem(self.delayed_key, *followers)
+        pipeline.execute()
+        logger.info(
+            f"【SingleFlight-{self.platform}】- 已用任务 {task_id} 的结果完成跟随任务: {followers}"
+        )
+
+    def fail(self, task_id: str, followers: List[str], error_msg: str):
+        """领导者永久失败：跟随者同样标记失败并移入失败队列"""
+        if not followers:
+            return
+        message = f"同一视频的任务 {task_id} 处理失败: {error_msg}"
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        with SessionLocal() as db:
+            for task in db.query(Task).filter(Task.task_id.in_(followers)).all():
+                task.message = {
+                    **(task.message or {}),
+                    "all": {"status": "failed", "message": message},
+                }
+                task.status = "failed"
+                task.processed_end = now
+            db.commit()
+        pipeline = self.redis.pipeline()
+        for follower in followers:
+            pipeline.hset(
+                f"{self.platform}:task_info:{follower}",
+                mapping={"status": "failed", "message": message},
+            )
+            pipeline.lpush(f"{self.platform}:task_queue_failed", follower)
+        pipeline.zrem(self.delayed_key, *followers)
+        pipeline.execute()
+        logger.warning(
+            f"【SingleFlight-{self.platform}】- 任务 {task_id} 失败，跟随任务同样标记失败: {followers}"
+        )
@@ -0,0 +1,110 @@
+import json
+from typing import Dict, List, Optional
+from config import Settings
+from app.db.redis_decorators import REDIS_TASK_DB, get_redis_client
+from app.prompts.prompt_manager import prompt_manager
+from app.services.logger import get_logger
+from app.services.metrics import metrics
+
+logger = get_logger()
+
+
+class TagResultCache:
+    """
+    按视频内容寻址的标签结果缓存
+    键：tag_cache:{content_hash}:{dimension}:{prompt_version}:{model}
+    - content_hash: 视频文件内容的 SHA-256，同一视频换 URL 提交也能命中
+    - prompt_version: 提示词模板内容哈希，修改模板后旧结果自然失效
+    - model: 生成标签所用的模型
+    命中/未命中按维度计入指标 tag_cache；缓存键生成失败（如提示词版本无法计算）计入 {dimension}:error，
+    不会被当作未命中而悄无声息地使命中率归零
+    """
+
+    METRIC_NAME = "tag_cache"
+
+    def __init__(self, ttl: int = None):
+        self.ttl = ttl or Settings.TAG_CACHE_TTL
+        self.enabled = Settings.TAG_CACHE_ENABLED
+        self.redis = get_redis_client(db=REDIS_TASK_DB)
+
+    @staticmethod
+    def _cache_key(content_hash: str, dimension: str) -> str:
+        prompt_version = prompt_manager.get_prompt_version(dimension)
+        return f"tag_cache:{content_hash}:{dimension}:{prompt_version}:{Settings.GEMINI_MODEL}"
+
+    def _key_or_none(self, content_hash: str, dimension: str) -> Optional[str]:
+        """生成缓存键，失败时记录错误并计入指标，返回 None"""
+        try:
+            return self._cache_key(content_hash, dimension)
+        except Exception as e:
+            logger.error(f"【TagCache】- 生成缓存键失败: dimension={dimension}, error={str(e)}")
+            metrics.incr(self.METRIC_NAME, f"{dimension}:error")
+            return None
+
+    def get(self, content_hash: str, dimension: str) -> Optional[dict]:
+        """
+        读取缓存的维度标签
+        Returns:
+            dict | None: 命中时返回标签结果
+        """
+        if not self.enabled or not content_hash:
+            return None
+        key = self._key_or_none(content_hash, dimension)
+        if key is None:
+            return None
+        try:
+            value = self.redis.get(key)
+        except Exception as e:
+            logger.error(f"【TagCache】- 读取缓存失败: dimension={dimension}, error={str(e)}")
+            return None
+
+        metrics.incr(self.METRIC_NAME, f"{dimension}:{'hit' if value else 'miss'}")
+        if not value:
+            return None
+        return json.loads(value)
+
+    def get_many(self, content_hash: str, dimensions: List[str]) -> Dict[str, dict]:
+        """批量读取缓存，仅返回命中的维度"""
+        results = {}
+        for dim in dimensions:
+            tags = self.get(content_hash, dim)
+            if tags is not None:
+                results[dim] = tags
+        return results
+
+    def set(self, content_hash: str, dimension: str, tags: dict):
+        """写入维度标签"""
+        if not self.enabled or not content_hash:
+            return
+        key = self._key_or_none(content_hash, dimension)
+        if key is None:
+            return
+        try:
+            self.redis.set(
+                key,
+                json.dumps(tags, ensure_ascii=False),
+                ex=self.ttl,
+            )
+        except Exception as e:
+            logger.error(f"【TagCache】- 写入缓存失败: dimension={dimension}, error={str(e)}")
+
+    @classmethod
+    def report(cls) -> Dict[str, dict]:
+        """
+        各维度的缓存命中率
+        Returns:
+            dict: {dimension: {"hits": int, "misses": int, "errors": int, "hit_rate": float}}
+        """
+        counters = metrics.get_counters(cls.METRIC_NAME)
+        report = {}
+        for dim in Settings.VIDEO_DIMENSIONS:
+            hits = int(counters.get(f"{dim}:hit", 0))
+            misses = int(counters.get(f"{dim}:miss", 0))
+            total = hits + misses
+            report[dim] = {
+                "hits": hits,
+                "misses": misses,
+                "errors": int(counters.get(f"{dim}:error", 0)),
+                "hit_rate": round(hits / total, 4) if total else 0,
+            }
+        return report
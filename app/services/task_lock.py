@@ -0,0 +1,117 @@
+import uuid
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from app.db.redis_decorators import REDIS_TASK_DB, get_redis_client
+from app.services.logger import get_logger
+
+logger = get_logger()
+
+
+class TaskLockLost(Exception):
+    """任务锁租约已失效，任务可能已被其他消费者接管"""
+
+
+class TaskLockManager:
+    """
+    带租约续期的任务锁
+    - 获取：SET {platform}:task_queue_lock:{task_id} {token} NX EX {lock_timeout}，token 为本次持有者的随机标识
+    - 续期：持有期间后台心跳每 lock_timeout/3 秒比较 token 后 EXPIRE，任务存活期间锁不会过期
+    - 释放：比较 token 后删除，锁过期后被其他消费者获取时不会被误删
+    - 失效：续期时发现锁已不属于自己则停止心跳并标记失效，处理方在每个维度开始前与写入结果前
+      通过 ensure_held() 检查，失效时放弃本次处理，由持有锁的消费者或回收器接管
+    """
+
+    # 比较 token 后续期
+    RENEW_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+    end
+    return 0
+    """
+
+    # 比较 token 后删除
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(
+        self,
+        platform: str,
+        lock_timeout: int,
+        on_renew: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        """
+        Args:
+            platform: 平台标识
+            lock_timeout: 锁的租约时长（秒）
+            on_renew: 每次续期成功后的回调（如延长任务队列中的确认截止时间）
+        """
+        self.platform = platform
+        self.lock_timeout = lock_timeout
+        self.on_renew = on_renew
+        self.redis = get_redis_client(db=REDIS_TASK_DB)
+        self._renew = self.redis.register_script(self.RENEW_SCRIPT)
+        self._release = self.redis.register_script(self.RELEASE_SCRIPT)
+        self._tokens: Dict[str, str] = {}  # task_id -> token
+        self._heartbeats: Dict[str, asyncio.Task] = {}  # task_id -> 心跳任务
+
+    def _lock_key(self, task_id: str) -> str:
+        return f"{self.platform}:task_queue_lock:{task_id}"
+
+    async def acquire(self, task_id: str) -> bool:
+        """获取任务锁，成功后启动租约续期心跳"""
+        token = uuid.uuid4().hex
+        if not self.redis.set(self._lock_key(task_id), token, ex=self.lock_timeout, nx=True):
+            return False
+        self._tokens[task_id] = token
+        self._heartbeats[task_id] = asyncio.create_task(self._heartbeat(task_id, token))
+        return True
+
+    def is_held(self, task_id: str) -> bool:
+        """当前进程是否仍持有任务锁"""
+        return task_id in self._tokens
+
+    def ensure_held(self, task_id: str):
+        """任务锁已失效时抛出 TaskLockLost"""
+        if not self.is_held(task_id):
+            raise TaskLockLost(f"任务锁已失效，可能已被其他消费者获取: task_id={task_id}")
+
+    def lock_token(self, task_id: str) -> Tuple[str, Optional[str]]:
+        """任务锁的键名与当前持有的 token（未持有时为 None），供写入结果时原子地比较"""
+        return self._lock_key(task_id), self._tokens.get(task_id)
+
+    async def _heartbeat(self, task_id: str, token: str):
+        """定期续期，锁已失效或被其他持有者获取时停止续期并标记失效，处理方通过 ensure_held() 感知"""
+        interval = max(1, self.lock_timeout // 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = self._renew(keys=[self._lock_key(task_id)], args=[token, self.lock_timeout])
+            except Exception as e:
+                logger.error(f"【TaskLock-{self.platform}】- 任务锁续期失败: task_id={task_id}, error={str(e)}")
+                continue
+            if not renewed:
+                logger.error(
+                    f"【TaskLock-{self.platform}】- 任务锁已失效，可能已被其他消费者获取: task_id={task_id}"
+                )
+                self._tokens.pop(task_id, None)
+                return
+            if self.on_renew:
+                try:
+                    await self.on_renew(task_id)
+                except Exception as e:
+                    logger.error(f"【TaskLock-{self.platform}】- 续期回调执行失败: task_id={task_id}, error={str(e)}")
+
+    async def release(self, task_id: str):
+        """停止心跳并释放任务锁（仅当锁仍属于当前持有者时删除）"""
+        heartbeat = self._heartbeats.pop(task_id, None)
+        if heartbeat:
+            heartbeat.cancel()
+        token = self._tokens.pop(task_id, None)
+        if token and not self._release(keys=[self._lock_key(task_id)], args=[token]):
+            logger.warning(
+                f"【TaskLock-{self.platform}】- 任务锁已不属于当前持有者，跳过释放: task_id={task_id}"
+            )
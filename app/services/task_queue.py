@@ -0,0 +1,839 @@
+import os
+import time
+import socket
+import asyncio
+from collections import deque
+from typing import Optional
+from redis.exceptions import ResponseError
+from app.db.redis_decorators import (
+    REDIS_TASK_DB,
+    get_redis_client,
+    get_async_redis_client,
+)
+from app.services.logger import get_logger
+from app.services.metrics import metrics
+from config import Settings
+
+logger = get_logger()
+
+# 任务来源（创建任务时的 platform）所属的队列平台，队列平台即键名前缀与消费者的 platform，新增平台时只需在此登记
+TASK_SOURCE_PLATFORMS = {"rpa": "rpa", "files": "rpa", "user": "miaobi"}
+QUEUE_PLATFORMS = tuple(dict.fromkeys(TASK_SOURCE_PLATFORMS.values()))
+
+
+def get_consumer_id() -> str:
+    """
+    获取当前消费者进程的唯一标识
+    supervisor 下使用进程名（如 rpa_consumer_00），重启后标识不变，可以找回上次未确认的任务
+    """
+    process_name = os.getenv("SUPERVISOR_PROCESS_NAME") or str(os.getpid())
+    return f"{socket.gethostname()}-{process_name}"
+
+
+class ListTaskQueue:
+    """
+    基于 List 的任务队列（默认）
+    - 任务队列：{platform}:task_queue，生产者 LPUSH，消费者 RPOP
+    - 队列为空时轮询等待，任务取出后消费者崩溃会导致任务丢失
+    - 延迟重试队列：{platform}:task_queue_delayed（Sorted Set），分数为下次执行时间，
+      到期后由 promote_due() 批量移回任务队列（所有实现共用）
+    """
+
+    # 将到期的延迟任务批量移回任务队列
+    PROMOTE_SCRIPT = """
+    local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+    for _, task_id in ipairs(due) do
+        redis.call('ZREM', KEYS[1], task_id)
+        if ARGV[3] == 'stream' then
+            redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[4], '*', 'task_id', task_id)
+        else
+            redis.call('LPUSH', KEYS[2], task_id)
+        end
+    end
+    return #due
+    """
+
+    def __init__(self, platform: str, consumer_id: str = None):
+        self.platform = platform
+        self.consumer_id = consumer_id or get_consumer_id()
+        self.redis = get_redis_client(db=REDIS_TASK_DB)
+        self.queue_key = f"{platform}:task_queue"
+        self.delayed_key = f"{platform}:task_queue_delayed"
+
+    def enqueue(self, task_id: str, pipeline=None, uid: str = None, priority: str = None):
+        """
+        投递任务
+        Args:
+            task_id: 任务ID
+            pipeline: 生产者的 Redis pipeline，传入时只追加命令，由调用方统一执行
+            uid: 提交任务的用户，fair 模式按用户分队列
+            priority: 任务优先级（high/normal/low），priority 模式按优先级分队列
+        """
+        (pipeline if pipeline is not None else self.redis).lpush(self.queue_key, task_id)
+
+    async def get_task(self) -> Optional[str]:
+        """获取任务，队列为空时等待一段时间后返回 None"""
+        task_id = self.redis.rpop(self.queue_key)
+        if not task_id:
+            await asyncio.sleep(1)
+        return task_id
+
+    async def ack(self, task_id: str, tokens: int = 0):
+        """
+        确认任务处理结束（List 模式无需确认）
+        Args:
+            tokens: 任务消耗的 Gemini token 数，fair 模式计入用户的 token 预算
+        """
+
+    async def touch(self, task_id: str):
+        """任务仍在处理中，延长其确认期限（List 模式无需处理）"""
+
+    async def requeue(self, task_id: str):
+        """将任务重新放回队列"""
+        self.redis.lpush(self.queue_key, task_id)
+
+    async def retry_later(self, task_id: str, delay: float):
+        """将任务放入延迟重试队列，delay 秒后重新投递"""
+        self.redis.zadd(self.delayed_key, {task_id: time.time() + delay})
+
+    def _promote_target(self) -> tuple:
+        """延迟任务到期后投递的目标：(键名, 投递方式)"""
+        return self.queue_key, "list"
+
+    async def promote_due(self, batch_size: int = 100) -> int:
+        """将到期的延迟任务批量移回任务队列"""
+        target_key, mode = self._promote_target()
+        moved = self.redis.eval(
+            self.PROMOTE_SCRIPT,
+            2,
+            self.delayed_key,
+            target_key,
+            time.time(),
+            batch_size,
+            mode,
+            Settings.TASK_STREAM_MAXLEN,
+        )
+        if moved:
+            logger.info(f"【TaskQueue-{self.platform}】- 到期的延迟任务已重新投递 {moved} 个")
+        return int(moved or 0)
+
+    async def recover(self) -> int:
+        """找回本消费者上次运行时未确认的任务（List 模式无需处理）"""
+        return 0
+
+    async def reap(self) -> int:
+        """回收超时未确认的任务（List 模式无需处理）"""
+        return 0
+
+    def stats(self) -> dict:
+        """队列统计信息"""
+        return {
+            "backend": "list",
+            "queue_length": self.redis.llen(self.queue_key),
+            "delayed": self.redis.zcard(self.delayed_key),
+        }
+
+
+class ReliableTaskQueue(ListTaskQueue):
+    """
+    基于 BLMOVE 的可靠任务队列
+    - 消费者阻塞地将任务从 {platform}:task_queue 移动到自己的处理中列表
+      {platform}:task_processing:{consumer_id}，有任务时立即返回，无需轮询
+    - 处理中的任务记录在 {platform}:task_processing_deadline（Sorted Set），
+      成员为 "{consumer_id}|{task_id}"，分数为确认截止时间
+    - 任务处理结束后 ack() 从处理中列表移除；回收器将超过截止时间、且任务锁已释放的
+      任务放回队列，消费者崩溃或重启后任务不会丢失
+    - 回收脚本按成员中的消费者ID与任务ID拼接处理中列表与任务锁的键，未在 KEYS 中声明，
+      与其子类 FairTaskQueue、PriorityTaskQueue 一样需部署在单机 Redis 上（不支持 Redis Cluster）
+    """
+
+    # 回收超时任务：任务锁仍被持有时说明任务仍在处理，顺延截止时间
+    # 任务锁与处理中列表的键由 ARGV 中的平台与成员拼接，依赖单机 Redis
+    REAP_SCRIPT = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+    local moved = 0
+    for _, member in ipairs(expired) do
+        local sep = string.find(member, '|', 1, true)
+        local consumer = string.sub(member, 1, sep - 1)
+        local task_id = string.sub(member, sep + 1)
+        if redis.call('EXISTS', ARGV[3] .. ':task_queue_lock:' .. task_id) == 1 then
+            redis.call('ZADD', KEYS[1], tonumber(ARGV[1]) + tonumber(ARGV[4]), member)
+        else
+            local removed = redis.call('LREM', ARGV[3] .. ':task_processing:' .. consumer, 1, task_id)
+            if removed > 0 then
+                redis.call('RPUSH', KEYS[2], task_id)
+                moved = moved + 1
+            end
+            redis.call('ZREM', KEYS[1], member)
+        end
+    end
+    return moved
+    """
+
+    # 找回本消费者处理中列表内的全部任务，放回队列尾部优先处理
+    RECOVER_SCRIPT = """
+    local moved = 0
+    while true do
+        local task_id = redis.call('LMOVE', KEYS[1], KEYS[2], 'RIGHT', 'RIGHT')
+        if not task_id then
+            break
+        end
+        redis.call('ZREM', KEYS[3], ARGV[1] .. '|' .. task_id)
+        moved = moved + 1
+    end
+    return moved
+    """
+
+    def __init__(self, platform: str, consumer_id: str = None):
+        super().__init__(platform, consumer_id)
+        self.async_redis = get_async_redis_client(db=REDIS_TASK_DB)
+        self.processing_key = f"{platform}:task_processing:{self.consumer_id}"
+        self.deadline_key = f"{platform}:task_processing_deadline"
+        self.block_timeout = Settings.TASK_QUEUE_BLOCK_TIMEOUT
+        self.ack_timeout = Settings.TASK_ACK_TIMEOUT
+
+    def _member(self, task_id: str) -> str:
+        return f"{self.consumer_id}|{task_id}"
+
+    async def get_task(self) -> Optional[str]:
+        """阻塞获取任务，超时未获取到时返回 None"""
+        task_id = await self.async_redis.blmove(
+            self.queue_key, self.processing_key, self.block_timeout, "RIGHT", "LEFT"
+        )
+        if task_id:
+            self.redis.zadd(
+                self.deadline_key, {self._member(task_id): time.time() + self.ack_timeout}
+            )
+        return task_id
+
+    async def ack(self, task_id: str, tokens: int = 0):
+        """确认任务处理结束，从处理中列表移除"""
+        pipeline = self.redis.pipeline()
+        pipeline.lrem(self.processing_key, 1, task_id)
+        pipeline.zrem(self.deadline_key, self._member(task_id))
+        pipeline.execute()
+
+    async def touch(self, task_id: str):
+        """任务仍在处理中，顺延其确认截止时间"""
+        self.redis.zadd(
+            self.deadline_key,
+            {self._member(task_id): time.time() + self.ack_timeout},
+            xx=True,
+        )
+
+    async def recover(self) -> int:
+        """找回本消费者上次运行时未确认的任务"""
+        moved = self.redis.eval(
+            self.RECOVER_SCRIPT,
+            3,
+            self.processing_key,
+            self.queue_key,
+            self.deadline_key,
+            self.consumer_id,
+        )
+        if moved:
+            logger.warning(
+                f"【TaskQueue-{self.platform}】- 找回上次未确认的任务 {moved} 个: consumer={self.consumer_id}"
+            )
+        return int(moved or 0)
+
+    async def reap(self) -> int:
+        """将超过确认截止时间的任务放回队列"""
+        moved = self.redis.eval(
+            self.REAP_SCRIPT,
+            2,
+            self.deadline_key,
+            self.queue_key,
+            time.time(),
+            100,
+            self.platform,
+            self.ack_timeout,
+        )
+        if moved:
+            logger.warning(
+                f"【TaskQueue-{self.platform}】- 回收超时未确认的任务 {moved} 个"
+            )
+        return int(moved or 0)
+
+    def stats(self) -> dict:
+        """队列统计信息，包含每个消费者处理中的任务数"""
+        consumers = {}
+        for key in self.redis.scan_iter(f"{self.platform}:task_processing:*"):
+            consumer_id = key.split(":", 2)[2]
+            consumers[consumer_id] = {"pending": self.redis.llen(key)}
+        return {
+            "backend": "reliable",
+            "queue_length": self.redis.llen(self.queue_key),
+            "delayed": self.redis.zcard(self.delayed_key),
+            "pending": self.redis.zcard(self.deadline_key),
+            "consumers": consumers,
+        }
+
+
+class StreamTaskQueue(ListTaskQueue):
+    """
+    基于 Redis Streams 消费者组的任务队列
+    - 任务流：{platform}:task_stream，条目字段 task_id，按 TASK_STREAM_MAXLEN 近似裁剪
+    - 消费者组：{platform}:task_group，消费者名为 consumer_id
+    - XREADGROUP 一次读取 TASK_QUEUE_BATCH_SIZE 条缓存在本地，处理结束后 XACK
+    - 回收器通过 XAUTOCLAIM 接管空闲超过 TASK_ACK_TIMEOUT 的待确认条目
+    """
+
+    def __init__(self, platform: str, consumer_id: str = None):
+        super().__init__(platform, consumer_id)
+        self.async_redis = get_async_redis_client(db=REDIS_TASK_DB)
+        self.stream_key = f"{platform}:task_stream"
+        self.group = f"{platform}:task_group"
+        self.batch_size = max(1, Settings.TASK_QUEUE_BATCH_SIZE)
+        self.block_timeout = Settings.TASK_QUEUE_BLOCK_TIMEOUT
+        self.ack_timeout = Settings.TASK_ACK_TIMEOUT
+        self._buffer = deque()  # 已读取未分发的 (entry_id, task_id)
+        self._entry_ids = {}  # task_id -> entry_id，用于 XACK
+        self._group_ready = False
+
+    def _ensure_group(self):
+        """创建消费者组（已存在时忽略）"""
+        if self._group_ready:
+            return
+        try:
+            self.redis.xgroup_create(self.stream_key, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def _buffer_entries(self, entries) -> int:
+        """将读取到的条目放入本地缓冲"""
+        count = 0
+        for entry_id, fields in entries:
+            # 已被裁剪的条目 fields 为空，直接确认丢弃
+            if not fields or "task_id" not in fields:
+                self.redis.xack(self.stream_key, self.group, entry_id)
+                continue
+            self._buffer.append((entry_id, fields["task_id"]))
+            count += 1
+        return count
+
+    def enqueue(self, task_id: str, pipeline=None, uid: str = None, priority: str = None):
+        """投递任务"""
+        (pipeline if pipeline is not None else self.redis).xadd(
+            self.stream_key,
+            {"task_id": task_id},
+            maxlen=Settings.TASK_STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    async def get_task(self) -> Optional[str]:
+        """优先从本地缓冲取任务，缓冲为空时阻塞批量读取"""
+        self._ensure_group()
+        if not self._buffer:
+            response = await self.async_redis.xreadgroup(
+                self.group,
+                self.consumer_id,
+                {self.stream_key: ">"},
+                count=self.batch_size,
+                block=self.block_timeout * 1000,
+            )
+            for _, entries in response or []:
+                self._buffer_entries(entries)
+        if not self._buffer:
+            return None
+        entry_id, task_id = self._buffer.popleft()
+        self._entry_ids[task_id] = entry_id
+        return task_id
+
+    async def ack(self, task_id: str, tokens: int = 0):
+        """确认任务处理结束"""
+        entry_id = self._entry_ids.pop(task_id, None)
+        if entry_id:
+            self.redis.xack(self.stream_key, self.group, entry_id)
+
+    async def touch(self, task_id: str):
+        """任务仍在处理中，通过 XCLAIM JUSTID 重置条目的空闲时间，避免被其他消费者接管"""
+        entry_id = self._entry_ids.get(task_id)
+        if entry_id:
+            self.redis.xclaim(
+                self.stream_key, self.group, self.consumer_id, 0, [entry_id], justid=True
+            )
+
+    async def requeue(self, task_id: str):
+        """将任务作为新条目重新投递，原条目在 ack() 时确认"""
+        self.enqueue(task_id)
+
+    def _promote_target(self) -> tuple:
+        return self.stream_key, "stream"
+
+    async def recover(self) -> int:
+        """找回本消费者上次运行时已读取但未确认的条目"""
+        self._ensure_group()
+        response = self.redis.xreadgroup(
+            self.group, self.consumer_id, {self.stream_key: "0"}, count=1000
+        )
+        moved = 0
+        for _, entries in response or []:
+            moved += self._buffer_entries(entries)
+        if moved:
+            logger.warning(
+                f"【TaskQueue-{self.platform}】- 找回上次未确认的任务 {moved} 个: consumer={self.consumer_id}"
+            )
+        return moved
+
+    async def reap(self) -> int:
+        """接管其他消费者空闲超时的待确认条目"""
+        self._ensure_group()
+        response = self.redis.xautoclaim(
+            self.stream_key,
+            self.group,
+            self.consumer_id,
+            min_idle_time=self.ack_timeout * 1000,
+            start_id="0-0",
+            count=100,
+        )
+        moved = self._buffer_entries(response[1])
+        if moved:
+            logger.warning(
+                f"【TaskQueue-{self.platform}】- 接管空闲超时的任务 {moved} 个"
+            )
+        return moved
+
+    def stats(self) -> dict:
+        """队列统计信息，包含消费者组的积压（lag）与每个消费者的待确认数"""
+        self._ensure_group()
+        group_info = next(
+            (g for g in self.redis.xinfo_groups(self.stream_key) if g["name"] == self.group),
+            {},
+        )
+        consumers = {
+            c["name"]: {
+                "pending": c["pending"],
+                "idle_ms": c["idle"],
+                "inactive_ms": c.get("inactive"),
+            }
+            for c in self.redis.xinfo_consumers(self.stream_key, self.group)
+        }
+        return {
+            "backend": "stream",
+            "stream_length": self.redis.xlen(self.stream_key),
+            "delayed": self.redis.zcard(self.delayed_key),
+            "lag": group_info.get("lag"),
+            "pending": group_info.get("pending"),
+            "last_delivered_id": group_info.get("last-delivered-id"),
+            "consumers": consumers,
+        }
+
+
+class FairTaskQueue(ReliableTaskQueue):
+    """
+    按用户公平调度的任务队列，在 reliable 模式的处理中列表与确认截止时间之上按用户分队列
+    - 用户队列：{platform}:fair:queue:{uid}（List），生产者在同一 pipeline 内投递并登记活跃用户
+    - 活跃用户轮转：{platform}:fair:active（List），按赤字轮询（DRR）依次服务，
+      每轮用户可取 {platform}:fair:weights 中的权重个任务（默认 FAIR_QUEUE_DEFAULT_WEIGHT），
+      剩余额度保存在 {platform}:fair:deficit，队列取空的用户退出轮转
+    - token 预算：任务确认时按实际消耗的 Gemini token 数累加 {platform}:fair:usage:{uid}:{分钟}，
+      本分钟用量达到 {platform}:fair:caps 中的上限（默认 FAIR_QUEUE_UID_TPM，0 为不限）的用户暂时跳过
+    - 回收、找回与重新投递的任务以及到期的延迟重试任务放回 {platform}:task_queue，已经轮到过，优先取出，
+      其用户取自任务信息 {platform}:task_info:{task_id} 中的 uid
+    - 选择用户、取出任务与登记处理中在一次脚本调用内完成；无任务时阻塞等待 {platform}:fair:signal 的投递通知
+    - 用户队列与 token 用量的键在脚本内按平台与用户拼接，未在 KEYS 中声明，需部署在单机 Redis 上（不支持 Redis Cluster）
+    """
+
+    # 投递：写入用户队列，用户不在轮转中时加入队尾，并发出投递通知
+    # KEYS: 活跃用户轮转, 投递通知
+    # ARGV: 平台, 用户, 任务ID
+    # 用户队列 {平台}:fair:queue:{用户} 在脚本内拼接，依赖单机 Redis
+    ENQUEUE_SCRIPT = """
+    local queue = ARGV[1] .. ':fair:queue:' .. ARGV[2]
+    if redis.call('LPUSH', queue, ARGV[3]) == 1 and not redis.call('LPOS', KEYS[1], ARGV[2]) then
+        redis.call('LPUSH', KEYS[1], ARGV[2])
+    end
+    redis.call('LPUSH', KEYS[2], '1')
+    redis.call('LTRIM', KEYS[2], 0, 99)
+    return 1
+    """
+
+    # 取出任务：轮转右端为当前用户，额度用完、超出 token 预算或队列为空时轮到下一位
+    # KEYS: 放回队列, 活跃用户轮转, 剩余额度, 权重, token 上限, 处理中列表, 确认截止时间
+    # ARGV: 平台, 确认截止时间, 消费者ID, 默认权重, 默认 token 上限, 当前分钟
+    # 返回：{任务ID, 用户}，放回队列中的任务用户为空；没有可取的任务时返回空
+    # 用户队列与 token 用量的键按轮转中的用户拼接，依赖单机 Redis
+    CLAIM_SCRIPT = """
+    local task_id, uid = redis.call('RPOP', KEYS[1]), ''
+    if not task_id then
+        for _ = 1, redis.call('LLEN', KEYS[2]) do
+            uid = redis.call('LINDEX', KEYS[2], -1)
+            local queue = ARGV[1] .. ':fair:queue:' .. uid
+            local cap = tonumber(redis.call('HGET', KEYS[5], uid) or ARGV[5])
+            local used = tonumber(redis.call('GET', ARGV[1] .. ':fair:usage:' .. uid .. ':' .. ARGV[6]) or '0')
+            if redis.call('LLEN', queue) == 0 then
+                redis.call('RPOP', KEYS[2])
+                redis.call('HDEL', KEYS[3], uid)
+            elseif cap > 0 and used >= cap then
+                redis.call('LMOVE', KEYS[2], KEYS[2], 'RIGHT', 'LEFT')
+            else
+                local deficit = tonumber(redis.call('HGET', KEYS[3], uid) or '0')
+                if deficit < 1 then
+                    deficit = deficit + math.max(tonumber(redis.call('HGET', KEYS[4], uid) or ARGV[4]), 1)
+                end
+                task_id = redis.call('RPOP', queue)
+                deficit = deficit - 1
+                if deficit < 1 or redis.call('LLEN', queue) == 0 then
+                    redis.call('LMOVE', KEYS[2], KEYS[2], 'RIGHT', 'LEFT')
+                    deficit = 0
+                end
+                redis.call('HSET', KEYS[3], uid, deficit)
+                break
+            end
+        end
+    end
+    if not task_id then
+        return nil
+    end
+    redis.call('LPUSH', KEYS[6], task_id)
+    redis.call('ZADD', KEYS[7], ARGV[2], ARGV[3] .. '|' .. task_id)
+    return {task_id, uid}
+    """
+
+    def __init__(self, platform: str, consumer_id: str = None):
+        super().__init__(platform, consumer_id)
+        self.active_key = f"{platform}:fair:active"
+        self.signal_key = f"{platform}:fair:signal"
+        self.deficit_key = f"{platform}:fair:deficit"
+        self.weights_key = f"{platform}:fair:weights"
+        self.caps_key = f"{platform}:fair:caps"
+        self.default_weight = max(1, Settings.FAIR_QUEUE_DEFAULT_WEIGHT)
+        self.default_cap = Settings.FAIR_QUEUE_UID_TPM
+        self._enqueue_script = self.redis.register_script(self.ENQUEUE_SCRIPT)
+        self._claim_script = self.redis.register_script(self.CLAIM_SCRIPT)
+        self._task_uids = {}  # task_id -> uid，确认时按用户累计 token 用量，缺失时读取任务信息
+        # 配置中的权重与上限写入 Redis，运行中可直接修改这两个 Hash
+        for key, value in ((self.weights_key, Settings.FAIR_QUEUE_WEIGHTS), (self.caps_key, Settings.FAIR_QUEUE_UID_CAPS)):
+            mapping = self._parse_mapping(value)
+            if mapping:
+                self.redis.hset(key, mapping=mapping)
+
+    @staticmethod
+    def _parse_mapping(value: str) -> dict:
+        """解析 "uid1:3,uid2:5" 格式的配置"""
+        mapping = {}
+        for item in (value or "").split(","):
+            uid, _, number = item.strip().rpartition(":")
+            if uid and number.isdigit():
+                mapping[uid] = int(number)
+        return mapping
+
+    def _usage_key(self, uid: str, minute: int = None) -> str:
+        minute = int(time.time() // 60) if minute is None else minute
+        return f"{self.platform}:fair:usage:{uid}:{minute}"
+
+    def enqueue(self, task_id: str, pipeline=None, uid: str = None, priority: str = None):
+        """投递任务到用户队列"""
+        self._enqueue_script(
+            keys=[self.active_key, self.signal_key],
+            args=[self.platform, uid or "0", task_id],
+            client=pipeline if pipeline is not None else self.redis,
+        )
+
+    def _claim(self) -> Optional[str]:
+        """按公平调度取出一个任务并登记为处理中"""
+        result = self._claim_script(
+            keys=[
+                self.queue_key, self.active_key, self.deficit_key, self.weights_key,
+                self.caps_key, self.processing_key, self.deadline_key,
+            ],
+            args=[
+                self.platform, time.time() + self.ack_timeout, self.consumer_id,
+                self.default_weight, self.default_cap, int(time.time() // 60),
+            ],
+        )
+        if not result:
+            return None
+        task_id, uid = result
+        # 放回队列中的任务（回收、找回、重新投递）不经过用户队列，用户取自任务信息
+        uid = uid or self._task_uid(task_id)
+        if uid:
+            self._task_uids[task_id] = uid
+        return task_id
+
+    def _task_uid(self, task_id: str) -> Optional[str]:
+        """任务信息中记录的提交用户"""
+        return self.redis.hget(f"{self.platform}:task_info:{task_id}", "uid")
+
+    async def get_task(self) -> Optional[str]:
+        """取出任务，没有可取的任务时阻塞等待投递通知，超时返回 None"""
+        task_id = self._claim()
+        if task_id:
+            return task_id
+        if await self.async_redis.blpop(self.signal_key, self.block_timeout):
+            return self._claim()
+        return None
+
+    async def ack(self, task_id: str, tokens: int = 0):
+        """确认任务处理结束，并将消耗的 token 计入用户本分钟的预算"""
+        uid = self._task_uids.pop(task_id, None) or (self._task_uid(task_id) if tokens else None)
+        pipeline = self.redis.pipeline()
+        pipeline.lrem(self.processing_key, 1, task_id)
+        pipeline.zrem(self.deadline_key, self._member(task_id))
+        if uid and tokens:
+            usage_key = self._usage_key(uid)
+            pipeline.incrby(usage_key, int(tokens))
+            pipeline.expire(usage_key, 120)
+        pipeline.execute()
+
+    def stats(self) -> dict:
+        """队列统计信息，包含各活跃用户的排队数、剩余额度、权重与本分钟 token 用量"""
+        stats = super().stats()
+        deficits = self.redis.hgetall(self.deficit_key)
+        weights = self.redis.hgetall(self.weights_key)
+        caps = self.redis.hgetall(self.caps_key)
+        users = {}
+        for uid in self.redis.lrange(self.active_key, 0, -1):
+            users[uid] = {
+                "queued": self.redis.llen(f"{self.platform}:fair:queue:{uid}"),
+                "deficit": float(deficits.get(uid, 0)),
+                "weight": int(weights.get(uid, self.default_weight)),
+                "tokens_this_minute": int(self.redis.get(self._usage_key(uid)) or 0),
+                "token_cap": int(caps.get(uid, self.default_cap)),
+            }
+        stats.update({"backend": "fair", "users": users})
+        return stats
+
+
+class PriorityTaskQueue(ReliableTaskQueue):
+    """
+    按优先级分队列的任务队列，在 reliable 模式的处理中列表与确认截止时间之上实现
+    - 优先级队列：{platform}:task_queue:{high|normal|low}（Sorted Set），分数为投递时间
+    - 严格优先、随等待时间提升：各队列队首按 投递时间 + 该优先级的偏移（high 为 0，
+      normal 为 PRIORITY_AGING_NORMAL，low 为 PRIORITY_AGING_LOW 秒）比较，最小者先取；
+      低优先级任务比高优先级队首早投递超过偏移时即被取出，不会无限期等待
+    - 批量任务限流：low 队列为批量任务，处理中的批量任务（所有平台共用 task_queue:priority:bulk_inflight）
+      不超过自适应上限；任一平台 high 队列队首等待超过 PRIORITY_INTERACTIVE_TARGET_WAIT 时上限减半，
+      否则逐步加一直至 PRIORITY_BULK_MAX_INFLIGHT，每 PRIORITY_THROTTLE_INTERVAL 秒调整一次，最低为 1
+    - 回收、找回的任务放回 {platform}:task_queue 优先取出；重新投递与到期的延迟重试任务按任务信息中的优先级回到对应队列
+    - 选择队列、取出任务与登记处理中在一次脚本调用内完成；无任务时阻塞等待 {platform}:task_queue:signal 的投递通知
+    - 取出脚本跨平台读取各 high 队列，延迟任务移回脚本按任务信息拼接优先级队列的键，需部署在单机 Redis 上（不支持 Redis Cluster）
+    """
+
+    LANES = ("high", "normal", "low")
+    DEFAULT_LANE = "normal"
+    # 共享 Gemini 配额的全部平台，交互任务的等待时间按所有平台计算
+    PLATFORMS = QUEUE_PLATFORMS
+    THROTTLE_KEY = "task_queue:priority:throttle"
+    BULK_INFLIGHT_KEY = "task_queue:priority:bulk_inflight"
+    WAIT_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+    # 取出任务
+    # KEYS: 放回队列, high, normal, low, 处理中列表, 确认截止时间, 处理中的批量任务, 限流状态, 各平台的 high 队列...
+    # ARGV: 当前时间, 确认截止时间, 消费者ID, normal 偏移, low 偏移, 交互等待目标, 批量上限, 调整间隔
+    # 返回：{任务ID, 优先级, 投递时间}，放回队列中的任务优先级与投递时间为空；没有可取的任务时返回空
+    CLAIM_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local function claim(task_id, lane, enqueued_at)
+        redis.call('LPUSH', KEYS[5], task_id)
+        redis.call('ZADD', KEYS[6], ARGV[2], ARGV[3] .. '|' .. task_id)
+        return {task_id, lane, enqueued_at}
+    end
+    local returned = redis.call('RPOP', KEYS[1])
+    if returned then
+        return claim(returned, '', '')
+    end
+
+    -- 交互任务等待超过目标时批量任务上限减半，否则加一
+    local interactive_wait = 0
+    for i = 9, #KEYS do
+        local head = redis.call('ZRANGE', KEYS[i], 0, 0, 'WITHSCORES')
+        if head[2] then
+            interactive_wait = math.max(interactive_wait, now - tonumber(head[2]))
+        end
+    end
+    local max_limit = tonumber(ARGV[7])
+    local limit = tonumber(redis.call('HGET', KEYS[8], 'limit') or ARGV[7])
+    if now - tonumber(redis.call('HGET', KEYS[8], 'adjusted_at') or '0') >= tonumber(ARGV[8]) then
+        if interactive_wait > tonumber(ARGV[6]) then
+            limit = math.max(1, math.floor(limit / 2))
+        else
+            limit = math.min(max_limit, limit + 1)
+        end
+        redis.call('HSET', KEYS[8], 'limit', limit, 'adjusted_at', now, 'interactive_wait', interactive_wait)
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[7], '-inf', now)
+
+    local offsets = {0, tonumber(ARGV[4]), tonumber(ARGV[5])}
+    local lanes = {'high', 'normal', 'low'}
+    local best, best_lane, best_score, best_enqueued
+    for i = 1, 3 do
+        local head = redis.call('ZRANGE', KEYS[i + 1], 0, 0, 'WITHSCORES')
+        if head[1] and (i < 3 or redis.call('ZCARD', KEYS[7]) < limit) then
+            local score = tonumber(head[2]) + offsets[i]
+            if not best_score or score < best_score then
+                best, best_lane, best_score, best_enqueued = head[1], i, score, head[2]
+            end
+        end
+    end
+    if not best then
+        return nil
+    end
+    redis.call('ZREM', KEYS[best_lane + 1], best)
+    if best_lane == 3 then
+        redis.call('ZADD', KEYS[7], ARGV[2], best)
+    end
+    return claim(best, lanes[best_lane], best_enqueued)
+    """
+
+    # 将到期的延迟任务按任务信息中的优先级移回对应队列
+    # KEYS: 延迟重试队列
+    # ARGV: 当前时间, 数量上限, 平台
+    # 任务信息、优先级队列与投递通知的键由平台与任务ID拼接，依赖单机 Redis
+    PROMOTE_SCRIPT = """
+    local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+    for _, task_id in ipairs(due) do
+        redis.call('ZREM', KEYS[1], task_id)
+        local lane = redis.call('HGET', ARGV[3] .. ':task_info:' .. task_id, 'priority')
+        if lane ~= 'high' and lane ~= 'low' then
+            lane = 'normal'
+        end
+        redis.call('ZADD', ARGV[3] .. ':task_queue:' .. lane, ARGV[1], task_id)
+    end
+    if #due > 0 then
+        redis.call('LPUSH', ARGV[3] .. ':task_queue:signal', '1')
+        redis.call('LTRIM', ARGV[3] .. ':task_queue:signal', 0, 99)
+    end
+    return #due
+    """
+
+    def __init__(self, platform: str, consumer_id: str = None):
+        super().__init__(platform, consumer_id)
+        self.lane_keys = {lane: f"{platform}:task_queue:{lane}" for lane in self.LANES}
+        self.signal_key = f"{platform}:task_queue:signal"
+        self.interactive_keys = [f"{p}:task_queue:high" for p in self.PLATFORMS]
+        self.aging = (Settings.PRIORITY_AGING_NORMAL, Settings.PRIORITY_AGING_LOW)
+        self.target_wait = Settings.PRIORITY_INTERACTIVE_TARGET_WAIT
+        self.bulk_max_inflight = max(1, Settings.PRIORITY_BULK_MAX_INFLIGHT)
+        self.throttle_interval = Settings.PRIORITY_THROTTLE_INTERVAL
+        self._claim_script = self.redis.register_script(self.CLAIM_SCRIPT)
+        self._promote_script = self.redis.register_script(self.PROMOTE_SCRIPT)
+        self._bulk_tasks = set()  # 本消费者处理中的批量任务
+
+    def _lane(self, priority: str = None) -> str:
+        return priority if priority in self.LANES else self.DEFAULT_LANE
+
+    def enqueue(self, task_id: str, pipeline=None, uid: str = None, priority: str = None):
+        """按优先级投递任务，并发出投递通知"""
+        client = pipeline if pipeline is not None else self.redis.pipeline()
+        client.zadd(self.lane_keys[self._lane(priority)], {task_id: time.time()}, nx=True)
+        client.lpush(self.signal_key, "1")
+        client.ltrim(self.signal_key, 0, 99)
+        if pipeline is None:
+            client.execute()
+
+    async def requeue(self, task_id: str):
+        """按任务信息中的优先级重新投递"""
+        priority = self.redis.hget(f"{self.platform}:task_info:{task_id}", "priority")
+        self.enqueue(task_id, priority=priority)
+
+    def _claim(self) -> Optional[str]:
+        """按优先级取出一个任务并登记为处理中"""
+        now = time.time()
+        result = self._claim_script(
+            keys=[
+                self.queue_key, *self.lane_keys.values(), self.processing_key, self.deadline_key,
+                self.BULK_INFLIGHT_KEY, self.THROTTLE_KEY, *self.interactive_keys,
+            ],
+            args=[
+                now, now + self.ack_timeout, self.consumer_id, *self.aging,
+                self.target_wait, self.bulk_max_inflight, self.throttle_interval,
+            ],
+        )
+        if not result:
+            return None
+        task_id, lane, enqueued_at = result
+        if lane:
+            metrics.observe(f"task_queue_wait:{lane}", max(now - float(enqueued_at), 0), self.WAIT_BUCKETS)
+        if lane == "low":
+            self._bulk_tasks.add(task_id)
+        return task_id
+
+    async def get_task(self) -> Optional[str]:
+        """取出任务，没有可取的任务时阻塞等待投递通知，超时返回 None"""
+        task_id = self._claim()
+        if task_id:
+            return task_id
+        if await self.async_redis.blpop(self.signal_key, self.block_timeout):
+            return self._claim()
+        return None
+
+    async def ack(self, task_id: str, tokens: int = 0):
+        """确认任务处理结束，批量任务同时移出处理中的批量任务"""
+        await super().ack(task_id, tokens)
+        if task_id in self._bulk_tasks:
+            self._bulk_tasks.discard(task_id)
+            self.redis.zrem(self.BULK_INFLIGHT_KEY, task_id)
+
+    async def touch(self, task_id: str):
+        """顺延确认截止时间，批量任务同时顺延其在处理中批量任务里的有效期"""
+        await super().touch(task_id)
+        if task_id in self._bulk_tasks:
+            self.redis.zadd(self.BULK_INFLIGHT_KEY, {task_id: time.time() + self.ack_timeout}, xx=True)
+
+    async def promote_due(self, batch_size: int = 100) -> int:
+        """将到期的延迟任务按优先级移回对应队列"""
+        moved = self._promote_script(
+            keys=[self.delayed_key], args=[time.time(), batch_size, self.platform]
+        )
+        if moved:
+            logger.info(f"【TaskQueue-{self.platform}】- 到期的延迟任务已重新投递 {moved} 个")
+        return int(moved or 0)
+
+    def stats(self) -> dict:
+        """队列统计信息，包含各优先级的排队数与队首等待时间、批量任务限流状态"""
+        stats = super().stats()
+        now = time.time()
+        lanes = {}
+        for lane, key in self.lane_keys.items():
+            head = self.redis.zrange(key, 0, 0, withscores=True)
+            lanes[lane] = {
+                "queued": self.redis.zcard(key),
+                "oldest_wait_seconds": round(now - head[0][1], 3) if head else 0,
+                "wait_histogram": metrics.get_histogram(f"task_queue_wait:{lane}", self.WAIT_BUCKETS),
+            }
+        throttle = self.redis.hgetall(self.THROTTLE_KEY)
+        stats.update({
+            "backend": "priority",
+            "lanes": lanes,
+            "bulk": {
+                "inflight": self.redis.zcount(self.BULK_INFLIGHT_KEY, now, "+inf"),
+                "limit": int(float(throttle.get("limit", self.bulk_max_inflight))),
+                "max_inflight": self.bulk_max_inflight,
+                "interactive_wait": round(float(throttle.get("interactive_wait", 0)), 3),
+                "target_wait": self.target_wait,
+            },
+        })
+        return stats
+
+
+def create_task_queue(platform: str, consumer_id: str = None) -> ListTaskQueue:
+    """根据 TASK_QUEUE_BACKEND 配置创建任务队列"""
+    backends = {
+        "list": ListTaskQueue,
+        "reliable": ReliableTaskQueue,
+        "stream": StreamTaskQueue,
+        "fair": FairTaskQueue,
+        "priority": PriorityTaskQueue,
+    }
+    backend = Settings.TASK_QUEUE_BACKEND
+    if backend not in backends:
+        raise ValueError(f"不支持的任务队列类型: {backend}")
+    return backends[backend](platform, consumer_id)
+
+
+_shared_queues = {}  # (platform, consumer_id) -> 任务队列
+
+
+def get_task_queue(platform: str, consumer_id: str = None) -> ListTaskQueue:
+    """
+    获取进程内共享的任务队列，每个平台只创建一次（Redis 客户端与脚本随之复用）
+    供生产者与统计接口等每次请求都需要访问队列的调用方使用；消费者持有自己的实例
+    """
+    key = (platform, consumer_id)
+    if key not in _shared_queues:
+        _shared_queues[key] = create_task_queue(platform, consumer_id)
+    return _shared_queues[key]
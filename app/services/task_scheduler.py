@@ -0,0 +1,83 @@
+import asyncio
+from typing import Coroutine, Set
+from app.services.logger import get_logger
+
+logger = get_logger()
+
+
+class TaskScheduler:
+    """
+    有界并发任务调度器
+    在同一个事件循环内最多同时运行 limit 个任务：
+    1、调用方先 wait_for_slot() 等待空闲槽位，再取任务并 spawn()，避免任务被取出后积压在本地
+    2、limit 可在运行时通过 set_limit() 调整，缩小上限时已在运行的任务不受影响
+    3、停机时通过 drain() 等待在途任务完成，超时后取消剩余任务
+    """
+
+    def __init__(self, limit: int, name: str = "TaskScheduler"):
+        self.name = name
+        self._limit = max(1, int(limit))
+        self._running = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._condition = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        """当前在途任务数"""
+        return self._running
+
+    async def set_limit(self, limit: int):
+        """调整并发上限"""
+        async with self._condition:
+            self._limit = max(1, int(limit))
+            self._condition.notify_all()
+        logger.info(f"【{self.name}】- 并发上限调整为 {self._limit}")
+
+    async def wait_for_slot(self):
+        """等待出现空闲槽位"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._running < self._limit)
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        """在事件循环中启动任务并占用一个槽位"""
+        self._running += 1
+        task = asyncio.create_task(self._run(coro))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, coro: Coroutine):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            logger.warning(f"【{self.name}】- 任务被取消")
+            raise
+        except Exception as e:
+            logger.error(f"【{self.name}】- 任务执行异常: {str(e)}")
+        finally:
+            async with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    async def drain(self, timeout: float = None):
+        """
+        等待所有在途任务完成
+        Args:
+            timeout: 最长等待时间（秒），超时后取消仍未完成的任务；None 表示一直等待
+        """
+        if not self._tasks:
+            return
+        logger.info(f"【{self.name}】- 等待 {len(self._tasks)} 个在途任务完成")
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.error(
+                f"【{self.name}】- 等待在途任务超时({timeout}秒)，取消 {len(pending)} 个任务"
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,86 @@
+from typing import Optional
+from app.db.redis_decorators import REDIS_TASK_DB, get_redis_client
+from app.services.logger import get_logger
+
+logger = get_logger()
+
+
+class TokenEstimator:
+    """
+    生成请求输入 token 数的估算，用于请求前预占限流配额
+    - 视频：上传时按时长估算（约 263 token/秒，含音频），首次请求返回 usage_metadata 后改为实测值，
+      保存在 video_tokens:{文件名}（String），同一文件的其他维度、重试与复用该文件的任务直接使用
+    - 提示词：按 UTF-8 字节数估算，中文约 1 字/token，英文与 JSON 约 3 字符/token
+    """
+
+    KEY_PREFIX = "video_tokens"
+    # 每秒视频（含音频）的 token 数
+    VIDEO_TOKENS_PER_SECOND = 263
+    # 无法获取时长时按 1 Mbps 码率由文件大小折算时长
+    BYTES_PER_SECOND = 125_000
+    # 时长与大小均未知时的视频时长（秒）
+    DEFAULT_DURATION = 60
+    # 与 Files API 文件保留期一致（秒）
+    TTL = 48 * 3600
+
+    def __init__(self):
+        self.redis = get_redis_client(db=REDIS_TASK_DB)
+
+    def _key(self, file_name: str) -> str:
+        return f"{self.KEY_PREFIX}:{file_name}"
+
+    @staticmethod
+    def prompt_tokens(*texts: str) -> int:
+        """提示词的 token 数估算"""
+        return sum(len((text or "").encode("utf-8")) for text in texts) // 3
+
+    def record_upload(self, file_name: str, duration: Optional[float], size_bytes: int):
+        """上传文件后按时长（或大小）登记视频 token 数的估算值"""
+        if not duration:
+            duration = size_bytes / self.BYTES_PER_SECOND if size_bytes else self.DEFAULT_DURATION
+        try:
+            self.redis.set(
+                self._key(file_name), int(duration * self.VIDEO_TOKENS_PER_SECOND), ex=self.TTL, nx=True
+            )
+        except Exception as e:
+            logger.warning(f"【TokenEstimator】- 登记视频 token 估算失败: {file_name}, error={str(e)}")
+
+    def video_tokens(self, google_file) -> int:
+        """
+        视频的 token 数：实测值或上传时的估算值，都没有时按文件大小折算
+        随请求发送的视频（types.Part）没有文件名，按数据大小折算
+        """
+        inline_data = getattr(google_file, "inline_data", None)
+        if inline_data is not None:
+            size_bytes = len(inline_data.data or b"")
+            return int(size_bytes / self.BYTES_PER_SECOND * self.VIDEO_TOKENS_PER_SECOND)
+        file_name = getattr(google_file, "name", None)
+        if file_name:
+            try:
+                value = self.redis.get(self._key(file_name))
+                if value:
+                    return int(value)
+            except Exception as e:
+                logger.warning(f"【TokenEstimator】- 读取视频 token 数失败: {file_name}, error={str(e)}")
+        size_bytes = getattr(google_file, "size_bytes", None) or 0
+        duration = size_bytes / self.BYTES_PER_SECOND if size_bytes else self.DEFAULT_DURATION
+        return int(duration * self.VIDEO_TOKENS_PER_SECOND)
+
+    def estimate(self, google_file, *prompts: str) -> int:
+        """一次生成请求的输入 token 数估算"""
+        return self.video_tokens(google_file) + self.prompt_tokens(*prompts)
+
+    def observe(self, google_file, prompt_token_count: int, *prompts: str):
+        """用实际输入 token 数校正该文件的视频 token 数"""
+        file_name = getattr(google_file, "name", None)
+        if not file_name or not prompt_token_count:
+            return
+        measured = max(int(prompt_token_count) - self.prompt_tokens(*prompts), 0)
+        try:
+            self.redis.set(self._key(file_name), measured, ex=self.TTL)
+        except Exception as e:
+            logger.warning(f"【TokenEstimator】- 保存视频 token 实测值失败: {file_name}, error={str(e)}")
+
+
+# 全局估算器实例
+token_estimator = TokenEstimator()
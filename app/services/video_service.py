@@ -1,4 +1,7 @@
 from pathlib import Path
+from typing import Optional, Tuple
+import hashlib
+import struct
 import aiohttp
 from fastapi import HTTPException
 import ssl
@@ -88,20 +91,97 @@ class VideoService:
 
     async def download_video(self, url: str, task_id: str) -> Path:
         """下载视频到指定目录"""
+        video_path, _ = await self.download_video_with_hash(url, task_id)
+        return video_path
+
+    async def download_video_with_hash(self, url: str, task_id: str) -> Tuple[Path, str]:
+        """
+        下载视频到指定目录，并在下载过程中计算文件内容的 SHA-256
+        Returns:
+            tuple: (视频路径, 内容哈希)
+        """
         video_dir = self._create_video_directory(task_id)
         filename = self._get_valid_filename(url, task_id)
         video_path = os.path.join(video_dir, filename)
 
         try:
-            await self._download_file(url, video_path)
-            logger.info(f"成功下载视频: {url} 到 {video_path}")
-            return video_path
+            content_hash = await self._download_file(url, video_path)
+            logger.info(f"成功下载视频: {url} 到 {video_path}, sha256={content_hash}")
+            return video_path, content_hash
         except Exception as e:
             logger.error(f"下载视频失败: {e}")
-            if video_path.exists():
+            if os.path.exists(video_path):
                 os.remove(video_path)
             raise HTTPException(status_code=500, detail=f"下载视频失败: {str(e)}")
 
+    @staticmethod
+    def delete_local_file(file_path: str):
+        """删除下载的本地视频文件及其所在的任务目录（目录为空时）"""
+        if os.path.exists(file_path):
+            # 删除文件
+            os.remove(file_path)
+            logger.info(f"【本地】- 已清理本地文件：{file_path}")
+
+            # 获取文件所在目录
+            dir_path = os.path.dirname(file_path)
+
+            # 删除上层目录
+            try:
+                os.rmdir(dir_path)  # 尝试删除目录
+                logger.info(f"【本地】- 已清理上层目录：{dir_path}")
+            except OSError as e:
+                if e.errno == 39:  # 39 表示目录不为空
+                    logger.info(f"【本地】- 上层目录不为空，无法删除：{dir_path}")
+                else:
+                    logger.error(f"【本地】- 删除上层目录时出错：{e}")
+        else:
+            logger.warning(f"【本地】- 文件不存在，无法删除：{file_path}")
+
+    @staticmethod
+    def get_video_duration(file_path: str) -> Optional[float]:
+        """
+        读取 MP4/MOV 视频时长（秒）
+        解析 moov/mvhd 中的 timescale 与 duration，无需额外依赖；其他格式或解析失败时返回 None
+        """
+        def find_box(f, box_type: bytes, end: int) -> Optional[Tuple[int, int]]:
+            """在 [当前位置, end) 范围内查找指定类型的 box，返回 (内容起始位置, box 结束位置)"""
+            while f.tell() + 8 <= end:
+                start = f.tell()
+                size, current_type = struct.unpack(">I4s", f.read(8))
+                header = 8
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    header = 16
+                elif size == 0:
+                    size = end - start
+                if size < header:
+                    return None
+                if current_type == box_type:
+                    return start + header, start + size
+                f.seek(start + size)
+            return None
+
+        try:
+            with open(file_path, "rb") as f:
+                file_size = os.fstat(f.fileno()).st_size
+                moov = find_box(f, b"moov", file_size)
+                if not moov:
+                    return None
+                f.seek(moov[0])
+                mvhd = find_box(f, b"mvhd", moov[1])
+                if not mvhd:
+                    return None
+                f.seek(mvhd[0])
+                version = f.read(4)[0]
+                if version == 1:
+                    timescale, duration = struct.unpack(">16xIQ", f.read(28))
+                else:
+                    timescale, duration = struct.unpack(">8xII", f.read(16))
+                return round(duration / timescale, 3) if timescale else None
+        except Exception as e:
+            logger.warning(f"读取视频时长失败: {file_path}, {e}")
+            return None
+
     def _get_valid_filename(self, url: str, task_id: str) -> str:
         """从URL获取有效的文件名"""
         try:
@@ -123,13 +203,14 @@ class VideoService:
         os.makedirs(str(video_dir), exist_ok=True)
         return video_dir
 
-    async def _download_file(self, url: str, file_path: Path) -> None:
-        """下载文件到指定路径"""
+    async def _download_file(self, url: str, file_path: Path) -> str:
+        """下载文件到指定路径，返回文件内容的 SHA-256（十六进制）"""
         async with await self._create_session() as session:
             async with session.get(url) as response:
                 if response.status != 200:
                     raise HTTPException(status_code=400, detail=f"下载视频失败，状态码: {response.status}")
                 
+                digest = hashlib.sha256()
                 with open(file_path, "wb") as f:
                     chunk_size = 8192
                     # total_size = int(response.headers.get("content-length", 0))
@@ -138,9 +219,11 @@ class VideoService:
                     async for chunk in response.content.iter_chunked(chunk_size):
                         if chunk:
                             f.write(chunk)
+                            digest.update(chunk)
                             downloaded += len(chunk)
                             
                             # 每下载50%记录一次日志
                             # if total_size > 0 and downloaded % (total_size // 2) < chunk_size:
                             #     progress = (downloaded / total_size) * 100
-                            #     logger.debug(f"下载进度: {progress:.1f}%")
\ No newline at end of file
+                            #     logger.debug(f"下载进度: {progress:.1f}%")
+                return digest.hexdigest()
@@ -32,15 +32,118 @@ class Settings:
 
     # API配置
     API_KEYS_FILE = os.getenv("API_KEYS_FILE")
+    # 账号被限流（429）后暂停使用的时间（秒）
+    ACCOUNT_COOLDOWN_SECONDS = int(os.getenv("ACCOUNT_COOLDOWN_SECONDS", 60))
+    # 等待可用账号的最长时间（秒），超时后任务按配额错误退避重试
+    ACCOUNT_ACQUIRE_TIMEOUT = int(os.getenv("ACCOUNT_ACQUIRE_TIMEOUT", 300))
+    # 是否在生成请求前按估算的输入 token 数预占每个密钥的每分钟限流配额
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    # 每个密钥每分钟的最大请求数与输入 token 数（账号池中配置了分钟配额 minute_limit 的密钥，请求数上限以分钟配额为准）
+    RATE_LIMIT_RPM = int(os.getenv("RATE_LIMIT_RPM", 2000))
+    RATE_LIMIT_TPM = int(os.getenv("RATE_LIMIT_TPM", 4000000))
+    # 限流算法：gcra-平滑放行，任意 60 秒内不超过上限；window-固定 60 秒窗口
+    RATE_LIMIT_MODE = os.getenv("RATE_LIMIT_MODE", "gcra")
+    # gcra 模式下允许的突发量（秒），空闲后最多一次放行该时长对应的配额
+    RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", 10))
+    # 是否按租约预占：每个进程一次预占一份配额，本地扣减，到期归还剩余部分，减少每次调用的 Redis 访问
+    RATE_LIMIT_LEASE_ENABLED = os.getenv("RATE_LIMIT_LEASE_ENABLED", "false").lower() == "true"
+    # 租约有效期（秒）与每份租约的请求数、token 数
+    RATE_LIMIT_LEASE_SECONDS = float(os.getenv("RATE_LIMIT_LEASE_SECONDS", 2))
+    RATE_LIMIT_LEASE_REQUESTS = int(os.getenv("RATE_LIMIT_LEASE_REQUESTS", 10))
+    RATE_LIMIT_LEASE_TOKENS = int(os.getenv("RATE_LIMIT_LEASE_TOKENS", 200000))
+    # 配额不足时是否按先来先到排队等待（队首预占成功后通过 pub/sub 唤醒下一位），关闭时各等待者按等待时间各自重试
+    RATE_LIMIT_FIFO_ENABLED = os.getenv("RATE_LIMIT_FIFO_ENABLED", "true").lower() == "true"
+    # 等待限流配额的最长时间（秒），超时后任务按配额错误退避重试
+    RATE_LIMIT_WAIT_TIMEOUT = int(os.getenv("RATE_LIMIT_WAIT_TIMEOUT", 120))
 
     # 视频处理配置
     MAX_VIDEO_SIZE_MB = int(os.getenv("MAX_VIDEO_SIZE_MB", 100))
     ALLOWED_VIDEO_FORMATS = ["mp4","avi","mov", "wav"]
+    # 不超过该大小（MB）的视频随请求直接发送，不经过 Files API 上传；0 表示关闭，上限约 18MB
+    INLINE_VIDEO_MAX_MB = float(os.getenv("INLINE_VIDEO_MAX_MB", 5))
 
     # API Key
     API_KEY = os.getenv("API_KEY")
+    # 标签生成使用的模型
+    GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
 
     # 视频拆分维度
     VIDEO_DIMENSIONS= ["vision", "audio", "content", "business"]
 
+    # 单个任务内维度标签生成的最大并发数（1 表示按顺序逐个生成）
+    DIMENSION_CONCURRENCY = int(os.getenv("DIMENSION_CONCURRENCY", 4))
+    # 维度生成方式：separate-每个维度单独请求，combined-一次请求生成全部维度（失败或输出被截断时回退为逐维度请求）
+    DIMENSION_MODE = os.getenv("DIMENSION_MODE", "separate")
+    # 合并生成时的最大输出 token 数
+    COMBINED_MAX_OUTPUT_TOKENS = int(os.getenv("COMBINED_MAX_OUTPUT_TOKENS", 8192))
+    # 是否流式生成标签：边接收边解析，输出闭合即返回，结构不合法时提前中止
+    GENERATION_STREAM = os.getenv("GENERATION_STREAM", "false").lower() == "true"
+
+    # 消费者配置
+    # 单个消费者进程内同时处理的任务数上限
+    CONSUMER_CONCURRENCY = int(os.getenv("CONSUMER_CONCURRENCY", 4))
+    # 停机时等待在途任务完成的最长时间（秒），超时后取消剩余任务
+    CONSUMER_DRAIN_TIMEOUT = int(os.getenv("CONSUMER_DRAIN_TIMEOUT", 300))
+
+    # 任务队列配置
+    # 队列实现：list-RPOP轮询（默认），reliable-BLMOVE可靠队列，stream-Redis Streams消费者组，
+    # fair-按用户公平调度的可靠队列，priority-按优先级分队列的可靠队列
+    TASK_QUEUE_BACKEND = os.getenv("TASK_QUEUE_BACKEND", "list")
+    # 阻塞获取任务的超时时间（秒）
+    TASK_QUEUE_BLOCK_TIMEOUT = int(os.getenv("TASK_QUEUE_BLOCK_TIMEOUT", 5))
+    # stream 模式下每次 XREADGROUP 读取的条目数
+    TASK_QUEUE_BATCH_SIZE = int(os.getenv("TASK_QUEUE_BATCH_SIZE", 1))
+    # stream 模式下任务流的最大长度（近似裁剪）
+    TASK_STREAM_MAXLEN = int(os.getenv("TASK_STREAM_MAXLEN", 100000))
+    # 任务取出后允许未确认的最长时间（秒），超时且任务锁已释放时放回队列
+    TASK_ACK_TIMEOUT = int(os.getenv("TASK_ACK_TIMEOUT", 600))
+    # 回收超时任务的间隔（秒）
+    TASK_REAP_INTERVAL = int(os.getenv("TASK_REAP_INTERVAL", 30))
+    # 检查延迟重试队列的间隔（秒）
+    TASK_PROMOTE_INTERVAL = float(os.getenv("TASK_PROMOTE_INTERVAL", 1))
+    # 每次最多移回任务队列的到期延迟任务数
+    TASK_PROMOTE_BATCH_SIZE = int(os.getenv("TASK_PROMOTE_BATCH_SIZE", 100))
+    # fair 模式下每个用户每轮可取的任务数（权重），未单独配置的用户使用默认值
+    FAIR_QUEUE_DEFAULT_WEIGHT = int(os.getenv("FAIR_QUEUE_DEFAULT_WEIGHT", 1))
+    # fair 模式下单独配置的用户权重，格式 uid1:3,uid2:5
+    FAIR_QUEUE_WEIGHTS = os.getenv("FAIR_QUEUE_WEIGHTS", "")
+    # fair 模式下每个用户每分钟的 Gemini token 上限，超出后本分钟不再取该用户的任务，0 为不限
+    FAIR_QUEUE_UID_TPM = int(os.getenv("FAIR_QUEUE_UID_TPM", 0))
+    # fair 模式下单独配置的用户 token 上限，格式 uid1:1000000,uid2:500000
+    FAIR_QUEUE_UID_CAPS = os.getenv("FAIR_QUEUE_UID_CAPS", "")
+    # priority 模式下 normal、low 任务相对 high 任务的等待偏移（秒），早投递超过偏移的低优先级任务先取出
+    PRIORITY_AGING_NORMAL = int(os.getenv("PRIORITY_AGING_NORMAL", 300))
+    PRIORITY_AGING_LOW = int(os.getenv("PRIORITY_AGING_LOW", 1800))
+    # priority 模式下交互（high）任务排队等待的目标（秒），超过时减半同时处理的批量（low）任务上限
+    PRIORITY_INTERACTIVE_TARGET_WAIT = int(os.getenv("PRIORITY_INTERACTIVE_TARGET_WAIT", 30))
+    # priority 模式下所有消费者同时处理的批量任务上限，及其自适应调整的间隔（秒）
+    PRIORITY_BULK_MAX_INFLIGHT = int(os.getenv("PRIORITY_BULK_MAX_INFLIGHT", 64))
+    PRIORITY_THROTTLE_INTERVAL = float(os.getenv("PRIORITY_THROTTLE_INTERVAL", 5))
+
+    # 标签结果缓存配置
+    # 是否按视频内容哈希缓存各维度的标签结果
+    TAG_CACHE_ENABLED = os.getenv("TAG_CACHE_ENABLED", "true").lower() == "true"
+    # 缓存有效期（秒）
+    TAG_CACHE_TTL = int(os.getenv("TAG_CACHE_TTL", 30 * 24 * 3600))
+
+    # 在途任务合并配置
+    # 是否合并同一视频（规范化 URL 或内容哈希相同）的在途任务，只处理一次
+    SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    # 跟随任务集合的有效期（秒），需长于任务回收时间
+    SINGLE_FLIGHT_FOLLOWER_TTL = int(os.getenv("SINGLE_FLIGHT_FOLLOWER_TTL", 3600))
+
+    # 谷歌文件复用配置
+    # 是否按视频内容哈希复用已上传的谷歌文件（重试与重复提交无需重新上传）
+    FILE_CACHE_ENABLED = os.getenv("FILE_CACHE_ENABLED", "true").lower() == "true"
+    # 引用计数归零后保留的时间（秒），期间的重试可继续复用，超时后由后台清理删除
+    FILE_CACHE_IDLE_TTL = int(os.getenv("FILE_CACHE_IDLE_TTL", 1800))
+    # 距离过期不足该时间（秒）的文件不再复用
+    FILE_CACHE_EXPIRY_MARGIN = int(os.getenv("FILE_CACHE_EXPIRY_MARGIN", 3600))
+
+    # 上下文缓存配置
+    # 是否为每个任务创建包含视频的上下文缓存，各维度基于该缓存生成（有效期与任务锁租约一致）
+    CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "false").lower() == "true"
+    # 待生成维度数达到该值时才创建缓存
+    CONTEXT_CACHE_MIN_DIMENSIONS = int(os.getenv("CONTEXT_CACHE_MIN_DIMENSIONS", 2))
+
 settings = Settings()
\ No newline at end of file
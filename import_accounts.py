@@ -0,0 +1,19 @@
+import argparse
+from app.services.account_pool import AccountPool
+
+
+def main():
+    """从 JSON 文件批量导入 Google 账号到 Redis 账号池"""
+    parser = argparse.ArgumentParser(description="导入 Google 账号")
+    parser.add_argument("--file", help="账号 JSON 文件路径，默认使用 API_KEYS_FILE")
+    args = parser.parse_args()
+
+    pool = AccountPool()
+    imported = pool.import_accounts(args.file)
+    print(f"成功导入 {imported} 个账号")
+    for account in pool.stats():
+        print(account)
+
+
+if __name__ == "__main__":
+    main()
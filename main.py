@@ -2,6 +2,7 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse
 from app.routers import video
 from app.routers import tasks
+from app.routers import metrics
 from app.services.logger import get_logger
 from config import Settings
 
@@ -13,6 +14,7 @@ app = FastAPI(
 
 app.include_router(video.router, prefix="/api/v1")
 app.include_router(tasks.router, prefix="/api/v1")
+app.include_router(metrics.router, prefix="/api/v1")
 
 # 自定义异常处理器
 @app.exception_handler(Exception)
@@ -0,0 +1,3 @@
+-- 任务优先级：high-交互，normal-普通，low-批量
+ALTER TABLE `video_tasks`
+  ADD COLUMN `priority` varchar(10) NOT NULL DEFAULT 'normal' COMMENT '优先级 high:交互, normal:普通, low:批量' AFTER `dimensions`;
@@ -6,6 +6,7 @@ CREATE TABLE `video_tasks` (
   `platform` varchar(20) NOT NULL DEFAULT '' COMMENT '平台-rpa,miaobi',
   `status` varchar(20) NOT NULL DEFAULT 'pending' COMMENT '任务状态 pending:待处理, processing:处理中, completed:已完成, failed:失败',
   `dimensions` varchar(30) NOT NULL DEFAULT 'all' COMMENT '提取维度all-全部， vision-视觉，audio-音频，content-内容语义，business-商业价值',
+  `priority` varchar(10) NOT NULL DEFAULT 'normal' COMMENT '优先级 high:交互, normal:普通, low:批量',
   `message` json DEFAULT NULL COMMENT '附加信息',
   `tags` json DEFAULT NULL COMMENT '视频标签',
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
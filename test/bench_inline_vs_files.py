@@ -0,0 +1,93 @@
+"""
+随请求发送视频（inline）与 Files API 上传两种方式的端到端耗时对比，用于确定 INLINE_VIDEO_MAX_MB
+
+用法（需与服务相同的 .env：API_KEY、Redis 等）：
+    python -m test.bench_inline_vs_files --videos a.mp4 b.mp4 c.mp4 --dims vision audio --repeat 3
+
+每个视频分别按两种方式完整处理 --dims 中的维度：
+- files：上传 + 等待激活 + 逐维度生成 + 删除远端文件
+- inline：读取文件 + 逐维度生成（各维度复用同一份数据）
+输出每个视频两种方式的耗时中位数，以及 inline 不再更快的最小文件大小（交叉点）。
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.google_vision import AsyncGoogleVisionService  # noqa: E402
+from app.services.video_service import VideoService  # noqa: E402
+
+
+async def run_files(service: AsyncGoogleVisionService, video_path: str, dims: list) -> float:
+    """Files API：上传、激活、生成、删除"""
+    start = time.time()
+    google_file = await service.upload_file(video_path)
+    try:
+        for dim in dims:
+            await service.generate_tag(google_file, dim, stream=False)
+    finally:
+        await service.delete_google_file(google_file=google_file)
+    return time.time() - start
+
+
+async def run_inline(service: AsyncGoogleVisionService, video_path: str, dims: list) -> float:
+    """随请求发送：读取一次，各维度复用"""
+    start = time.time()
+    video_part = service.load_inline_video(video_path)
+    for dim in dims:
+        await service.generate_tag(video_part, dim, stream=False)
+    return time.time() - start
+
+
+async def bench(videos: list, dims: list, repeat: int):
+    service = AsyncGoogleVisionService()
+    rows = []
+    for video_path in sorted(videos, key=os.path.getsize):
+        size_mb = os.path.getsize(video_path) / (1024 * 1024)
+        if size_mb > service.INLINE_REQUEST_LIMIT_MB:
+            print(f"跳过 {video_path}: {size_mb:.1f}MB 超过随请求发送的上限 {service.INLINE_REQUEST_LIMIT_MB}MB")
+            continue
+        files_times, inline_times = [], []
+        for _ in range(repeat):
+            # 交替执行，减少网络波动对某一种方式的影响
+            files_times.append(await run_files(service, video_path, dims))
+            inline_times.append(await run_inline(service, video_path, dims))
+        rows.append({
+            "video": os.path.basename(video_path),
+            "size_mb": size_mb,
+            "duration": VideoService.get_video_duration(video_path),
+            "files": statistics.median(files_times),
+            "inline": statistics.median(inline_times),
+        })
+
+    print(f"\n维度: {dims}, 每种方式重复 {repeat} 次，取中位数（秒）")
+    print(f"{'视频':<30}{'大小MB':>8}{'时长s':>8}{'files':>10}{'inline':>10}{'差值':>10}")
+    for row in rows:
+        duration = f"{row['duration']:.1f}" if row["duration"] else "-"
+        print(
+            f"{row['video']:<30}{row['size_mb']:>8.1f}{duration:>8}"
+            f"{row['files']:>10.2f}{row['inline']:>10.2f}{row['files'] - row['inline']:>10.2f}"
+        )
+
+    slower = [row for row in rows if row["inline"] >= row["files"]]
+    if slower:
+        print(f"\n交叉点：从 {slower[0]['size_mb']:.1f}MB 起 inline 不再更快，INLINE_VIDEO_MAX_MB 建议设为其以下")
+    elif rows:
+        print(f"\n所有样本（最大 {rows[-1]['size_mb']:.1f}MB）inline 都更快，可加入更大的样本继续测试")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="inline 与 Files API 耗时对比")
+    parser.add_argument("--videos", nargs="+", required=True, help="测试视频路径，建议覆盖 1MB~18MB 的不同大小")
+    parser.add_argument("--dims", nargs="+", default=["vision"], help="每次处理的维度")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式重复次数")
+    args = parser.parse_args()
+    asyncio.run(bench(args.videos, args.dims, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+限流器开启与关闭租约时的 Redis 操作数与预占耗时对比，用于确定 RATE_LIMIT_LEASE_* 配置
+
+用法（需与服务相同的 .env：Redis 等）：
+    python -m test.bench_rate_limiter_lease --processes 16 --calls 500 --mode gcra
+
+每轮启动 --processes 个进程（模拟消费者），各自对同一个临时限流范围执行 --calls 次
+acquire + settle，token 数在 --tokens 范围内随机，实际用量在估算值 ±20% 内浮动。
+输出每轮的 Redis 命令数/秒（INFO stats 的 total_commands_processed 差值，含指标写入）、
+每次调用的 Redis 命令数、预占耗时 p50/p99，以及放行量与全局上限的对比。
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import statistics
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def worker(scope: str, lease: bool, env: dict, calls: int, token_range: tuple, queue):
+    """子进程：按本轮配置导入限流器并执行 calls 次预占与结算"""
+    os.environ.update(env)
+    os.environ["RATE_LIMIT_LEASE_ENABLED"] = "true" if lease else "false"
+    from app.services.rate_limiter import RateLimiter
+
+    limiter = RateLimiter(scope)
+    latencies = []
+    tokens_admitted = 0
+    for _ in range(calls):
+        tokens = random.randint(*token_range)
+        start = time.perf_counter()
+        while True:
+            ok, window, retry_after = limiter.try_acquire(tokens)
+            if ok:
+                break
+            time.sleep(retry_after)
+        latencies.append(time.perf_counter() - start)
+        actual = int(tokens * random.uniform(0.8, 1.2))
+        limiter.settle(window, tokens, actual)
+        tokens_admitted += actual
+    limiter.release_lease()
+    queue.put((latencies, tokens_admitted))
+
+
+def run(lease: bool, args) -> dict:
+    from app.db.redis_decorators import get_redis_client
+
+    env = {"RATE_LIMIT_MODE": args.mode}
+    if args.rpm:
+        env["RATE_LIMIT_RPM"] = str(args.rpm)
+    if args.tpm:
+        env["RATE_LIMIT_TPM"] = str(args.tpm)
+    scope = f"bench:{uuid.uuid4().hex[:8]}"
+    redis = get_redis_client()
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(scope, lease, env, args.calls, tuple(args.tokens), queue))
+        for _ in range(args.processes)
+    ]
+
+    commands_before = int(redis.info("stats")["total_commands_processed"])
+    start = time.time()
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.time() - start
+    commands = int(redis.info("stats")["total_commands_processed"]) - commands_before
+
+    keys = redis.keys(f"rate_limiter:{scope}:*")
+    if keys:
+        redis.delete(*keys)
+    latencies = sorted(latency for result, _ in results for latency in result)
+    total_calls = len(latencies)
+    return {
+        "lease": lease,
+        "elapsed": elapsed,
+        "ops_per_second": commands / elapsed,
+        "ops_per_call": commands / total_calls,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(int(total_calls * 0.99), total_calls - 1)] * 1000,
+        "requests": total_calls,
+        "tokens": sum(tokens for _, tokens in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="限流器租约开启/关闭对比")
+    parser.add_argument("--processes", type=int, default=16, help="并发进程数（消费者数）")
+    parser.add_argument("--calls", type=int, default=500, help="每个进程的调用次数")
+    parser.add_argument("--tokens", type=int, nargs=2, default=[2000, 30000], help="每次调用估算 token 数的范围")
+    parser.add_argument("--mode", default="gcra", choices=["gcra", "window"], help="限流算法")
+    parser.add_argument("--rpm", type=int, default=0, help="每分钟请求数上限，默认取 .env")
+    parser.add_argument("--tpm", type=int, default=0, help="每分钟 token 数上限，默认取 .env")
+    args = parser.parse_args()
+
+    from config import Settings
+    rpm = args.rpm or Settings.RATE_LIMIT_RPM
+    tpm = args.tpm or Settings.RATE_LIMIT_TPM
+
+    rows = [run(False, args), run(True, args)]
+    print(f"\n{args.processes} 进程 × {args.calls} 次调用，mode={args.mode}，RPM={rpm}，TPM={tpm}")
+    print(f"{'租约':<6}{'耗时s':>8}{'Redis ops/s':>14}{'ops/调用':>10}{'p50 ms':>10}{'p99 ms':>10}{'请求/分':>10}{'token/分':>12}")
+    for row in rows:
+        minutes = row["elapsed"] / 60
+        print(
+            f"{'开' if row['lease'] else '关':<6}{row['elapsed']:>8.1f}{row['ops_per_second']:>14.0f}"
+            f"{row['ops_per_call']:>10.2f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+            f"{row['requests'] / minutes:>10.0f}{row['tokens'] / minutes:>12.0f}"
+        )
+    print("\n耗时不足 1 分钟时请求/分与 token/分含突发容量，持续压测（加大 --calls）时应不超过上限")
+
+
+if __name__ == "__main__":
+    main()
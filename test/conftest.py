@@ -0,0 +1,15 @@
+"""
+单元测试公共配置：项目根目录加入导入路径，未配置 .env 时以 .env.example 的取值补齐环境变量，保证 config.Settings 可以导入
+用法：
+    python -m pytest -q test
+"""
+import os
+import sys
+
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+load_dotenv(os.path.join(ROOT, ".env"))
+load_dotenv(os.path.join(ROOT, ".env.example"))
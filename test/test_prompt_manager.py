@@ -0,0 +1,24 @@
+import pytest
+
+from config import Settings
+from app.prompts.prompt_manager import prompt_manager
+
+
+@pytest.mark.parametrize("dimension", Settings.VIDEO_DIMENSIONS)
+def test_prompt_version_for_every_dimension(dimension):
+    """每个维度都能取得提示词版本，且与输出结构一起按文件修改时间缓存"""
+    version = prompt_manager.get_prompt_version(dimension)
+    assert len(version) == 12
+    assert prompt_manager.get_prompt_version(dimension) == version
+
+
+@pytest.mark.parametrize("dimension", Settings.VIDEO_DIMENSIONS)
+def test_response_schema_accepts_dimension_name(dimension):
+    """公开的 get_response_schema 仍按维度名解析模板"""
+    schema = prompt_manager.get_response_schema(dimension)
+    assert schema is None or "schema" in schema
+
+
+def test_prompt_version_rejects_unknown_dimension():
+    with pytest.raises(Exception, match="提示词非法"):
+        prompt_manager.get_prompt_version("unknown")
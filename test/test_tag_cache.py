@@ -0,0 +1,57 @@
+import pytest
+
+from config import Settings
+from app.prompts.prompt_manager import prompt_manager
+from app.services.metrics import metrics
+from app.services.tag_cache import TagResultCache
+
+
+class MemoryRedis:
+    """测试用的内存 Redis，只实现缓存与计数器用到的命令"""
+
+    def __init__(self):
+        self.values = {}
+        self.hashes = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def hincrby(self, key, field, amount=1):
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = int(fields.get(field, 0)) + amount
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    redis = MemoryRedis()
+    monkeypatch.setattr(metrics, "redis", redis)
+    monkeypatch.setattr(Settings, "TAG_CACHE_ENABLED", True)
+    tag_cache = TagResultCache()
+    tag_cache.redis = redis
+    return tag_cache
+
+
+@pytest.mark.parametrize("dimension", Settings.VIDEO_DIMENSIONS)
+def test_set_then_get_round_trip(cache, dimension):
+    tags = {"tags": ["猫", "室内"]}
+    assert cache.get("abc", dimension) is None
+    cache.set("abc", dimension, tags)
+    assert cache.get("abc", dimension) == tags
+    report = TagResultCache.report()[dimension]
+    assert (report["hits"], report["misses"], report["errors"]) == (1, 1, 0)
+
+
+def test_key_error_is_counted(cache, monkeypatch):
+    def broken(dimension):
+        raise Exception("提示词非法")
+
+    monkeypatch.setattr(prompt_manager, "get_prompt_version", broken)
+    cache.set("abc", "vision", {"tags": []})
+    assert cache.get("abc", "vision") is None
+    assert TagResultCache.report()["vision"]["errors"] == 2